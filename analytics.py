@@ -0,0 +1,269 @@
+from datetime import date, timedelta
+from typing import Optional
+
+from database import REPAIR_TYPES, cached, get_connection
+
+PERIODS = ("month", "quarter", "year")
+TOP_INSTRUMENTS = 20
+
+_REPAIR = "(m.maintenance_type IN (" + ", ".join(f"'{kind}'" for kind in REPAIR_TYPES) + "))"
+
+
+# A date range is answered from the rollup tables for every whole bucket
+# (month or year) inside it, and from the maintenance rows themselves only
+# for what is left of the partial buckets at either end.
+def _month_start(day: date):
+    return day.replace(day=1)
+
+
+def _next_month(day: date):
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _year_start(day: date):
+    return day.replace(month=1, day=1)
+
+
+def _next_year(day: date):
+    return day.replace(year=day.year + 1, month=1, day=1)
+
+
+def _split(start: Optional[date], end: Optional[date], floor, step):
+    # start is inclusive and end exclusive; None is open. Returns the first
+    # and last-plus-one whole bucket (as dates, None when open, or no pair
+    # when there is no whole bucket) and the partial buckets left over.
+    first = start if start is None or floor(start) == start else step(start)
+    last = end if end is None else floor(end)
+    if first is not None and last is not None and first > last:
+        return None, [(start, end)]
+    tails = []
+    if start is not None and start < first:
+        tails.append((start, first))
+    if end is not None and last < end:
+        tails.append((last, end))
+    if first is not None and first == last:
+        return None, tails
+    return (first, last), tails
+
+
+def _plan(start, end, floor, step, rollups: bool):
+    # (sign, from rollup?, from, to) parts that add up to [start, end). A
+    # partial bucket that is mostly covered is read as the whole bucket minus
+    # the raw rows of the part outside the range, which is the smaller read.
+    if not rollups:
+        return [(1, False, start, end)]
+    buckets, tails = _split(start, end, floor, step)
+    parts = [(1, True, *buckets)] if buckets else []
+    for lo, hi in tails:
+        first, last = floor(lo), step(floor(lo))
+        if (hi - lo) * 2 <= last - first:
+            parts.append((1, False, lo, hi))
+            continue
+        parts.append((1, True, first, last))
+        if first < lo:
+            parts.append((-1, False, first, lo))
+        if hi < last:
+            parts.append((-1, False, hi, last))
+    return parts
+
+
+def _range(start: Optional[str], end: Optional[str]):
+    # Public functions take ISO dates, both ends inclusive.
+    lo = date.fromisoformat(start) if start else None
+    hi = date.fromisoformat(end) + timedelta(days=1) if end else None
+    if lo is not None and hi is not None and hi <= lo:
+        raise ValueError(f"Ugyldig periode: {start} til {end}")
+    return lo, hi
+
+
+def _between(column: str, lo, hi, fmt):
+    conditions, params = [], []
+    if lo is not None:
+        conditions.append(f"{column} >= ?")
+        params.append(fmt(lo))
+    if hi is not None:
+        conditions.append(f"{column} < ?")
+        params.append(fmt(hi))
+    return " AND ".join(conditions) or "1", params
+
+
+def _tuples(conn, sql: str, params=()):
+    # Plain tuples: these results are summed, not handed out as rows.
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return cursor.execute(sql, params).fetchall()
+
+
+def _rolled_up(conn, table: str, column: str, fmt, key: str, sums: str, start, end, floor, step, tail_key: str,
+               tail_sums: str, where: str = "1", params=(), rollups: bool = True):
+    # Sums per key over [start, end), from the rollup table where whole
+    # buckets allow and from maintenance for the rest. Returns
+    # {key: [count, total, ...]}.
+    totals = {}
+    for sign, rolled, lo, hi in _plan(start, end, floor, step, rollups):
+        if rolled:
+            condition, bounds = _between(column, lo, hi, fmt)
+            sql = f"SELECT {key}, {sums} FROM {table} WHERE {condition} AND {where} GROUP BY 1"
+        else:
+            condition, bounds = _between("m.date", lo, hi, date.isoformat)
+            # The planner tends to prefer walking every instrument's history
+            # for the GROUP BY; a date range is always cheaper.
+            sql = (f"SELECT {tail_key}, {tail_sums} FROM maintenance m INDEXED BY idx_maintenance_date "
+                   f"WHERE {condition} AND {where} GROUP BY 1")
+        for row in _tuples(conn, sql, (*bounds, *params)):
+            values = totals.setdefault(row[0], [0] * (len(row) - 1))
+            for i, value in enumerate(row[1:]):
+                values[i] += sign * (value or 0)
+    return totals
+
+
+def _monthly(conn, start, end, key: str, tail_key: str, maintenance_type: Optional[str], rollups: bool):
+    where, params = ("maintenance_type = ?", (maintenance_type,)) if maintenance_type else ("1", ())
+    return _rolled_up(
+        conn, "maintenance_monthly", "month", lambda day: day.isoformat()[:7], key, "SUM(count), SUM(total)",
+        start, end, _month_start, _next_month, tail_key, "COUNT(*), SUM(coalesce(m.cost, 0))", where, params,
+        rollups
+    )
+
+
+def _yearly(conn, start, end, rollups: bool):
+    return _rolled_up(
+        conn, "maintenance_yearly", "year", lambda day: str(day.year), "instrument_id",
+        "SUM(count), SUM(total), SUM(repairs)", start, end, _year_start, _next_year, "m.instrument_id",
+        f"COUNT(*), SUM(coalesce(m.cost, 0)), SUM({_REPAIR})", rollups=rollups
+    )
+
+
+def period_of(month: str, period: str):
+    if period == "year":
+        return month[:4]
+    if period == "quarter":
+        return f"{month[:4]}-K{(int(month[5:7]) - 1) // 3 + 1}"
+    return month
+
+
+def slope(values):
+    # Least-squares change per step, for the trend of a series.
+    n = len(values)
+    if n < 2:
+        return 0.0
+    mean_x, mean_y = (n - 1) / 2, sum(values) / n
+    spread = sum((x - mean_x) ** 2 for x in range(n))
+    return sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values)) / spread
+
+
+def _operating_days(purchase_date: Optional[str], start: Optional[date], end: date, first: Optional[date]):
+    # Days an instrument was in service within the range: from purchase (or
+    # the start of the range, or the first record) to the end of the range.
+    begin = start or first
+    try:
+        purchased = date.fromisoformat(purchase_date or "")
+    except ValueError:
+        purchased = None
+    if purchased and (begin is None or purchased > begin):
+        begin = purchased
+    return max(0, (end - begin).days) if begin else 0
+
+
+def _with_mtbr(row):
+    # Mean time between repairs: days in service per repair.
+    row["mtbr_days"] = round(row["days"] / row["repairs"], 1) if row["repairs"] else None
+    return row
+
+
+def _instrument_rows(start: Optional[str], end: Optional[str], rollups: bool):
+    # One row per instrument, also those without maintenance in the range:
+    # their days in service still count towards the fleet's MTBR.
+    lo, hi = _range(start, end)
+    with get_connection() as conn:
+        totals = _yearly(conn, lo, hi, rollups)
+        instruments = _tuples(conn, "SELECT id, name, type, manufacturer, purchase_date FROM instruments")
+        first = conn.execute("SELECT MIN(month) FROM maintenance_monthly WHERE count > 0").fetchone()[0]
+    first = date.fromisoformat(f"{first}-01") if first else None
+    tomorrow = date.today() + timedelta(days=1)
+    until = min(hi, tomorrow) if hi else tomorrow
+    rows = []
+    for instrument_id, name, instrument_type, manufacturer, purchase_date in instruments:
+        count, total, repairs = totals.get(instrument_id, (0, 0, 0))
+        rows.append(_with_mtbr({
+            "key": instrument_id,
+            "name": name,
+            "type": instrument_type,
+            "manufacturer": manufacturer or "",
+            "count": count,
+            "total": round(total, 2),
+            "repairs": repairs,
+            "days": _operating_days(purchase_date, lo, until, first),
+        }))
+    return rows
+
+
+def _by_manufacturer(rows):
+    groups = {}
+    for row in rows:
+        group = groups.setdefault(row["manufacturer"], {
+            "key": row["manufacturer"], "count": 0, "total": 0, "repairs": 0, "days": 0, "instruments": 0
+        })
+        for field in ("count", "total", "repairs", "days"):
+            group[field] += row[field]
+        group["instruments"] += 1
+    groups = [_with_mtbr(dict(group, total=round(group["total"], 2))) for group in groups.values() if group["count"]]
+    return sorted(groups, key=lambda row: -row["total"])
+
+
+class AnalyticsRepository:
+    @staticmethod
+    @cached("maintenance")
+    def by_type(start: Optional[str] = None, end: Optional[str] = None, rollups: bool = True):
+        lo, hi = _range(start, end)
+        with get_connection() as conn:
+            totals = _monthly(conn, lo, hi, "maintenance_type", "m.maintenance_type", None, rollups)
+        rows = [{"key": key, "count": count, "total": round(total, 2)} for key, (count, total) in totals.items() if count]
+        return sorted(rows, key=lambda row: -row["total"])
+
+    @staticmethod
+    @cached("maintenance")
+    def over_time(period: str = "month", start: Optional[str] = None, end: Optional[str] = None,
+                  maintenance_type: Optional[str] = None, rollups: bool = True):
+        if period not in PERIODS:
+            raise ValueError(f"Ukjent periode: {period}")
+        lo, hi = _range(start, end)
+        with get_connection() as conn:
+            totals = _monthly(conn, lo, hi, "month", "substr(m.date, 1, 7)", maintenance_type, rollups)
+        series = {}
+        for month, (count, total) in sorted(totals.items()):
+            if count:
+                values = series.setdefault(period_of(month, period), [0, 0])
+                values[0] += count
+                values[1] += total
+        return [{"period": key, "count": count, "total": round(total, 2)} for key, (count, total) in series.items()]
+
+    @staticmethod
+    @cached("maintenance", "instruments")
+    def by_instrument(start: Optional[str] = None, end: Optional[str] = None, rollups: bool = True):
+        rows = [row for row in _instrument_rows(start, end, rollups) if row["count"]]
+        return sorted(rows, key=lambda row: -row["total"])
+
+    @staticmethod
+    @cached("maintenance", "instruments")
+    def by_manufacturer(start: Optional[str] = None, end: Optional[str] = None, rollups: bool = True):
+        return _by_manufacturer(_instrument_rows(start, end, rollups))
+
+    @staticmethod
+    @cached("maintenance", "instruments")
+    def overview(start: Optional[str] = None, end: Optional[str] = None, period: str = "month"):
+        # Everything the Analyse view shows, in one call.
+        series = AnalyticsRepository.over_time(period, start, end)
+        rows = _instrument_rows(start, end, True)
+        instruments = sorted((row for row in rows if row["count"]), key=lambda row: -row["total"])
+        manufacturers = _by_manufacturer(rows)
+        fleet = _with_mtbr({field: sum(row[field] for row in rows) for field in ("count", "total", "repairs", "days")})
+        fleet["total"] = round(fleet["total"], 2)
+        return {
+            "series": series,
+            "trend": slope([row["total"] for row in series]),
+            "by_type": AnalyticsRepository.by_type(start, end),
+            "by_manufacturer": manufacturers,
+            "top_instruments": instruments[:TOP_INSTRUMENTS],
+            "fleet": fleet,
+        }
@@ -1,34 +1,127 @@
+import time
+from datetime import date
+
 import customtkinter as ctk
-from tkinter import filedialog
-from database import init_db, InstrumentRepository, ColumnRepository, MaintenanceRepository, export_all_to_csv, import_all_from_csv
+from database import (init_db, external_change_count, InstrumentRepository, ColumnRepository, MaintenanceRepository,
+                      ChangeRepository, PlanRepository, AuditRepository, SearchRepository, parse_date)
+from instrumentation import ViewTiming
+from views import (View, DashboardView, InstrumentListView, InstrumentDetailView, ColumnsView, SearchView,
+                   AnalysisView, DueView, DiagnosticsView)
+from worker import DatabaseWorker
 
-ctk.set_appearance_mode("dark")
-ctk.set_default_color_theme("blue")
+SEARCH_DELAY_MS = 200
+WATCH_INTERVAL_MS = 1000
+# Backups start this long after the window opens, so startup has the disk
+# to itself.
+BACKUP_DELAY_MS = 60000
+INSTRUMENT_TYPES = ["LC", "GC", "GPC"]
+MAINTENANCE_TYPES = ["Preventive", "Repair", "Calibration", "Other"]
+HISTORY_OPS = {"insert": "opprettet", "update": "endret", "delete": "slettet"}
 
 
 class InstrumentApp(ctk.CTk):
-    def __init__(self):
+    def __init__(self, client=None):
+        # client is a client.RemoteClient already install()ed, or None to use
+        # the database file directly.
+        ctk.set_appearance_mode("dark")
+        ctk.set_default_color_theme("blue")
         super().__init__()
         
-        init_db()
-        
-        self.title("Instrumentoversikt")
+        self.client = client
+        self.title(f"Instrumentoversikt - {client.url}" if client else "Instrumentoversikt")
         self.geometry("1000x800")
         self.minsize(900, 700)
         
+        self.views = {}
         self.current_view = None
+        self.startup_marks = {}
+        self.first_view = None
         self.current_instrument_id = None
+        self.search_after_id = None
+        self.seen_data_version = None
+        self.backups = None
+        self.worker = DatabaseWorker(self, interruptible=client is None)
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.bind_all("<Control-Shift-D>", lambda event: self.show_diagnostics())
         
         self.grid_columnconfigure(1, weight=1)
         self.grid_rowconfigure(0, weight=1)
         
         self.create_sidebar()
-        self.show_dashboard()
+        self.set_sidebar_state("disabled")
+        self.startup_label = ctk.CTkLabel(self, text="Starter...", text_color="gray60")
+        self.startup_label.grid(row=0, column=1)
+        self.current_view = self.startup_label
+        self.startup_marks["window"] = time.perf_counter()
+        # Let Tk draw the window shell before the database is touched.
+        self.after_idle(self.start)
+        
+    def start(self):
+        self.startup_marks["first paint"] = time.perf_counter()
+        if self.client:
+            self.worker.read(
+                self.client.health,
+                on_done=self.on_ready,
+                on_error=lambda e: self.show_error("Fant ikke serveren!", str(e))
+            )
+            return
+        self.worker.write(
+            init_db,
+            on_done=self.on_ready,
+            on_error=lambda e: self.show_error("Kunne ikke åpne databasen!", str(e))
+        )
+        
+    def on_ready(self, _):
+        self.startup_marks["schema"] = time.perf_counter()
+        self.set_sidebar_state("normal")
+        if self.client:
+            # Export, import and backups work on the database file, which
+            # only the server has.
+            self.export_button.configure(state="disabled")
+            self.import_button.configure(state="disabled")
+            self.backup_button.configure(state="disabled")
+        self.first_view = self.show_dashboard()
+        self.watch_changes()
+        if not self.client:
+            # The server trims the change log and catches the search index up
+            # itself when it starts.
+            self.worker.write(ChangeRepository.compact)
+            self.worker.write(SearchRepository.catch_up)
+            self.after(BACKUP_DELAY_MS, self.start_backups)
+        
+    def watch_changes(self):
+        # Polls for commits made by others (other processes, or other clients
+        # of the server) and refreshes the visible view only when there was
+        # one. Our own writes refresh views where they are made.
+        def changed(version):
+            if self.seen_data_version is not None and version != self.seen_data_version:
+                if isinstance(self.current_view, View):
+                    self.current_view.refresh()
+            self.seen_data_version = version
+            self.after(WATCH_INTERVAL_MS, self.watch_changes)
+            
+        self.worker.read(
+            self.client.data_version if self.client else external_change_count,
+            channel="watch",
+            on_done=changed,
+            on_error=lambda e: self.after(WATCH_INTERVAL_MS, self.watch_changes)
+        )
+        
+    def set_sidebar_state(self, state: str):
+        for child in self.sidebar.winfo_children():
+            if isinstance(child, (ctk.CTkButton, ctk.CTkEntry)):
+                child.configure(state=state)
+        
+    def on_close(self):
+        if self.backups is not None:
+            self.backups.stop()
+        self.worker.shutdown()
+        self.destroy()
         
     def create_sidebar(self):
         self.sidebar = ctk.CTkFrame(self, width=200, corner_radius=0)
         self.sidebar.grid(row=0, column=0, sticky="nsew")
-        self.sidebar.grid_rowconfigure(7, weight=1)
+        self.sidebar.grid_rowconfigure(9, weight=1)
         
         self.logo_label = ctk.CTkLabel(
             self.sidebar, 
@@ -45,6 +138,8 @@ class InstrumentApp(ctk.CTk):
             ("GC Instrumenter", lambda: self.show_instrument_list("GC")),
             ("GPC Instrumenter", lambda: self.show_instrument_list("GPC")),
             ("Alle Kolonner", self.show_columns),
+            ("Forfall", self.show_due),
+            ("Analyse", self.show_analysis),
         ]
         
         for i, (text, command) in enumerate(nav_items, start=1):
@@ -59,159 +154,90 @@ class InstrumentApp(ctk.CTk):
             btn.grid(row=i, column=0, padx=20, pady=5, sticky="ew")
             self.nav_buttons.append(btn)
         
-        ctk.CTkLabel(self.sidebar, text="Data", font=ctk.CTkFont(weight="bold")).grid(row=7, column=0, padx=20, pady=(20, 5), sticky="w")
+        self.search_entry = ctk.CTkEntry(self.sidebar, placeholder_text="Søk...")
+        self.search_entry.grid(row=8, column=0, padx=20, pady=(15, 5), sticky="ew")
+        self.search_entry.bind("<KeyRelease>", self.schedule_search)
+        self.search_entry.bind("<Return>", lambda event: self.run_search())
+        
+        ctk.CTkLabel(self.sidebar, text="Data", font=ctk.CTkFont(weight="bold")).grid(row=9, column=0, padx=20, pady=(20, 5), sticky="w")
         
-        ctk.CTkButton(
+        self.export_button = ctk.CTkButton(
             self.sidebar,
             text="Eksporter",
             command=self.show_export,
             fg_color="transparent",
             text_color=("gray10", "gray90"),
             hover_color=("gray70", "gray30")
-        ).grid(row=8, column=0, padx=20, pady=5, sticky="ew")
+        )
+        self.export_button.grid(row=10, column=0, padx=20, pady=5, sticky="ew")
         
-        ctk.CTkButton(
+        self.import_button = ctk.CTkButton(
             self.sidebar,
             text="Importer",
             command=self.show_import,
             fg_color="transparent",
             text_color=("gray10", "gray90"),
             hover_color=("gray70", "gray30")
-        ).grid(row=9, column=0, padx=20, pady=5, sticky="ew")
+        )
+        self.import_button.grid(row=11, column=0, padx=20, pady=5, sticky="ew")
+        
+        self.backup_button = ctk.CTkButton(
+            self.sidebar,
+            text="Sikkerhetskopi",
+            command=self.backup_now,
+            fg_color="transparent",
+            text_color=("gray10", "gray90"),
+            hover_color=("gray70", "gray30")
+        )
+        self.backup_button.grid(row=12, column=0, padx=20, pady=5, sticky="ew")
         
         self.sidebar.grid_columnconfigure(0, weight=1)
         
-    def clear_content(self):
-        if self.current_view:
-            self.current_view.destroy()
+    def show_view(self, key, create):
+        # Views are created on first use and kept; switching only swaps
+        # which one is gridded.
+        view = self.views.get(key)
+        if view is None:
+            view = self.views[key] = create()
+        if view is not self.current_view:
+            if self.current_view is not None:
+                self.current_view.grid_remove()
+            view.grid(row=0, column=1, sticky="nsew", padx=20, pady=20)
+            self.current_view = view
+        return view
+        
+    def show_error(self, title: str, message: str):
+        dialog = ctk.CTkToplevel(self)
+        dialog.title("Feil")
+        dialog.geometry("300x150")
+        dialog.transient(self)
+        ctk.CTkLabel(dialog, text=title, text_color="red", font=ctk.CTkFont(size=16, weight="bold")).pack(pady=20)
+        ctk.CTkLabel(dialog, text=message, wraplength=260).pack(pady=10)
+        ctk.CTkButton(dialog, text="OK", command=dialog.destroy).pack(pady=10)
             
     def show_dashboard(self):
-        self.clear_content()
-        
-        self.current_view = ctk.CTkFrame(self, fg_color="transparent")
-        self.current_view.grid(row=0, column=1, sticky="nsew", padx=20, pady=20)
-        self.current_view.grid_rowconfigure(2, weight=1)
-        self.current_view.grid_columnconfigure(0, weight=1)
-        
-        title = ctk.CTkLabel(self.current_view, text="Dashboard", font=ctk.CTkFont(size=24, weight="bold"))
-        title.grid(row=0, column=0, pady=(0, 20), sticky="w")
-        
-        stats_frame = ctk.CTkFrame(self.current_view)
-        stats_frame.grid(row=1, column=0, pady=(0, 20), sticky="ew")
-        stats_frame.grid_columnconfigure((0, 1, 2), weight=1)
-        
-        instruments = InstrumentRepository.get_all()
-        
-        lc_count = len([i for i in instruments if i["type"] == "LC"])
-        gc_count = len([i for i in instruments if i["type"] == "GC"])
-        gpc_count = len([i for i in instruments if i["type"] == "GPC"])
-        
-        ctk.CTkLabel(stats_frame, text=f"LC: {lc_count}", font=ctk.CTkFont(size=16)).grid(row=0, column=0, padx=20, pady=20)
-        ctk.CTkLabel(stats_frame, text=f"GC: {gc_count}", font=ctk.CTkFont(size=16)).grid(row=0, column=1, padx=20, pady=20)
-        ctk.CTkLabel(stats_frame, text=f"GPC: {gpc_count}", font=ctk.CTkFont(size=16)).grid(row=0, column=2, padx=20, pady=20)
-        
-        recent_frame = ctk.CTkFrame(self.current_view)
-        recent_frame.grid(row=2, column=0, sticky="nsew")
-        recent_frame.grid_rowconfigure(1, weight=1)
-        recent_frame.grid_columnconfigure(0, weight=1)
-        
-        ctk.CTkLabel(recent_frame, text="Siste vedlikehold", font=ctk.CTkFont(size=18, weight="bold")).grid(
-            row=0, column=0, padx=20, pady=(10, 5), sticky="w"
-        )
-        
-        recent = MaintenanceRepository.get_recent(5)
+        self.current_instrument_id = None
+        timing = ViewTiming("dashboard")
+        self.show_view("dashboard", lambda: DashboardView(self)).refresh(timing)
+        timing.dispatch()
+        return timing
         
-        if recent:
-            cols = ["Dato", "Type", "Instrument", "Beskrivelse"]
-            tree = ctk.CTkScrollableFrame(recent_frame)
-            tree.grid(row=1, column=0, sticky="nsew", padx=10, pady=10)
-            
-            headers = ctk.CTkFrame(tree, fg_color="transparent")
-            headers.pack(fill="x")
-            for col in cols:
-                ctk.CTkLabel(headers, text=col, font=ctk.CTkFont(weight="bold")).pack(side="left", padx=10, pady=5)
-                
-            for record in recent:
-                row_frame = ctk.CTkFrame(tree, fg_color="transparent")
-                row_frame.pack(fill="x")
-                ctk.CTkLabel(row_frame, text=record["date"] or "-").pack(side="left", padx=10, pady=2)
-                ctk.CTkLabel(row_frame, text=record["maintenance_type"] or "-").pack(side="left", padx=10, pady=2)
-                ctk.CTkLabel(row_frame, text=record["instrument_name"] or "-").pack(side="left", padx=10, pady=2)
-                ctk.CTkLabel(row_frame, text=(record["description"] or "-")[:30]).pack(side="left", padx=10, pady=2)
-        else:
-            ctk.CTkLabel(recent_frame, text="Ingen vedlikehold registrert").grid(row=1, column=0, pady=20)
-            
     def show_instrument_list(self, instrument_type: str):
-        self.clear_content()
         self.current_instrument_id = None
-        
-        self.current_view = ctk.CTkFrame(self, fg_color="transparent")
-        self.current_view.grid(row=0, column=1, sticky="nsew", padx=20, pady=20)
-        self.current_view.grid_rowconfigure(2, weight=1)
-        self.current_view.grid_columnconfigure(0, weight=1)
-        
-        title = ctk.CTkLabel(
-            self.current_view, 
-            text=f"{instrument_type} Instrumenter", 
-            font=ctk.CTkFont(size=24, weight="bold")
-        )
-        title.grid(row=0, column=0, pady=(0, 10), sticky="w")
-        
-        btn_frame = ctk.CTkFrame(self.current_view, fg_color="transparent")
-        btn_frame.grid(row=1, column=0, pady=(0, 10), sticky="w")
-        
-        ctk.CTkButton(
-            btn_frame,
-            text="+ Legg til instrument",
-            command=lambda: self.show_add_instrument(instrument_type)
-        ).pack(side="left", padx=(0, 10))
-        
-        instruments = InstrumentRepository.get_all(instrument_type)
-        
-        if instruments:
-            list_frame = ctk.CTkScrollableFrame(self.current_view)
-            list_frame.grid(row=2, column=0, sticky="nsew")
-            
-            for inst in instruments:
-                item_frame = ctk.CTkFrame(list_frame)
-                item_frame.pack(fill="x", pady=5)
-                
-                info_frame = ctk.CTkFrame(item_frame, fg_color="transparent")
-                info_frame.pack(side="left", padx=10, pady=10)
-                
-                ctk.CTkLabel(
-                    info_frame,
-                    text=inst["name"],
-                    font=ctk.CTkFont(weight="bold")
-                ).pack(anchor="w")
-                ctk.CTkLabel(
-                    info_frame,
-                    text=f"Model: {inst['model'] or '-'} | Serienr: {inst['serial_number'] or '-'} | Kjøpt: {inst['purchase_date'] or '-'}"
-                ).pack(anchor="w")
-                
-                btn_frame_item = ctk.CTkFrame(item_frame, fg_color="transparent")
-                btn_frame_item.pack(side="right", padx=10, pady=10)
-                
-                ctk.CTkButton(
-                    btn_frame_item,
-                    text="Detaljer",
-                    width=80,
-                    command=lambda inst_id=inst["id"]: self.show_instrument_detail(inst_id)
-                ).pack(padx=2)
-                ctk.CTkButton(
-                    btn_frame_item,
-                    text="Slett",
-                    width=60,
-                    fg_color="#c42b1c",
-                    hover_color="#9f2318",
-                    command=lambda inst_id=inst["id"], inst_type=inst["type"]: self.delete_instrument(inst_id, inst_type)
-                ).pack(padx=2)
-        else:
-            ctk.CTkLabel(
-                self.current_view,
-                text=f"Ingen {instrument_type} instrumenter registrert"
-            ).grid(row=2, column=0)
-            
+        timing = ViewTiming(f"list:{instrument_type}")
+        self.show_view(("list", instrument_type), lambda: InstrumentListView(self, instrument_type)).refresh(timing)
+        timing.dispatch()
+        return timing
+        
+    def read_date(self, entry, form):
+        # The entry's date in ISO form (None if blank), or False after
+        # showing why it is not a date.
+        try:
+            return parse_date(entry.get())
+        except ValueError as e:
+            ctk.CTkLabel(form, text=str(e), text_color="red").pack()
+            return False
+
     def show_add_instrument(self, instrument_type: str):
         dialog = ctk.CTkToplevel(self)
         dialog.title(f"Legg til {instrument_type}")
@@ -241,7 +267,7 @@ class InstrumentApp(ctk.CTk):
                 entry.pack(fill="x", pady=(5, 10))
                 entries[key] = entry
             else:
-                entry = ctk.CTkEntry(form)
+                entry = ctk.CTkEntry(form, placeholder_text="ÅÅÅÅ-MM-DD" if key.endswith("_date") else "")
                 entry.pack(fill="x", pady=(5, 10))
                 entries[key] = entry
                 
@@ -250,162 +276,34 @@ class InstrumentApp(ctk.CTk):
             if not name:
                 ctk.CTkLabel(form, text="Navn er påkrevd", text_color="red").pack()
                 return
+            purchase_date = self.read_date(entries["purchase_date"], form)
+            if purchase_date is False:
+                return
                 
-            InstrumentRepository.create(
+            self.worker.write(
+                InstrumentRepository.create,
                 name=name,
                 instrument_type=instrument_type,
                 model=entries["model"].get().strip() or None,
                 manufacturer=entries["manufacturer"].get().strip() or None,
                 serial_number=entries["serial_number"].get().strip() or None,
-                purchase_date=entries["purchase_date"].get().strip() or None,
-                notes=entries["notes"].get("1.0", "end").strip() or None
+                purchase_date=purchase_date,
+                notes=entries["notes"].get("1.0", "end").strip() or None,
+                on_done=lambda _: self.show_instrument_list(instrument_type),
+                on_error=lambda e: self.show_error("Lagring feilet!", str(e))
             )
             dialog.destroy()
-            self.show_instrument_list(instrument_type)
             
         ctk.CTkButton(dialog, text="Lagre", command=save).pack(pady=10)
         ctk.CTkButton(dialog, text="Avbryt", command=dialog.destroy).pack(pady=5)
         
     def show_instrument_detail(self, instrument_id: int):
         self.current_instrument_id = instrument_id
-        instrument = InstrumentRepository.get_by_id(instrument_id)
-        
-        if not instrument:
-            return
-        
-        self.clear_content()
-        
-        self.current_view = ctk.CTkFrame(self, fg_color="transparent")
-        self.current_view.grid(row=0, column=1, sticky="nsew", padx=20, pady=20)
-        self.current_view.grid_rowconfigure(3, weight=1)
-        self.current_view.grid_columnconfigure(0, weight=1)
-        
-        header = ctk.CTkFrame(self.current_view, fg_color="transparent")
-        header.grid(row=0, column=0, sticky="ew", pady=(0, 10))
-        
-        ctk.CTkButton(
-            header,
-            text="← Tilbake",
-            command=lambda: self.show_instrument_list(instrument["type"]),
-            fg_color="transparent"
-        ).pack(side="left")
-        
-        title = ctk.CTkLabel(
-            header,
-            text=f"{instrument['name']} ({instrument['type']})",
-            font=ctk.CTkFont(size=24, weight="bold")
-        )
-        title.pack(side="left", padx=10)
-        
-        info_frame = ctk.CTkFrame(self.current_view)
-        info_frame.grid(row=1, column=0, sticky="ew", pady=(0, 10))
-        
-        info_items = [
-            ("Model", instrument["model"]),
-            ("Produsent", instrument["manufacturer"]),
-            ("Serienummer", instrument["serial_number"]),
-            ("Kjøpsdato", instrument["purchase_date"]),
-            ("Status", instrument["status"]),
-        ]
-        
-        for i, (label, value) in enumerate(info_items):
-            ctk.CTkLabel(info_frame, text=f"{label}:", font=ctk.CTkFont(weight="bold")).grid(
-                row=i//2, column=(i%2)*2, sticky="w", padx=10, pady=5
-            )
-            ctk.CTkLabel(info_frame, text=value or "-").grid(
-                row=i//2, column=(i%2)*2+1, sticky="w", padx=10, pady=5
-            )
-            
-        tabs = ctk.CTkTabview(self.current_view)
-        tabs.grid(row=2, column=0, sticky="nsew")
-        
-        columns_tab = tabs.add("Kolonner")
-        maintenance_tab = tabs.add("Vedlikehold")
-        
-        self.build_columns_tab(columns_tab, instrument_id)
-        self.build_maintenance_tab(maintenance_tab, instrument_id)
-        
-    def build_columns_tab(self, parent, instrument_id):
-        parent.grid_rowconfigure(1, weight=1)
-        parent.grid_columnconfigure(0, weight=1)
+        timing = ViewTiming("detail")
+        self.show_view("detail", lambda: InstrumentDetailView(self)).show_instrument(instrument_id, timing)
+        timing.dispatch()
+        return timing
         
-        btn_frame = ctk.CTkFrame(parent, fg_color="transparent")
-        btn_frame.grid(row=0, column=0, sticky="w", pady=(0, 10))
-        
-        ctk.CTkButton(
-            btn_frame,
-            text="+ Legg til kolonne",
-            command=lambda: self.show_add_column(instrument_id)
-        ).pack(side="left")
-        
-        columns = ColumnRepository.get_by_instrument(instrument_id)
-        
-        if columns:
-            list_frame = ctk.CTkScrollableFrame(parent)
-            list_frame.grid(row=1, column=0, sticky="nsew")
-            
-            for col in columns:
-                item = ctk.CTkFrame(list_frame)
-                item.pack(fill="x", pady=3)
-                
-                info = ctk.CTkFrame(item, fg_color="transparent")
-                info.pack(side="left", padx=10, pady=10)
-                
-                ctk.CTkLabel(info, text=col["name"], font=ctk.CTkFont(weight="bold")).pack(anchor="w")
-                ctk.CTkLabel(info, text=f"Type: {col['column_type'] or '-'} | Dim: {col['length_cm'] or '-'}cm x {col['diameter_mm'] or '-'}mm | Status: {col['status']}").pack(anchor="w")
-                
-                ctk.CTkButton(
-                    item,
-                    text="Slett",
-                    width=60,
-                    fg_color="#c42b1c",
-                    hover_color="#9f2318",
-                    command=lambda col_id=col["id"], inst_id=instrument_id: self.delete_column(col_id, inst_id)
-                ).pack(side="right", padx=10)
-        else:
-            ctk.CTkLabel(parent, text="Ingen kolonner registrert").grid(row=1, column=0, pady=20)
-            
-    def build_maintenance_tab(self, parent, instrument_id):
-        parent.grid_rowconfigure(1, weight=1)
-        parent.grid_columnconfigure(0, weight=1)
-        
-        btn_frame = ctk.CTkFrame(parent, fg_color="transparent")
-        btn_frame.grid(row=0, column=0, sticky="w", pady=(0, 10))
-        
-        ctk.CTkButton(
-            btn_frame,
-            text="+ Legg til vedlikehold",
-            command=lambda: self.show_add_maintenance(instrument_id)
-        ).pack(side="left")
-        
-        records = MaintenanceRepository.get_by_instrument(instrument_id)
-        
-        if records:
-            list_frame = ctk.CTkScrollableFrame(parent)
-            list_frame.grid(row=1, column=0, sticky="nsew")
-            
-            for rec in records:
-                item = ctk.CTkFrame(list_frame)
-                item.pack(fill="x", pady=3)
-                
-                info = ctk.CTkFrame(item, fg_color="transparent")
-                info.pack(side="left", padx=10, pady=10)
-                
-                ctk.CTkLabel(info, text=f"{rec['date']} - {rec['maintenance_type']}", font=ctk.CTkFont(weight="bold")).pack(anchor="w")
-                ctk.CTkLabel(info, text=f"Beskrivelse: {rec['description'] or '-'}").pack(anchor="w")
-                ctk.CTkLabel(info, text=f"Utført av: {rec['performed_by'] or '-'} | Kostnad: {rec['cost'] or '-'}").pack(anchor="w")
-                
-                ctk.CTkButton(
-                    item,
-                    text="Slett",
-                    width=60,
-                    fg_color="#c42b1c",
-                    hover_color="#9f2318",
-                    command=lambda maint_id=rec["id"], inst_id=instrument_id: self.delete_maintenance(maint_id, inst_id)
-                ).pack(side="right", padx=10)
-        else:
-            ctk.CTkLabel(parent, text="Ingen vedlikehold registrert").grid(row=1, column=0, pady=20)
-            
     def show_add_column(self, instrument_id: int):
         dialog = ctk.CTkToplevel(self)
         dialog.title("Legg til kolonne")
@@ -436,7 +334,7 @@ class InstrumentApp(ctk.CTk):
                 entry.pack(fill="x", pady=(5, 10))
                 entries[key] = entry
             else:
-                entry = ctk.CTkEntry(form)
+                entry = ctk.CTkEntry(form, placeholder_text="ÅÅÅÅ-MM-DD" if key.endswith("_date") else "")
                 entry.pack(fill="x", pady=(5, 10))
                 entries[key] = entry
                 
@@ -444,27 +342,32 @@ class InstrumentApp(ctk.CTk):
             name = entries["name"].get().strip()
             if not name:
                 return
+            install_date = self.read_date(entries["install_date"], form)
+            if install_date is False:
+                return
                 
             length = entries["length_cm"].get().strip()
             diameter = entries["diameter_mm"].get().strip()
             
-            ColumnRepository.create(
+            self.worker.write(
+                ColumnRepository.create,
                 instrument_id=instrument_id,
                 name=name,
                 column_type=entries["column_type"].get().strip() or None,
                 length_cm=float(length) if length else None,
                 diameter_mm=float(diameter) if diameter else None,
                 pore_size=entries["pore_size"].get().strip() or None,
-                install_date=entries["install_date"].get().strip() or None,
-                notes=entries["notes"].get("1.0", "end").strip() or None
+                install_date=install_date,
+                notes=entries["notes"].get("1.0", "end").strip() or None,
+                on_done=lambda _: self.show_instrument_detail(instrument_id),
+                on_error=lambda e: self.show_error("Lagring feilet!", str(e))
             )
             dialog.destroy()
-            self.show_instrument_detail(instrument_id)
             
         ctk.CTkButton(dialog, text="Lagre", command=save).pack(pady=10)
         ctk.CTkButton(dialog, text="Avbryt", command=dialog.destroy).pack(pady=5)
         
-    def show_add_maintenance(self, instrument_id: int):
+    def show_add_maintenance(self, instrument_id: int, maintenance_type: str = None, on_saved=None):
         dialog = ctk.CTkToplevel(self)
         dialog.title("Legg til vedlikehold")
         dialog.geometry("450x600")
@@ -480,12 +383,14 @@ class InstrumentApp(ctk.CTk):
         ctk.CTkLabel(form, text="Dato *").pack(anchor="w", pady=(10, 0))
         date_entry = ctk.CTkEntry(form)
         date_entry.pack(fill="x", pady=(5, 10))
-        date_entry.insert(0, "2026-02-18")
+        date_entry.insert(0, date.today().isoformat())
         entries["date"] = date_entry
         
         ctk.CTkLabel(form, text="Type *").pack(anchor="w", pady=(10, 0))
-        type_combo = ctk.CTkComboBox(form, values=["Preventive", "Repair", "Calibration", "Other"])
+        type_combo = ctk.CTkComboBox(form, values=MAINTENANCE_TYPES)
         type_combo.pack(fill="x", pady=(5, 10))
+        if maintenance_type:
+            type_combo.set(maintenance_type)
         entries["maintenance_type"] = type_combo
         
         fields = [
@@ -501,144 +406,392 @@ class InstrumentApp(ctk.CTk):
             entries[key] = entry
                 
         def save():
-            date = entries["date"].get().strip()
+            day = self.read_date(entries["date"], form)
             maint_type = entries["maintenance_type"].get()
-            if not date or not maint_type:
+            if not day or not maint_type:
                 return
                 
             cost = entries["cost"].get().strip()
             
-            MaintenanceRepository.create(
+            self.worker.write(
+                MaintenanceRepository.create,
                 instrument_id=instrument_id,
-                date=date,
+                date=day,
                 maintenance_type=maint_type,
                 description=entries["description"].get().strip() or None,
                 performed_by=entries["performed_by"].get().strip() or None,
-                cost=float(cost) if cost else None
+                cost=float(cost) if cost else None,
+                on_done=lambda _: on_saved() if on_saved else self.show_instrument_detail(instrument_id),
+                on_error=lambda e: self.show_error("Lagring feilet!", str(e))
             )
             dialog.destroy()
-            self.show_instrument_detail(instrument_id)
             
         ctk.CTkButton(dialog, text="Lagre", command=save).pack(pady=10)
         ctk.CTkButton(dialog, text="Avbryt", command=dialog.destroy).pack(pady=5)
         
-    def delete_instrument(self, instrument_id: int, instrument_type: str = None):
-        if instrument_type is None:
-            inst = InstrumentRepository.get_by_id(instrument_id)
-            instrument_type = inst["type"] if inst else "LC"
+    def show_history(self, table: str, row_id: int, title: str):
+        # Who changed what and when, newest first, from the audit log.
+        dialog = ctk.CTkToplevel(self)
+        dialog.title(f"Historikk: {title}")
+        dialog.geometry("560x520")
+        dialog.transient(self)
+        
+        text = ctk.CTkTextbox(dialog, wrap="word")
+        text.pack(fill="both", expand=True, padx=20, pady=(20, 10))
+        text.insert("end", "Laster...")
+        text.configure(state="disabled")
+        
+        def show(history):
+            if not dialog.winfo_exists():
+                return
+            lines = []
+            for entry in history:
+                actor = entry["actor"] + (f" (oppgir {entry['claimed']})" if entry.get("claimed") else "")
+                lines.append(f"{entry['at']} UTC  {actor}  {HISTORY_OPS[entry['op']]}")
+                for field, (old, new) in entry.get("changes", {}).items():
+                    lines.append(f"    {field}: {'-' if old is None else old} → {'-' if new is None else new}")
+                lines.append("")
+            text.configure(state="normal")
+            text.delete("1.0", "end")
+            text.insert("end", "\n".join(lines) or "Ingen endringer registrert")
+            text.configure(state="disabled")
+            
+        self.worker.read(
+            AuditRepository.history, table, row_id, on_done=show,
+            on_error=lambda e: self.show_error("Kunne ikke lese historikken", str(e))
+        )
+        ctk.CTkButton(dialog, text="Lukk", command=dialog.destroy).pack(pady=(0, 10))
+
+    def show_plans(self, instrument_id: int = None):
+        # An instrument's own plans, or with no instrument the plans for
+        # every instrument of a type.
+        dialog = ctk.CTkToplevel(self)
+        dialog.title("Vedlikeholdsplaner")
+        dialog.geometry("520x640")
+        dialog.transient(self)
+        
+        title = "Egne planer" if instrument_id else "Planer per instrumenttype"
+        ctk.CTkLabel(dialog, text=title, font=ctk.CTkFont(size=18, weight="bold")).pack(pady=10)
+        if instrument_id:
+            ctk.CTkLabel(
+                dialog, text="En egen plan erstatter typens planer for samme vedlikeholdstype.", text_color="gray60"
+            ).pack()
+        
+        plan_list = ctk.CTkScrollableFrame(dialog, height=200)
+        plan_list.pack(fill="both", expand=True, padx=20, pady=10)
+        
+        def show(plans):
+            if not dialog.winfo_exists():
+                return
+            for child in plan_list.winfo_children():
+                child.destroy()
+            if not plans:
+                ctk.CTkLabel(plan_list, text="Ingen planer", text_color="gray60").pack(pady=10)
+            for plan in plans:
+                row = ctk.CTkFrame(plan_list, fg_color="transparent")
+                row.pack(fill="x", pady=2)
+                text = f"{plan['maintenance_type']} hver {plan['interval_months']}. mnd"
+                if not instrument_id:
+                    text = f"{plan['instrument_type']}: {text}"
+                if plan["description"]:
+                    text += f" - {plan['description']}"
+                ctk.CTkLabel(row, text=text, anchor="w").pack(side="left", fill="x", expand=True)
+                ctk.CTkButton(
+                    row, text="Slett", width=60, fg_color="#c42b1c", hover_color="#9f2318",
+                    command=lambda plan_id=plan["id"]: self.worker.write(
+                        PlanRepository.delete, plan_id,
+                        on_done=changed,
+                        on_error=lambda e: self.show_error("Sletting feilet!", str(e))
+                    )
+                ).pack(side="right")
+        
+        def load():
+            if instrument_id:
+                self.worker.read(PlanRepository.get_by_instrument, instrument_id, on_done=show)
+            else:
+                self.worker.read(PlanRepository.get_type_plans, on_done=show)
+        
+        def changed(_):
+            load()
+            if isinstance(self.current_view, View):
+                self.current_view.refresh()
+        
+        form = ctk.CTkFrame(dialog, fg_color="transparent")
+        form.pack(fill="x", padx=20)
+        
+        type_combo = None
+        if not instrument_id:
+            ctk.CTkLabel(form, text="Gjelder alle *").pack(anchor="w", pady=(10, 0))
+            type_combo = ctk.CTkComboBox(form, values=INSTRUMENT_TYPES)
+            type_combo.pack(fill="x", pady=(5, 10))
+        
+        ctk.CTkLabel(form, text="Vedlikeholdstype *").pack(anchor="w", pady=(10, 0))
+        maintenance_combo = ctk.CTkComboBox(form, values=MAINTENANCE_TYPES)
+        maintenance_combo.set("Calibration")
+        maintenance_combo.pack(fill="x", pady=(5, 10))
+        
+        ctk.CTkLabel(form, text="Intervall (måneder) *").pack(anchor="w", pady=(10, 0))
+        interval_entry = ctk.CTkEntry(form)
+        interval_entry.pack(fill="x", pady=(5, 10))
+        
+        ctk.CTkLabel(form, text="Beskrivelse").pack(anchor="w", pady=(10, 0))
+        description_entry = ctk.CTkEntry(form)
+        description_entry.pack(fill="x", pady=(5, 10))
+        
+        error_label = ctk.CTkLabel(form, text="", text_color="red")
+        error_label.pack()
+        
+        def add():
+            interval = interval_entry.get().strip()
+            if not interval.isdigit() or int(interval) < 1:
+                error_label.configure(text="Intervallet må være et helt antall måneder")
+                return
+            error_label.configure(text="")
+            self.worker.write(
+                PlanRepository.create,
+                maintenance_type=maintenance_combo.get(),
+                interval_months=int(interval),
+                instrument_id=instrument_id,
+                instrument_type=type_combo.get() if type_combo else None,
+                description=description_entry.get().strip() or None,
+                on_done=changed,
+                on_error=lambda e: self.show_error("Lagring feilet!", str(e))
+            )
+            interval_entry.delete(0, "end")
+            description_entry.delete(0, "end")
+        
+        ctk.CTkButton(dialog, text="Legg til plan", command=add).pack(pady=10)
+        ctk.CTkButton(dialog, text="Lukk", command=dialog.destroy).pack(pady=5)
+        load()
         
+    def confirm(self, message: str, on_yes):
         dialog = ctk.CTkToplevel(self)
         dialog.title("Bekreft sletting")
         dialog.geometry("400x180")
         dialog.transient(self)
         
-        ctk.CTkLabel(
-            dialog, 
-            text="Er du sikker på at du vil slette dette instrumentet?\nDette vil også slette alle tilknyttede kolonner og vedlikehold.",
-            wraplength=350
-        ).pack(pady=20)
+        ctk.CTkLabel(dialog, text=message, wraplength=350).pack(pady=20)
         
         btn_frame = ctk.CTkFrame(dialog, fg_color="transparent")
         btn_frame.pack(pady=10)
         
-        def confirm():
-            InstrumentRepository.delete(instrument_id)
+        def yes():
+            on_yes()
             dialog.destroy()
-            self.show_instrument_list(instrument_type)
             
-        ctk.CTkButton(btn_frame, text="Ja, slett", fg_color="#c42b1c", hover_color="#9f2318", command=confirm).pack(side="left", padx=5)
+        ctk.CTkButton(btn_frame, text="Ja, slett", fg_color="#c42b1c", hover_color="#9f2318", command=yes).pack(side="left", padx=5)
         ctk.CTkButton(btn_frame, text="Avbryt", command=dialog.destroy).pack(side="left", padx=5)
+
+    def delete_instrument(self, instrument_id: int, instrument_type: str = None):
+        if instrument_type is None:
+            # Look the type up off the Tk thread, then ask.
+            self.worker.read(
+                InstrumentRepository.get_by_id, instrument_id,
+                on_done=lambda inst: self.delete_instrument(instrument_id, inst["type"] if inst else "LC"),
+                on_error=lambda e: self.show_error("Sletting feilet!", str(e))
+            )
+            return
+
+        self.confirm(
+            "Er du sikker på at du vil slette dette instrumentet?\nDette vil også slette alle tilknyttede kolonner og vedlikehold.",
+            lambda: self.worker.write(
+                InstrumentRepository.delete, instrument_id,
+                on_done=lambda _: self.show_instrument_list(instrument_type),
+                on_error=lambda e: self.show_error("Sletting feilet!", str(e))
+            )
+        )
+
+    def apply_to_selection(self, func, rows, *args, on_done=None, confirm: str = None):
+        # One *_many call, and so one transaction, for all the selected rows.
+        def run():
+            self.worker.write(
+                func, *args, ids=tuple(row["id"] for row in rows),
+                on_done=lambda count: on_done and on_done(count),
+                on_error=lambda e: self.show_error("Endringen feilet!", str(e))
+            )
+        if confirm:
+            self.confirm(confirm, run)
+        else:
+            run()
         
     def delete_column(self, column_id: int, instrument_id: int):
-        ColumnRepository.delete(column_id)
-        self.show_instrument_detail(instrument_id)
+        self.worker.write(
+            ColumnRepository.delete, column_id,
+            on_done=lambda _: self.show_instrument_detail(instrument_id),
+            on_error=lambda e: self.show_error("Sletting feilet!", str(e))
+        )
         
     def delete_maintenance(self, maintenance_id: int, instrument_id: int):
-        MaintenanceRepository.delete(maintenance_id)
-        self.show_instrument_detail(instrument_id)
+        self.worker.write(
+            MaintenanceRepository.delete, maintenance_id,
+            on_done=lambda _: self.show_instrument_detail(instrument_id),
+            on_error=lambda e: self.show_error("Sletting feilet!", str(e))
+        )
         
     def show_columns(self):
-        self.clear_content()
-        
-        self.current_view = ctk.CTkFrame(self, fg_color="transparent")
-        self.current_view.grid(row=0, column=1, sticky="nsew", padx=20, pady=20)
-        self.current_view.grid_rowconfigure(1, weight=1)
-        self.current_view.grid_columnconfigure(0, weight=1)
-        
-        ctk.CTkLabel(
-            self.current_view,
-            text="Alle Kolonner",
-            font=ctk.CTkFont(size=24, weight="bold")
-        ).grid(row=0, column=0, pady=(0, 10), sticky="w")
-        
-        columns = ColumnRepository.get_all()
+        self.current_instrument_id = None
+        timing = ViewTiming("columns")
+        self.show_view("columns", lambda: ColumnsView(self)).refresh(timing)
+        timing.dispatch()
+        return timing
+
+    def show_due(self):
+        self.current_instrument_id = None
+        timing = ViewTiming("due")
+        self.show_view("due", lambda: DueView(self)).refresh(timing)
+        timing.dispatch()
+        return timing
+
+    def show_analysis(self):
+        self.current_instrument_id = None
+        timing = ViewTiming("analysis")
+        self.show_view("analysis", lambda: AnalysisView(self)).refresh(timing)
+        timing.dispatch()
+        return timing
+
+    def show_diagnostics(self):
+        self.current_instrument_id = None
+        self.show_view("diagnostics", lambda: DiagnosticsView(self)).refresh()
+        
+    def schedule_search(self, event=None):
+        # Wait for a pause in typing instead of querying on every key.
+        if self.search_after_id is not None:
+            self.after_cancel(self.search_after_id)
+        self.search_after_id = self.after(SEARCH_DELAY_MS, self.run_search)
+        
+    def run_search(self):
+        if self.search_after_id is not None:
+            self.after_cancel(self.search_after_id)
+            self.search_after_id = None
+        text = self.search_entry.get()
+        if not text.strip():
+            return
+        self.current_instrument_id = None
+        timing = ViewTiming("search")
+        self.show_view("search", lambda: SearchView(self)).search(text, timing)
+        timing.dispatch()
         
-        if columns:
-            list_frame = ctk.CTkScrollableFrame(self.current_view)
-            list_frame.grid(row=1, column=0, sticky="nsew")
-            
-            headers = ctk.CTkFrame(list_frame, fg_color="transparent")
-            headers.pack(fill="x")
-            
-            ctk.CTkLabel(headers, text="Navn", font=ctk.CTkFont(weight="bold"), width=120).pack(side="left", padx=5)
-            ctk.CTkLabel(headers, text="Type", font=ctk.CTkFont(weight="bold"), width=80).pack(side="left", padx=5)
-            ctk.CTkLabel(headers, text="Instrument", font=ctk.CTkFont(weight="bold"), width=100).pack(side="left", padx=5)
-            ctk.CTkLabel(headers, text="Status", font=ctk.CTkFont(weight="bold"), width=80).pack(side="left", padx=5)
-            ctk.CTkLabel(headers, text="Installert", font=ctk.CTkFont(weight="bold"), width=80).pack(side="left", padx=5)
-            
-            for col in columns:
-                row = ctk.CTkFrame(list_frame, fg_color="transparent")
-                row.pack(fill="x", pady=2)
-                
-                ctk.CTkLabel(row, text=col["name"], width=120).pack(side="left", padx=5)
-                ctk.CTkLabel(row, text=col["column_type"] or "-", width=80).pack(side="left", padx=5)
-                ctk.CTkLabel(row, text=col["instrument_name"] or "-", width=100).pack(side="left", padx=5)
-                ctk.CTkLabel(row, text=col["status"], width=80).pack(side="left", padx=5)
-                ctk.CTkLabel(row, text=col["install_date"] or "-", width=80).pack(side="left", padx=5)
-        else:
-            ctk.CTkLabel(self.current_view, text="Ingen kolonner registrert").grid(row=1, column=0)
+    def show_busy(self, title: str, text: str):
+        dialog = ctk.CTkToplevel(self)
+        dialog.title(title)
+        dialog.geometry("300x150")
+        dialog.transient(self)
+        ctk.CTkLabel(dialog, text=text, font=ctk.CTkFont(size=16, weight="bold")).pack(pady=20)
+        progress = ctk.CTkProgressBar(dialog, mode="indeterminate")
+        progress.pack(padx=20, pady=10, fill="x")
+        progress.start()
+        dialog.status_label = ctk.CTkLabel(dialog, text="")
+        dialog.status_label.pack()
+        return dialog
 
     def show_export(self):
+        from tkinter import filedialog
+        from transfer import export_all_to_csv
+        
         folder = filedialog.askdirectory(title="Velg mappe for eksport")
         if folder:
-            try:
-                export_all_to_csv(folder)
+            busy = self.show_busy("Eksporterer", "Eksporterer...")
+            
+            def done(manifest):
+                busy.destroy()
+                rows = sum(entry["rows"] for entry in manifest["tables"].values())
                 dialog = ctk.CTkToplevel(self)
                 dialog.title("Eksport vellykket")
-                dialog.geometry("300x150")
+                dialog.geometry("340x180")
                 dialog.transient(self)
                 ctk.CTkLabel(dialog, text="Eksport fullført!", font=ctk.CTkFont(size=16, weight="bold")).pack(pady=20)
-                ctk.CTkLabel(dialog, text=f"Filer eksportert til:\n{folder}").pack(pady=10)
-                ctk.CTkButton(dialog, text="OK", command=dialog.destroy).pack(pady=10)
-            except Exception as e:
-                dialog = ctk.CTkToplevel(self)
-                dialog.title("Feil")
-                dialog.geometry("300x150")
-                dialog.transient(self)
-                ctk.CTkLabel(dialog, text="Eksport feilet!", text_color="red", font=ctk.CTkFont(size=16, weight="bold")).pack(pady=20)
-                ctk.CTkLabel(dialog, text=str(e)).pack(pady=10)
+                ctk.CTkLabel(dialog, text=f"{rows} rader eksportert til:\n{folder}", wraplength=300).pack(pady=10)
                 ctk.CTkButton(dialog, text="OK", command=dialog.destroy).pack(pady=10)
+                
+            def failed(e):
+                busy.destroy()
+                self.show_error("Eksport feilet!", str(e))
+                
+            self.worker.read(export_all_to_csv, folder, on_done=done, on_error=failed)
 
     def show_import(self):
+        from tkinter import filedialog
+        from transfer import import_all_from_csv
+        
         folder = filedialog.askdirectory(title="Velg mappe for import")
         if folder:
-            try:
-                import_all_from_csv(folder)
+            busy = self.show_busy("Importerer", "Importerer...")
+            stage_names = {"instruments": "instrumenter", "columns": "kolonner", "maintenance": "vedlikehold"}
+            
+            def show_progress(stage, rows, fraction):
+                if not busy.winfo_exists():
+                    return
+                if stage == "apply":
+                    busy.status_label.configure(text="Lagrer i databasen...")
+                else:
+                    busy.status_label.configure(text=f"Leser {stage_names[stage]}: {rows} rader ({fraction:.0%})")
+                    
+            def progress(stage, rows, fraction):
+                self.worker.post(show_progress, stage, rows, fraction)
+            
+            def done(summary):
+                busy.destroy()
                 dialog = ctk.CTkToplevel(self)
                 dialog.title("Import vellykket")
-                dialog.geometry("300x150")
+                dialog.geometry("340x200")
                 dialog.transient(self)
                 ctk.CTkLabel(dialog, text="Import fullført!", font=ctk.CTkFont(size=16, weight="bold")).pack(pady=20)
-                ctk.CTkLabel(dialog, text="Data er importert.").pack(pady=10)
+                ctk.CTkLabel(
+                    dialog,
+                    text=f"{summary['instruments']} instrumenter, {summary['columns']} kolonner og "
+                         f"{summary['maintenance']} vedlikehold importert."
+                         + (f"\n{summary['skipped']} rader uten kjent instrument ble hoppet over." if summary["skipped"] else ""),
+                    wraplength=260
+                ).pack(pady=10)
                 ctk.CTkButton(dialog, text="OK", command=lambda: [dialog.destroy(), self.show_dashboard()]).pack(pady=10)
-            except Exception as e:
-                dialog = ctk.CTkToplevel(self)
-                dialog.title("Feil")
-                dialog.geometry("300x150")
-                dialog.transient(self)
-                ctk.CTkLabel(dialog, text="Import feilet!", text_color="red", font=ctk.CTkFont(size=16, weight="bold")).pack(pady=20)
-                ctk.CTkLabel(dialog, text=str(e)).pack(pady=10)
-                ctk.CTkButton(dialog, text="OK", command=dialog.destroy).pack(pady=10)
+                
+            def failed(e):
+                busy.destroy()
+                self.show_error("Import feilet!", str(e))
+                
+            self.worker.write(import_all_from_csv, folder, progress=progress, on_done=done, on_error=failed)
+
+    def start_backups(self):
+        # Hourly snapshots on a thread of their own; only failures are
+        # shown. The newest snapshot's age is what counts, so restarting the
+        # program does not take a new one each time.
+        from backup import BackupScheduler
+
+        self.backups = BackupScheduler(
+            on_error=lambda e: self.worker.post(self.show_error, "Sikkerhetskopi feilet!", str(e))
+        )
+        self.backups.start()
+
+    def backup_now(self):
+        from backup import create_backup, prune
+        
+        busy = self.show_busy("Sikkerhetskopi", "Tar sikkerhetskopi...")
+        
+        def run():
+            manifest = create_backup()
+            prune()
+            return manifest
+            
+        def done(manifest):
+            busy.destroy()
+            dialog = ctk.CTkToplevel(self)
+            dialog.title("Sikkerhetskopi tatt")
+            dialog.geometry("340x200")
+            dialog.transient(self)
+            ctk.CTkLabel(dialog, text="Sikkerhetskopi tatt!", font=ctk.CTkFont(size=16, weight="bold")).pack(pady=20)
+            ctk.CTkLabel(
+                dialog,
+                text=f"{manifest['file']}\n{manifest['database_bytes'] / 1e6:.0f} MB kopiert på "
+                     f"{manifest['copy_s']:.1f} s, lengste lås {manifest['lock_max_ms']:.0f} ms",
+                wraplength=300
+            ).pack(pady=10)
+            ctk.CTkButton(dialog, text="OK", command=dialog.destroy).pack(pady=10)
+            
+        def failed(e):
+            busy.destroy()
+            self.show_error("Sikkerhetskopi feilet!", str(e))
+            
+        self.worker.read(run, on_done=done, on_error=failed)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,365 @@
+import hashlib
+import json
+import os
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+
+import database
+from database import SCHEMA_VERSION, init_db, query_cache
+from transfer import COMPRESSIONS, _HashingWriter
+
+# Pages copied per backup step. The source is only read-locked while a step
+# runs, and BACKUP_PAUSE_S between steps lets writers (and, in WAL mode, the
+# checkpointer) in.
+BACKUP_PAGES = 4096
+BACKUP_PAUSE_S = 0.005
+# A commit from another connection restarts the copy. After this many
+# restarts the rest is copied in one step, which in WAL mode still lets
+# writers commit; it only holds back checkpoints until it is done.
+BACKUP_MAX_RESTARTS = 3
+BACKUP_COMPRESSION = "gzip"
+BACKUP_INTERVAL_S = 3600
+# How many of the newest hours, days and ISO weeks keep their newest
+# snapshot. The newest snapshot of all is always kept, and so are pinned
+# ones (the copy restore_backup takes of what it overwrites).
+RETENTION = {"hourly": 24, "daily": 7, "weekly": 8}
+BUCKETS = {
+    "hourly": lambda at: at.strftime("%Y-%m-%dT%H"),
+    "daily": lambda at: at.strftime("%Y-%m-%d"),
+    "weekly": lambda at: "%d-W%02d" % at.isocalendar()[:2],
+}
+# How long a restore waits for other connections' transactions to finish.
+RESTORE_TIMEOUT_S = 30
+MANIFEST_SUFFIX = ".json"
+BLOCK_SIZE = 1 << 20
+
+
+def default_directory():
+    # backups/ next to the database file.
+    return os.path.join(os.path.dirname(os.path.abspath(database.DATABASE_PATH)), "backups")
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def _copy(source, target, pages: int, pause: float, cancel=None):
+    # Copies source into target with the backup API and returns how it went:
+    # every step's duration is how long the source was read-locked.
+    steps, restarts = [], 0
+    state = {"remaining": None, "started": time.perf_counter()}
+
+    def progress(status, remaining, total):
+        nonlocal restarts
+        steps.append((time.perf_counter() - state["started"]) * 1000)
+        # A step that got nowhere started over: the source changed.
+        if state["remaining"] is not None and remaining >= state["remaining"]:
+            restarts += 1
+        state["remaining"] = remaining
+        if cancel is not None and cancel.is_set():
+            raise InterruptedError("Sikkerhetskopien ble avbrutt")
+        if restarts > BACKUP_MAX_RESTARTS:
+            raise _TooManyRestarts()
+        if pause:
+            time.sleep(pause)
+        state["started"] = time.perf_counter()
+
+    start = time.perf_counter()
+    single_step = pages <= 0
+    try:
+        source.backup(target, pages=pages, progress=None if single_step else progress)
+    except _TooManyRestarts:
+        single_step = True
+        state["started"] = time.perf_counter()
+        source.backup(target)
+    if single_step:
+        steps.append((time.perf_counter() - state["started"]) * 1000)
+    seconds = time.perf_counter() - start
+    return {
+        "copy_s": round(seconds, 3),
+        "steps": len(steps),
+        "restarts": restarts,
+        "single_step": single_step,
+        "lock_max_ms": round(max(steps), 2),
+        "lock_median_ms": round(statistics.median(steps), 2),
+    }
+
+
+def _snapshot_name(directory: str, at: datetime, suffix: str):
+    # Returns the snapshot's time and file name. Names carry the time to the
+    # microsecond, so they sort like the snapshots; if one is taken anyway,
+    # the time moves on a microsecond rather than getting a suffix.
+    stem = os.path.splitext(os.path.basename(database.DATABASE_PATH))[0]
+    taken = os.listdir(directory)
+    while True:
+        name = f"{stem}-{at.strftime('%Y%m%dT%H%M%S%fZ')}"
+        if not any(entry.startswith(f"{name}.") for entry in taken):
+            return at, f"{name}.db{suffix}"
+        at += timedelta(microseconds=1)
+
+
+def _compress(path: str, target: str, compression, cancel=None):
+    # Returns (sha256 of the database, bytes and sha256 of the file written).
+    suffix, opener = COMPRESSIONS[compression]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f, open(target, "wb") as raw:
+        sink = _HashingWriter(raw)
+        stream = opener(sink, "wb") if opener else sink
+        try:
+            for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+                if cancel is not None and cancel.is_set():
+                    raise InterruptedError("Sikkerhetskopien ble avbrutt")
+                digest.update(block)
+                stream.write(block)
+        finally:
+            if opener:
+                stream.close()
+    return digest.hexdigest(), sink.bytes, sink.sha256.hexdigest()
+
+
+def create_backup(directory: str = None, compression: str = BACKUP_COMPRESSION, pages: int = BACKUP_PAGES,
+                  pause: float = BACKUP_PAUSE_S, cancel=None, pinned: bool = False):
+    # Copies the live database into a snapshot while it stays in use, then
+    # compresses it next to a manifest (<snapshot>.json) with checksums and
+    # the copy's throughput and lock-hold times. The manifest is written
+    # last, so a snapshot without one is incomplete and never listed.
+    #
+    # pages <= 0 copies everything in one step. cancel is a threading.Event
+    # that aborts the copy between steps, or the compression. prune() never
+    # removes a pinned snapshot.
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Ukjent komprimering: {compression}")
+    if not os.path.exists(database.DATABASE_PATH):
+        raise FileNotFoundError(f"Fant ikke databasen {database.DATABASE_PATH}")
+    directory = directory or default_directory()
+    os.makedirs(directory, exist_ok=True)
+    at, filename = _snapshot_name(directory, datetime.now(timezone.utc), COMPRESSIONS[compression][0])
+    path = os.path.join(directory, filename)
+    started = time.perf_counter()
+
+    with tempfile.TemporaryDirectory(dir=directory, prefix=".backup-") as tmp:
+        copy = os.path.join(tmp, "copy.db")
+        with closing(sqlite3.connect(copy)) as target, database.connection_manager.dedicated() as source:
+            stats = _copy(source, target, pages, pause, cancel)
+            page_size = target.execute("PRAGMA page_size").fetchone()[0]
+            page_count = target.execute("PRAGMA page_count").fetchone()[0]
+            schema_version = target.execute("PRAGMA user_version").fetchone()[0]
+            # The copy keeps the source's WAL flag; a rollback journal makes
+            # the snapshot a single self-contained file.
+            target.execute("PRAGMA journal_mode=DELETE").fetchall()
+        size = os.path.getsize(copy)
+        database_sha256, file_bytes, file_sha256 = _compress(
+            copy, os.path.join(tmp, filename), compression, cancel
+        )
+        os.replace(os.path.join(tmp, filename), path)
+
+    seconds = time.perf_counter() - started
+    manifest = {
+        "file": filename,
+        "created_at": at.isoformat(timespec="microseconds"),
+        "database": os.path.abspath(database.DATABASE_PATH),
+        "schema_version": schema_version,
+        "compression": compression,
+        "bytes": file_bytes,
+        "sha256": file_sha256,
+        "database_bytes": size,
+        "database_sha256": database_sha256,
+        "page_size": page_size,
+        "pages": page_count,
+        **stats,
+        "copy_mb_per_s": round(size / 1e6 / max(stats["copy_s"], 1e-6), 1),
+        "total_s": round(seconds, 3),
+        "pinned": pinned,
+    }
+    with open(path + MANIFEST_SUFFIX, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def list_backups(directory: str = None):
+    # Complete snapshots, newest first.
+    directory = directory or default_directory()
+    if not os.path.isdir(directory):
+        return []
+    manifests = []
+    for name in os.listdir(directory):
+        snapshot = name[:-len(MANIFEST_SUFFIX)]
+        if not name.endswith(MANIFEST_SUFFIX) or not os.path.exists(os.path.join(directory, snapshot)):
+            continue
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            manifests.append(json.load(f))
+    # Older manifests have whole seconds, so the times are compared, not the text.
+    return sorted(manifests, key=lambda manifest: (datetime.fromisoformat(manifest["created_at"]), manifest["file"]),
+                  reverse=True)
+
+
+def prune(directory: str = None, retention: dict = None):
+    # Deletes the snapshots no retention tier keeps; returns their names.
+    directory = directory or default_directory()
+    snapshots = list_backups(directory)
+    keep = {manifest["file"] for manifest in snapshots if manifest.get("pinned")}
+    if snapshots:
+        keep.add(snapshots[0]["file"])
+    for tier, count in (retention or RETENTION).items():
+        if tier not in BUCKETS:
+            raise ValueError(f"Ukjent oppbevaringsnivå: {tier}")
+        buckets = set()
+        for manifest in snapshots:
+            bucket = BUCKETS[tier](datetime.fromisoformat(manifest["created_at"]))
+            if bucket in buckets:
+                continue
+            if len(buckets) == count:
+                break
+            buckets.add(bucket)
+            keep.add(manifest["file"])
+    removed = []
+    for manifest in snapshots:
+        if manifest["file"] not in keep:
+            # The manifest first: without it the snapshot no longer counts.
+            os.remove(os.path.join(directory, manifest["file"] + MANIFEST_SUFFIX))
+            os.remove(os.path.join(directory, manifest["file"]))
+            removed.append(manifest["file"])
+    return removed
+
+
+def _file_sha256(path: str):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _unpack(path: str, target: str):
+    # Decompresses a snapshot into target and checks it against its
+    # manifest and with integrity_check. Returns what is wrong, if anything.
+    manifest_path = path + MANIFEST_SUFFIX
+    if not os.path.exists(path):
+        return [f"Fant ikke {path}"]
+    if not os.path.exists(manifest_path):
+        return [f"Mangler {os.path.basename(manifest_path)}"]
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    if _file_sha256(path) != manifest["sha256"]:
+        return ["Filen stemmer ikke med sjekksummen"]
+    _, opener = COMPRESSIONS[manifest["compression"]]
+    digest = hashlib.sha256()
+    with open(path, "rb") as raw, open(target, "wb") as out:
+        stream = opener(raw, "rb") if opener else raw
+        for block in iter(lambda: stream.read(BLOCK_SIZE), b""):
+            digest.update(block)
+            out.write(block)
+    if digest.hexdigest() != manifest["database_sha256"]:
+        return ["Databasen stemmer ikke med sjekksummen"]
+    problems = []
+    with closing(sqlite3.connect(target)) as conn:
+        result = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+        if result != ["ok"]:
+            problems.extend(result)
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            problems.append(f"Skjemaversjon {version} er nyere enn programmet ({SCHEMA_VERSION})")
+    return problems
+
+
+def verify_backup(path: str):
+    # Returns what is wrong with a snapshot; an empty list means it can be
+    # restored.
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path)), prefix=".verify-") as tmp:
+        return _unpack(path, os.path.join(tmp, "verify.db"))
+
+
+def restore_backup(path: str, keep_current: bool = True, directory: str = None):
+    # Replaces the database's contents with a verified snapshot, through the
+    # backup API so other connections see the change like any commit. It
+    # holds the write lock for the whole copy. Unless keep_current is
+    # False, the current contents are backed up first.
+    #
+    # The target is a bare connection: the copy overwrites every page, so it
+    # works on a database too damaged for the pragma profile to open.
+    directory = directory or default_directory()
+    with tempfile.TemporaryDirectory(dir=directory if os.path.isdir(directory) else None,
+                                     prefix=".restore-") as tmp:
+        unpacked = os.path.join(tmp, "restore.db")
+        problems = _unpack(path, unpacked)
+        if problems:
+            raise ValueError(f"{os.path.basename(path)} kan ikke gjenopprettes: {'; '.join(problems)}")
+        if keep_current and os.path.exists(database.DATABASE_PATH):
+            current = create_backup(directory, pinned=True)
+        else:
+            current = None
+        started = time.perf_counter()
+        with closing(sqlite3.connect(unpacked)) as source, \
+                closing(sqlite3.connect(database.DATABASE_PATH, timeout=RESTORE_TIMEOUT_S)) as target:
+            source.backup(target)
+        seconds = time.perf_counter() - started
+    query_cache.invalidate_all()
+    # An older snapshot is brought up to this program's schema.
+    init_db()
+    return {
+        "restored": os.path.basename(path),
+        "previous": current["file"] if current else None,
+        "copy_s": round(seconds, 3),
+    }
+
+
+class BackupScheduler:
+    # Takes a snapshot on its own thread whenever the newest one in the
+    # directory is interval_s old (so restarts and other processes backing
+    # up to the same place count), then prunes. on_done(manifest, removed)
+    # and on_error(error) are called on that thread.
+    def __init__(self, directory: str = None, interval_s: float = BACKUP_INTERVAL_S, on_done=None, on_error=None):
+        self.directory = directory
+        self.interval_s = interval_s
+        self.on_done = on_done
+        self.on_error = on_error
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="backup", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def run_now(self):
+        self._wake.set()
+
+    def stop(self, timeout: float = 5):
+        # A backup in progress is abandoned at its next step or block.
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def _wait_s(self):
+        snapshots = list_backups(self.directory)
+        if not snapshots:
+            return 0
+        age = (datetime.now(timezone.utc) - datetime.fromisoformat(snapshots[0]["created_at"])).total_seconds()
+        return max(self.interval_s - age, 0)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                wait = self._wait_s()
+                if wait > 0 and not self._wake.wait(wait):
+                    continue
+                self._wake.clear()
+                if self._stop.is_set():
+                    return
+                manifest = create_backup(self.directory, cancel=self._stop)
+                removed = prune(self.directory)
+            except Exception as e:
+                if self._stop.is_set():
+                    return
+                if self.on_error is not None:
+                    self.on_error(e)
+                # Try again after a full interval rather than in a loop.
+                self._wake.wait(self.interval_s)
+                self._wake.clear()
+            else:
+                if self.on_done is not None:
+                    self.on_done(manifest, removed)
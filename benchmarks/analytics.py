@@ -0,0 +1,72 @@
+import argparse
+import os
+import tempfile
+import time
+
+import database
+from analytics import AnalyticsRepository
+from benchmarks.generate import SCALES, generate
+from benchmarks.suite import measure
+
+# Ranges as the Analyse view asks for them: everything, whole years, and
+# ranges with partial months at both ends.
+RANGES = [
+    ("all", None, None),
+    ("2015-2024", "2015-01-01", "2024-12-31"),
+    ("last 12 months", "2024-12-19", "2025-12-18"),
+    ("Mar 10-Aug 20 2023", "2023-03-10", "2023-08-20"),
+]
+QUERIES = [
+    ("by_type", lambda start, end, rollups: AnalyticsRepository.by_type(start, end, rollups)),
+    ("over_time(month)", lambda start, end, rollups: AnalyticsRepository.over_time("month", start, end, rollups=rollups)),
+    ("over_time(year)", lambda start, end, rollups: AnalyticsRepository.over_time("year", start, end, rollups=rollups)),
+    ("by_manufacturer", lambda start, end, rollups: AnalyticsRepository.by_manufacturer(start, end, rollups)),
+    ("by_instrument", lambda start, end, rollups: AnalyticsRepository.by_instrument(start, end, rollups)),
+]
+
+
+def run(repeat: int):
+    database.query_cache.enabled = False
+    print(f"{'query':<18}{'range':<20}{'rollups':>11}{'raw rows':>11}{'speedup':>9}")
+    for name, query in QUERIES:
+        for label, start, end in RANGES:
+            rolled = measure(lambda: query(start, end, True), repeat)["median_ms"]
+            raw = measure(lambda: query(start, end, False), max(1, repeat // 5), budget_s=30)["median_ms"]
+            print(f"{name:<18}{label:<20}{rolled:>9.1f}ms{raw:>9.1f}ms{raw / rolled:>8.1f}x")
+    overview = measure(lambda: AnalyticsRepository.overview(), repeat)["median_ms"]
+    print(f"overview (all)    {overview:.1f} ms")
+    with database.get_connection() as conn:
+        rebuild = measure(lambda: database.rebuild_rollups(conn), 1, budget_s=0)["median_ms"]
+        rollup_rows = sum(
+            conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in database.ROLLUPS
+        )
+        maintenance = conn.execute("SELECT COUNT(*) FROM maintenance").fetchone()[0]
+    print(f"rebuild_rollups   {rebuild:.0f} ms ({rollup_rows} rollup rows for {maintenance} maintenance rows)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analytics from rollups versus from the raw maintenance rows")
+    parser.add_argument("--db", help="database to run against (default: generate one for --scale)")
+    parser.add_argument("--scale", choices=SCALES, default="large")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = args.db
+        if db_path is None:
+            db_path = os.path.join(tmp, "fleet.db")
+            print(f"generating {args.scale} fleet...", flush=True)
+            start = time.perf_counter()
+            generate(db_path, *SCALES[args.scale], seed=args.seed)
+            print(f"generated in {time.perf_counter() - start:.0f} s")
+        database.DATABASE_PATH = db_path
+        database.init_db()
+        try:
+            run(args.repeat)
+        finally:
+            database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
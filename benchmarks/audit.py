@@ -0,0 +1,108 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import database
+from benchmarks.generate import SCALES, generate
+from benchmarks.suite import _copy_database, measure
+from database import AuditRepository, InstrumentRepository, MaintenanceRepository
+
+EDITS = 500
+
+
+def _triggers(conn):
+    return [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'audit\\_%' ESCAPE '\\'"
+                                           " AND type = 'trigger'")]
+
+
+def write_costs(rng, instruments: int, repeat: int):
+    # Median ms of the single-row writes the dialogs make.
+    def update():
+        instrument_id = rng.randint(1, instruments)
+        row = InstrumentRepository.get_by_id(instrument_id)
+        if row:
+            InstrumentRepository.update(instrument_id, row["name"], row["type"], notes=f"note {rng.random()}",
+                                        status=row["status"])
+
+    def insert_delete():
+        MaintenanceRepository.delete(MaintenanceRepository.create(rng.randint(1, instruments), "2026-01-01", "Other"))
+
+    return {name: measure(func, repeat)["median_ms"] for name, func in
+            (("instrument update", update), ("maintenance insert+delete", insert_delete))}
+
+
+def run(repeat: int, seed: int):
+    database.query_cache.enabled = False
+    rng = random.Random(seed)
+    with database.get_connection() as conn:
+        instruments = conn.execute("SELECT MAX(id) FROM instruments").fetchone()[0]
+
+    audited = write_costs(rng, instruments, repeat)
+    with database.get_connection() as conn:
+        triggers = {name: conn.execute("SELECT sql FROM sqlite_master WHERE name = ?", (name,)).fetchone()[0]
+                    for name in _triggers(conn)}
+        for name in triggers:
+            conn.execute(f"DROP TRIGGER {name}")
+    try:
+        plain = write_costs(rng, instruments, repeat)
+    finally:
+        with database.get_connection() as conn:
+            for sql in triggers.values():
+                conn.execute(sql)
+    for name in audited:
+        print(f"{name:<28}{plain[name]:>8.2f} ms without audit {audited[name]:>8.2f} ms with")
+
+    # One instrument edited EDITS times: reconstructing its first state
+    # undoes at most AUDIT_SNAPSHOT_EVERY deltas, or all of them without
+    # the snapshots.
+    instrument_id = rng.randint(1, instruments)
+    row = InstrumentRepository.get_by_id(instrument_id)
+    start = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+    time.sleep(1)
+    for n in range(EDITS):
+        InstrumentRepository.update(instrument_id, row["name"], row["type"], notes=f"edit {n}", status=row["status"])
+    with database.get_connection() as conn:
+        size = conn.execute(
+            "SELECT AVG(length(data)) FROM audit_log WHERE table_name = 'instruments' AND row_id = ? AND op = 'U'",
+            (instrument_id,)
+        ).fetchone()[0]
+    print(f"{'delta size':<28}{size:>8.0f} bytes per update")
+    for label in ("with snapshots", "without"):
+        if label == "without":
+            with database.get_connection() as conn:
+                conn.execute("DELETE FROM audit_log WHERE table_name = 'instruments' AND row_id = ? AND op = 'S'",
+                             (instrument_id,))
+        ms = measure(lambda: AuditRepository.as_of("instruments", instrument_id, start), repeat)["median_ms"]
+        print(f"{'as_of before ' + str(EDITS) + ' edits':<28}{ms:>8.2f} ms {label}")
+    ms = measure(lambda: AuditRepository.history("instruments", instrument_id), repeat)["median_ms"]
+    print(f"{'history of ' + str(EDITS) + ' edits':<28}{ms:>8.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cost of the audit log on writes, and of reading it back")
+    parser.add_argument("--db", help="database to copy and run against (default: generate one for --scale)")
+    parser.add_argument("--scale", choices=SCALES, default="medium")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "fleet.db")
+        if args.db:
+            # Rows are edited, so never in the database given.
+            _copy_database(args.db, db_path)
+        else:
+            print(f"generating {args.scale} fleet...", flush=True)
+            generate(db_path, *SCALES[args.scale], seed=args.seed)
+        database.DATABASE_PATH = db_path
+        database.init_db()
+        try:
+            run(args.repeat, args.seed)
+        finally:
+            database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
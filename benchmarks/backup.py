@@ -0,0 +1,136 @@
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+import backup
+import database
+from benchmarks.generate import SCALES, generate
+from benchmarks.suite import _copy_database
+from database import MaintenanceRepository
+
+# The writer's pace while a backup runs: one maintenance insert and delete
+# every WRITE_EVERY_S, about what a busy server sees.
+WRITE_EVERY_S = 0.01
+MODES = {
+    "file copy": None,
+    "backup, one step": 0,
+    "backup, 1024 pages": 1024,
+    f"backup, {backup.BACKUP_PAGES} pages": backup.BACKUP_PAGES,
+}
+
+
+class Writer(threading.Thread):
+    # Writes on its own connection and records each write's latency.
+    def __init__(self, instrument_id: int):
+        super().__init__(daemon=True)
+        self.instrument_id = instrument_id
+        self.latencies = []
+        self.errors = 0
+        self.done = threading.Event()
+
+    def run(self):
+        while not self.done.is_set():
+            start = time.perf_counter()
+            try:
+                MaintenanceRepository.delete(MaintenanceRepository.create(self.instrument_id, "2026-01-01", "Other"))
+            except sqlite3.OperationalError:
+                self.errors += 1
+            self.latencies.append((time.perf_counter() - start) * 1000)
+            time.sleep(WRITE_EVERY_S)
+
+    def stop(self):
+        self.done.set()
+        self.join()
+        latencies = sorted(self.latencies) or [0]
+        return latencies[len(latencies) // 2], latencies[-1], self.errors
+
+
+def copy_file(directory: str):
+    # What backing up meant before: a plain copy, torn if a write lands
+    # during it.
+    start = time.perf_counter()
+    shutil.copyfile(database.DATABASE_PATH, os.path.join(directory, "copy.db"))
+    seconds = time.perf_counter() - start
+    return {"copy_s": seconds, "restarts": 0, "lock_max_ms": float("nan"), "lock_median_ms": float("nan")}
+
+
+def run_modes(directory: str, writes: bool):
+    size = os.path.getsize(database.DATABASE_PATH) / 1e6
+    print(f"{'':<24}{'s':>7}{'MB/s':>8}{'lock max':>10}{'median':>8}{'restarts':>9}"
+          + (f"{'write p50':>11}{'max':>9}{'errors':>7}" if writes else ""))
+    for name, pages in MODES.items():
+        writer = Writer(1) if writes else None
+        if writer:
+            writer.start()
+            time.sleep(0.1)
+        if pages is None:
+            stats = copy_file(directory)
+        else:
+            stats = backup.create_backup(directory, compression=None, pages=pages)
+        line = (f"{name:<24}{stats['copy_s']:>7.2f}{size / stats['copy_s']:>8.0f}{stats['lock_max_ms']:>10.1f}"
+                f"{stats['lock_median_ms']:>8.1f}{stats['restarts']:>9}")
+        if writer:
+            p50, worst, errors = writer.stop()
+            line += f"{p50:>11.2f}{worst:>9.1f}{errors:>7}"
+        print(line)
+        for entry in os.listdir(directory):
+            path = os.path.join(directory, entry)
+            os.remove(path) if os.path.isfile(path) else shutil.rmtree(path)
+
+
+def run_compression(directory: str):
+    for compression in ("gzip", "xz"):
+        manifest = backup.create_backup(directory, compression=compression)
+        start = time.perf_counter()
+        problems = backup.verify_backup(os.path.join(directory, manifest["file"]))
+        verify = time.perf_counter() - start
+        print(f"{compression:<24}{manifest['bytes'] / 1e6:>7.1f} MB of {manifest['database_bytes'] / 1e6:.1f},"
+              f" backup {manifest['total_s']:.1f} s, verify {verify:.1f} s{' FAILED' if problems else ''}")
+
+
+def run(journal_modes):
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(database.DATABASE_PATH))) as out:
+        for mode in journal_modes:
+            # In WAL mode readers never block writers; with a rollback
+            # journal the backup's read lock does, for as long as a step.
+            database.configure(pragmas={**database.PRAGMA_PROFILE, "journal_mode": mode})
+            print(f"\njournal_mode={mode}, idle")
+            run_modes(out, writes=False)
+            print(f"journal_mode={mode}, one write every {WRITE_EVERY_S * 1000:.0f} ms")
+            run_modes(out, writes=True)
+        database.configure()
+        print("\ncompressed snapshots")
+        run_compression(out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backup throughput, lock-hold times and writer latency meanwhile")
+    parser.add_argument("--db", help="database to copy and run against (default: generate one for --scale)")
+    parser.add_argument("--scale", choices=SCALES, default="medium")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--journal", choices=("wal", "delete", "both"), default="both")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "fleet.db")
+        if args.db:
+            # The writer adds and removes rows, so never in the database given.
+            _copy_database(args.db, db_path)
+        else:
+            print(f"generating {args.scale} fleet...", flush=True)
+            generate(db_path, *SCALES[args.scale], seed=args.seed)
+        database.DATABASE_PATH = db_path
+        database.init_db()
+        database.query_cache.enabled = False
+        try:
+            run(("wal", "delete") if args.journal == "both" else (args.journal,))
+        finally:
+            database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import os
+import tempfile
+import time
+
+import database
+from benchmarks.connection import seed
+
+
+def navigate(ids, rounds: int):
+    # What the GUI asks for while a user flips between the type lists and
+    # instrument details, adding a maintenance record now and then.
+    for n in range(rounds):
+        instrument_id = ids[n % len(ids)]
+        instrument_type = ("LC", "GC", "GPC")[n % 3]
+        database.InstrumentRepository.get_page(instrument_type)
+        database.InstrumentRepository.get_by_id(instrument_id)
+        database.ColumnRepository.get_by_instrument(instrument_id)
+        database.MaintenanceRepository.get_page_by_instrument(instrument_id)
+        database.StatsRepository.get_dashboard()
+        database.MaintenanceRepository.get_recent(5)
+        if n % 10 == 9:
+            database.MaintenanceRepository.create(instrument_id, "2025-06-01", "Repair", "Pump seal")
+
+
+def run(rounds: int, instruments: int, maintenance_per_instrument: int, working_set: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE_PATH = os.path.join(tmp, "bench.db")
+        database.init_db()
+        ids = seed(instruments, maintenance_per_instrument)[:working_set]
+        results = {}
+        for enabled in (False, True):
+            database.query_cache.enabled = enabled
+            database.query_cache.clear()
+            database.query_cache.reset_stats()
+            start = time.perf_counter()
+            navigate(ids, rounds)
+            results[enabled] = (time.perf_counter() - start) / rounds * 1000
+        stats = database.query_cache.stats()
+        database.close_connections()
+    return results, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Repository read cache: navigation with and without the cache")
+    parser.add_argument("--rounds", type=int, default=2000)
+    parser.add_argument("--instruments", type=int, default=3000)
+    parser.add_argument("--maintenance", type=int, default=50, help="maintenance rows per instrument")
+    parser.add_argument("--working-set", type=int, default=20, help="instruments the user keeps going back to")
+    args = parser.parse_args()
+
+    results, stats = run(args.rounds, args.instruments, args.maintenance, args.working_set)
+    print(f"per navigation round: {results[False]:.2f} ms uncached, {results[True]:.2f} ms cached "
+          f"({results[False] / results[True]:.1f}x)")
+    print(f"hits {stats['hits']}, misses {stats['misses']}, hit rate {stats['hit_rate']:.0%}, "
+          f"invalidations {stats['invalidations']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from contextlib import contextmanager
+
+import database
+
+
+@contextmanager
+def legacy_connection():
+    # The old connect-per-call behaviour, kept here for comparison.
+    conn = sqlite3.connect(database.DATABASE_PATH)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def seed(instruments: int, maintenance_per_instrument: int):
+    ids = []
+    for i in range(instruments):
+        ids.append(database.InstrumentRepository.create(
+            name=f"Instrument {i:04d}",
+            instrument_type=("LC", "GC", "GPC")[i % 3],
+            model="1260 Infinity",
+            serial_number=f"SN{i:06d}",
+        ))
+    with database.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO maintenance (instrument_id, date, maintenance_type, description) VALUES (?, ?, ?, ?)",
+            [(inst_id, f"2025-{(n % 12) + 1:02d}-01", "Preventive", "Seal change")
+             for inst_id in ids for n in range(maintenance_per_instrument)],
+        )
+    return ids
+
+
+def scenarios(ids):
+    first = ids[0]
+    return [
+        ("InstrumentRepository.get_by_id", lambda: database.InstrumentRepository.get_by_id(first)),
+        ("InstrumentRepository.get_all(LC)", lambda: database.InstrumentRepository.get_all("LC")),
+        ("MaintenanceRepository.get_by_instrument", lambda: database.MaintenanceRepository.get_by_instrument(first)),
+        ("MaintenanceRepository.get_recent", lambda: database.MaintenanceRepository.get_recent(5)),
+        ("InstrumentRepository.update", lambda: database.InstrumentRepository.update(first, "Instrument 0000", "LC")),
+    ]
+
+
+def time_call(func, iterations: int):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def run(iterations: int, instruments: int, maintenance_per_instrument: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE_PATH = os.path.join(tmp, "bench.db")
+        # Measures the query path itself, not cache hits.
+        database.query_cache.enabled = False
+        database.init_db()
+        ids = seed(instruments, maintenance_per_instrument)
+        results = []
+        for name, func in scenarios(ids):
+            managed = time_call(func, iterations)
+            pooled_get_connection = database.get_connection
+            database.get_connection = legacy_connection
+            try:
+                legacy = time_call(func, iterations)
+            finally:
+                database.get_connection = pooled_get_connection
+            results.append((name, legacy, managed))
+        database.close_connections()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-call latency: connect-per-call vs. persistent connection")
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--instruments", type=int, default=300)
+    parser.add_argument("--maintenance", type=int, default=20, help="maintenance rows per instrument")
+    args = parser.parse_args()
+
+    print(f"{'scenario':<42}{'before (us)':>14}{'after (us)':>14}{'speedup':>10}")
+    for name, legacy, managed in run(args.iterations, args.instruments, args.maintenance):
+        print(f"{name:<42}{legacy:>14.1f}{managed:>14.1f}{legacy / managed:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
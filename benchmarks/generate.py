@@ -0,0 +1,167 @@
+import argparse
+import os
+import random
+import time
+from datetime import date
+
+import database
+
+# Named fleet sizes: (instruments, columns, maintenance records).
+SCALES = {
+    "small": (500, 5000, 20000),
+    "medium": (2000, 20000, 200000),
+    "large": (10000, 100000, 2000000),
+}
+
+INSTRUMENT_TYPES = [("LC", 50), ("GC", 35), ("GPC", 15)]
+MODELS = {
+    "Agilent": ["1260 Infinity II", "1290 Infinity II", "8890 GC", "7890B", "1260 GPC/SEC"],
+    "Waters": ["Acquity UPLC H-Class", "Alliance e2695", "Arc HPLC", "APC"],
+    "Shimadzu": ["Nexera X2", "Prominence-i", "GC-2030", "LC-20AD"],
+    "Thermo": ["Vanquish Flex", "UltiMate 3000", "TRACE 1310"],
+    "PerkinElmer": ["Clarus 690", "Flexar"],
+    "Malvern": ["OMNISEC", "Viscotek TDA"],
+}
+COLUMN_TYPES = {
+    "LC": ["C18", "C8", "HILIC", "Phenyl-Hexyl", "Biphenyl", "C4"],
+    "GC": ["DB-5", "DB-WAX", "HP-1", "DB-1701", "HP-PLOT Q"],
+    "GPC": ["PLgel Mixed-C", "PLgel Mixed-D", "Styragel HR4", "PolarGel-M"],
+}
+STATUSES = [("Active", 85), ("Service", 8), ("Out of order", 4), ("Retired", 3)]
+MAINTENANCE_TYPES = [("Preventive", 45), ("Repair", 25), ("Calibration", 20), ("Other", 10)]
+PEOPLE = ["Kari Nordmann", "Ola Hansen", "Ingrid Berg", "Per Olsen", "Service tekniker", "Anne Lie", "Jonas Dahl"]
+WORDS = ["pump", "seal", "lamp", "detector", "injector", "column", "leak", "pressure", "baseline", "noise",
+         "replaced", "cleaned", "calibrated", "checked", "septum", "liner", "ferrule", "valve", "rotor",
+         "degasser", "flow", "cell", "filter", "firmware", "update", "drift", "oven", "autosampler",
+         "purge", "needle", "seat", "capillary", "split", "carrier", "gas", "trap", "tubing", "fitting"]
+
+START = date(2000, 1, 1).toordinal()
+END = date(2025, 12, 31).toordinal()
+BATCH_SIZE = 50000
+
+
+def _weighted(rng, choices, k):
+    return rng.choices([value for value, _ in choices], weights=[weight for _, weight in choices], k=k)
+
+
+def _text(rng, low: int, high: int):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(low, high))]
+    return " ".join(words).capitalize() + "."
+
+
+def _date(ordinal: int):
+    return date.fromordinal(ordinal).isoformat()
+
+
+def _instruments(rng, count: int):
+    types = _weighted(rng, INSTRUMENT_TYPES, count)
+    statuses = _weighted(rng, STATUSES, count)
+    manufacturers = list(MODELS)
+    purchased = []
+    rows = []
+    for i in range(count):
+        manufacturer = rng.choice(manufacturers)
+        purchase = rng.randint(START, END - 365)
+        purchased.append(purchase)
+        notes = " ".join(_text(rng, 6, 20) for _ in range(rng.randint(1, 3))) if rng.random() < 0.3 else None
+        rows.append((f"{types[i]}-{i:05d}", types[i], rng.choice(MODELS[manufacturer]), manufacturer,
+                     f"SN{i:07d}", _date(purchase), notes, statuses[i]))
+    return rows, types, purchased
+
+
+def _columns(rng, count: int, types, purchased):
+    rows = []
+    for _ in range(count):
+        instrument = rng.randrange(len(types))
+        column_type = rng.choice(COLUMN_TYPES[types[instrument]])
+        length = rng.choice([5.0, 10.0, 15.0, 25.0, 30.0]) if types[instrument] != "GC" else rng.choice([15.0, 30.0, 60.0]) * 100
+        diameter = rng.choice([2.1, 3.0, 4.6, 7.5]) if types[instrument] != "GC" else rng.choice([0.25, 0.32, 0.53])
+        install = rng.randint(purchased[instrument], END)
+        rows.append((instrument + 1, f"{column_type} {length:g}x{diameter:g} #{rng.randint(1, 999):03d}", column_type,
+                     length, diameter, rng.choice(["80Å", "100Å", "120Å", "300Å", None]), _date(install),
+                     "Active" if rng.random() < 0.6 else "Retired",
+                     _text(rng, 3, 12) if rng.random() < 0.2 else None))
+    return rows
+
+
+def _maintenance(rng, count: int, purchased):
+    # Some instruments see far more service than others, and records bunch up
+    # towards recent years.
+    weights = [rng.paretovariate(1.5) for _ in purchased]
+    instruments = list(range(len(purchased)))
+    while count > 0:
+        size = min(count, BATCH_SIZE)
+        count -= size
+        picked = rng.choices(instruments, weights=weights, k=size)
+        kinds = _weighted(rng, MAINTENANCE_TYPES, size)
+        rows = []
+        for instrument, kind in zip(picked, kinds):
+            start = purchased[instrument]
+            day = start + int((END - start) * rng.random() ** 0.5)
+            cost = round(rng.lognormvariate(7, 1), 2) if rng.random() < 0.4 else None
+            rows.append((instrument + 1, _date(day), kind, _text(rng, 4, 40), rng.choice(PEOPLE), cost))
+        yield rows
+
+
+def generate(path: str, instruments: int, columns: int, maintenance: int, seed: int = 1, progress=None):
+    # Builds a fresh database at path. The same arguments always produce the
+    # same rows.
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    rng = random.Random(seed)
+    previous = database.DATABASE_PATH
+    database.DATABASE_PATH = path
+    try:
+        database.init_db()
+        with database.get_connection() as conn:
+            rows, types, purchased = _instruments(rng, instruments)
+            conn.executemany("""
+                INSERT INTO instruments (name, type, model, manufacturer, serial_number, purchase_date, notes, status)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            conn.executemany("""
+                INSERT INTO columns (instrument_id, name, column_type, length_cm, diameter_mm, pore_size,
+                                     install_date, status, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, _columns(rng, columns, types, purchased))
+            done = 0
+            for batch in _maintenance(rng, maintenance, purchased):
+                conn.executemany("""
+                    INSERT INTO maintenance (instrument_id, date, maintenance_type, description, performed_by, cost)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, batch)
+                done += len(batch)
+                if progress:
+                    progress(done, maintenance)
+            database.sync_search_index(conn)
+            conn.execute("ANALYZE")
+    finally:
+        database.close_connections()
+        database.DATABASE_PATH = previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic instrument database")
+    parser.add_argument("path")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--instruments", type=int)
+    parser.add_argument("--columns", type=int)
+    parser.add_argument("--maintenance", type=int)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    instruments, columns, maintenance = SCALES[args.scale]
+    start = time.perf_counter()
+    generate(
+        args.path,
+        args.instruments or instruments,
+        args.columns or columns,
+        args.maintenance or maintenance,
+        args.seed,
+        progress=lambda done, total: print(f"\r{done}/{total} maintenance records", end="", flush=True),
+    )
+    print(f"\ngenerated {args.path} in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import database
+from benchmarks.generate import SCALES, generate
+from benchmarks.suite import _copy_database, measure
+from database import DueRepository, MaintenanceRepository, PlanRepository
+
+PLANS_PER_INSTRUMENT = 20
+INTERVALS = (3, 6, 12, 24)
+KINDS = ("Preventive", "Calibration", "Repair", "Other")
+
+# The same question answered without maintenance_due: every plan paired with
+# every instrument it covers, and each pair's latest record looked up.
+RAW_OVERDUE = """
+    SELECT count(*) FROM maintenance_plans p JOIN instruments i ON i.type = p.instrument_type
+    WHERE date(coalesce(
+              (SELECT MAX(m.date) FROM maintenance m
+               WHERE m.instrument_id = i.id AND m.maintenance_type = p.maintenance_type),
+              i.purchase_date, date(p.created_at)),
+          '+' || p.interval_months || ' months') < date('now', 'localtime')
+"""
+
+
+def add_plans(rng):
+    # PLANS_PER_INSTRUMENT plans for every instrument type, so every
+    # instrument has that many due rows. Returns ms per plan.
+    with database.get_connection() as conn:
+        types = [row[0] for row in conn.execute("SELECT DISTINCT type FROM instruments")]
+    start = time.perf_counter()
+    for instrument_type in types:
+        for n in range(PLANS_PER_INSTRUMENT):
+            PlanRepository.create(KINDS[n % len(KINDS)], rng.choice(INTERVALS), instrument_type=instrument_type,
+                                  description=f"plan {n + 1}")
+    return (time.perf_counter() - start) * 1000 / (len(types) * PLANS_PER_INSTRUMENT)
+
+
+def run(repeat: int, seed: int):
+    database.query_cache.enabled = False
+    rng = random.Random(seed)
+    per_plan = add_plans(rng)
+    with database.get_connection() as conn:
+        due_rows = conn.execute("SELECT COUNT(*) FROM maintenance_due").fetchone()[0]
+        instruments = conn.execute("SELECT COUNT(*) FROM instruments").fetchone()[0]
+    print(f"{due_rows} due rows for {instruments} instruments; {per_plan:.0f} ms per type plan added")
+
+    scenarios = [
+        ("get_page(overdue)", lambda: DueRepository.get_page(-1)),
+        ("get_page(30 days)", lambda: DueRepository.get_page(30)),
+        ("get_page(all)", lambda: DueRepository.get_page(None)),
+        ("get_by_instrument", lambda: DueRepository.get_by_instrument(rng.randint(1, instruments))),
+        ("summary", lambda: DueRepository.summary()),
+    ]
+    for name, func in scenarios:
+        print(f"{name:<22}{measure(func, repeat)['median_ms']:>9.1f} ms")
+    with database.get_connection() as conn:
+        raw = measure(lambda: conn.execute(RAW_OVERDUE).fetchone(), 1, budget_s=0)["median_ms"]
+        print(f"{'overdue from history':<22}{raw:>9.1f} ms")
+        rebuild = measure(lambda: database.rebuild_due(conn), 1, budget_s=0)["median_ms"]
+        print(f"{'rebuild_due':<22}{rebuild:>9.1f} ms")
+
+    # Logging maintenance moves the due dates of that instrument's plans.
+    log = measure(lambda: MaintenanceRepository.create(
+        rng.randint(1, instruments), time.strftime("%Y-%m-%d"), rng.choice(KINDS)
+    ), repeat)["median_ms"]
+    print(f"{'maintenance insert':<22}{log:>9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Due-date queries from maintenance_due versus from the history")
+    parser.add_argument("--db", help="database to copy and run against (default: generate one for --scale)")
+    parser.add_argument("--scale", choices=SCALES, default="large")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "fleet.db")
+        if args.db:
+            # Plans are added, so never to the database given.
+            _copy_database(args.db, db_path)
+        else:
+            print(f"generating {args.scale} fleet...", flush=True)
+            start = time.perf_counter()
+            generate(db_path, *SCALES[args.scale], seed=args.seed)
+            print(f"generated in {time.perf_counter() - start:.0f} s")
+        database.DATABASE_PATH = db_path
+        database.init_db()
+        try:
+            run(args.repeat, args.seed)
+        finally:
+            database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
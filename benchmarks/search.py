@@ -0,0 +1,88 @@
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import database
+
+WORDS = ["pump", "seal", "lamp", "detector", "injector", "column", "leak", "pressure", "baseline", "noise",
+         "replaced", "cleaned", "calibrated", "checked", "septum", "liner", "ferrule", "valve", "rotor",
+         "degasser", "flow", "cell", "filter", "firmware", "update", "drift", "oven", "autosampler"]
+MANUFACTURERS = ["Agilent", "Waters", "Shimadzu", "Thermo", "PerkinElmer", "Malvern"]
+PEOPLE = ["Kari Nordmann", "Ola Hansen", "Ingrid Berg", "Per Olsen", "Service tekniker"]
+
+
+def seed(instruments: int, maintenance: int, rng):
+    with database.get_connection() as conn:
+        conn.executemany(
+            "INSERT INTO instruments (name, type, model, manufacturer, serial_number) VALUES (?, ?, ?, ?, ?)",
+            [(f"{('LC', 'GC', 'GPC')[i % 3]}-{i:05d}", ("LC", "GC", "GPC")[i % 3], f"Model {i % 40}",
+              rng.choice(MANUFACTURERS), f"SN{i:07d}") for i in range(instruments)],
+        )
+        batch = []
+        for n in range(maintenance):
+            description = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 14)))
+            batch.append((rng.randint(1, instruments), f"{rng.randint(2000, 2025)}-{rng.randint(1, 12):02d}-01",
+                          rng.choice(["Preventive", "Repair", "Calibration", "Other"]), description,
+                          rng.choice(PEOPLE)))
+            if len(batch) == 50000:
+                conn.executemany("INSERT INTO maintenance (instrument_id, date, maintenance_type, description, "
+                                 "performed_by) VALUES (?, ?, ?, ?, ?)", batch)
+                batch = []
+        if batch:
+            conn.executemany("INSERT INTO maintenance (instrument_id, date, maintenance_type, description, "
+                             "performed_by) VALUES (?, ?, ?, ?, ?)", batch)
+
+
+def keystrokes(text: str):
+    # Everything a search-as-you-type box would send while typing text.
+    return [text[:i] for i in range(2, len(text) + 1)]
+
+
+def run_keystrokes(verbose: bool):
+    timings = []
+    for text in ["agilent pump seal", "kari septum", "shimadzu liner leak", "sn00012", "gc-00042 rotor"]:
+        for query in keystrokes(text):
+            start = time.perf_counter()
+            database.SearchRepository.search(query)
+            elapsed = (time.perf_counter() - start) * 1000
+            timings.append(elapsed)
+            if verbose:
+                print(f"  {query!r:<24}{elapsed:8.1f} ms")
+    timings.sort()
+    print(f"{len(timings)} keystrokes: median {statistics.median(timings):.1f} ms, "
+          f"p95 {timings[int(len(timings) * 0.95)]:.1f} ms, max {timings[-1]:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search-as-you-type latency per keystroke")
+    parser.add_argument("--instruments", type=int, default=5000)
+    parser.add_argument("--maintenance", type=int, default=1000000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--keep", help="directory to keep the generated database in and reuse on later runs")
+    parser.add_argument("--verbose", action="store_true", help="print every keystroke")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.keep) as tmp:
+        database.DATABASE_PATH = os.path.join(args.keep or tmp, "search-bench.db")
+        if os.path.exists(database.DATABASE_PATH):
+            database.init_db()
+            run_keystrokes(args.verbose)
+            return
+        database.init_db()
+        start = time.perf_counter()
+        seed(args.instruments, args.maintenance, random.Random(args.seed))
+        print(f"seeded {args.maintenance} maintenance rows in {time.perf_counter() - start:.1f} s")
+        start = time.perf_counter()
+        with database.get_connection() as conn:
+            database.sync_search_index(conn)
+        print(f"indexed pending rows in {time.perf_counter() - start:.1f} s")
+
+        run_keystrokes(args.verbose)
+        database.close_connections()
+
+
+if __name__ == "__main__":
+    main()
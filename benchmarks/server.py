@@ -0,0 +1,114 @@
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.generate import generate
+from client import RemoteClient
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def start_server(db_path: str, group_max: int, readers: int):
+    # The server runs in its own process, so the client threads here do not
+    # compete with it for the GIL.
+    process = subprocess.Popen(
+        [sys.executable, MAIN, "--db", db_path, "serve", "--port", "0",
+         "--group-max", str(group_max), "--readers", str(readers)],
+        stdout=subprocess.PIPE, text=True,
+    )
+    line = process.stdout.readline()
+    if not line.startswith("lytter på "):
+        process.kill()
+        raise RuntimeError(f"server did not start: {line!r}")
+    return process, line.split()[-1]
+
+
+def client_loop(client, instruments: int, write_ratio: float, deadline: float, seed: int, latencies, errors):
+    # A technician's PC: mostly list and detail reads, with a maintenance
+    # record saved now and then.
+    rng = random.Random(seed)
+    while time.perf_counter() < deadline:
+        instrument_id = rng.randint(1, instruments)
+        if rng.random() < write_ratio:
+            kind = "write"
+            call = ("MaintenanceRepository", "create", instrument_id, "2025-06-01", "Repair", "Pump seal")
+        else:
+            kind = "read"
+            call = rng.choice((
+                ("InstrumentRepository", "get_page", rng.choice(("LC", "GC", "GPC"))),
+                ("InstrumentRepository", "get_detail", instrument_id),
+                ("MaintenanceRepository", "get_page_by_instrument", instrument_id),
+                ("StatsRepository", "get_dashboard"),
+            ))
+        start = time.perf_counter()
+        try:
+            client.call(*call)
+        except Exception:
+            errors.append(kind)
+            continue
+        latencies[kind].append(time.perf_counter() - start)
+
+
+def run(db_path: str, instruments: int, clients: int, seconds: float, write_ratio: float, group_max: int,
+        readers: int):
+    process, url = start_server(db_path, group_max, readers)
+    try:
+        client = RemoteClient(url)
+        latencies = {"read": [], "write": []}
+        errors = []
+        deadline = time.perf_counter() + seconds
+        threads = [
+            threading.Thread(target=client_loop,
+                             args=(client, instruments, write_ratio, deadline, n, latencies, errors))
+            for n in range(clients)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        process.terminate()
+        process.wait()
+    return latencies, errors
+
+
+def percentile(values, fraction: float):
+    if not values:
+        return 0.0
+    return sorted(values)[min(len(values) - 1, int(len(values) * fraction))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput of the JSON server with many concurrent clients")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--instruments", type=int, default=2000)
+    parser.add_argument("--maintenance", type=int, default=50000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--compare", action="store_true", help="also run with one write per transaction")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "server.db")
+        generate(db_path, args.instruments, args.instruments * 5, args.maintenance)
+        print(f"{args.clients} clients, {args.seconds:g} s, {args.write_ratio:.0%} writes")
+        print(f"{'mode':<22}{'ops/s':>9}{'reads/s':>9}{'writes/s':>10}"
+              f"{'read p50':>10}{'read p95':>10}{'write p50':>11}{'write p95':>11}{'errors':>8}")
+        modes = [("group commit", 100)] + ([("one write per commit", 1)] if args.compare else [])
+        for name, group_max in modes:
+            latencies, errors = run(db_path, args.instruments, args.clients, args.seconds, args.write_ratio,
+                                    group_max, args.readers)
+            reads, writes = latencies["read"], latencies["write"]
+            print(f"{name:<22}{(len(reads) + len(writes)) / args.seconds:>9.0f}{len(reads) / args.seconds:>9.0f}"
+                  f"{len(writes) / args.seconds:>10.0f}{percentile(reads, 0.5):>8.1f}ms{percentile(reads, 0.95):>8.1f}ms"
+                  f"{percentile(writes, 0.5):>9.1f}ms{percentile(writes, 0.95):>9.1f}ms{len(errors):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import database
+import instrumentation
+from benchmarks.generate import SCALES, generate
+
+# A scenario only counts as a regression when it is both this much slower
+# than the baseline and slower by more than the noise floor.
+DEFAULT_THRESHOLD = 1.25
+NOISE_FLOOR_MS = 0.05
+
+
+def measure(func, repeat: int, setup=None, budget_s: float = 10.0):
+    # Runs func up to repeat times (fewer if the time budget runs out) and
+    # returns timing statistics in milliseconds. setup() runs untimed first.
+    timings = []
+    deadline = time.perf_counter() + budget_s
+    while len(timings) < repeat and (not timings or time.perf_counter() < deadline):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        func(arg) if setup else func()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "runs": len(timings),
+        "median_ms": statistics.median(timings),
+        "p95_ms": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "min_ms": timings[0],
+    }
+
+
+def _copy_database(source: str, target: str):
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+
+
+def _sample_ids(conn):
+    busiest = conn.execute("""
+        SELECT instrument_id FROM maintenance GROUP BY instrument_id ORDER BY COUNT(*) DESC LIMIT 1
+    """).fetchone()[0]
+    median = conn.execute("SELECT id FROM instruments ORDER BY id LIMIT 1 OFFSET (SELECT COUNT(*) / 2 FROM instruments)").fetchone()[0]
+    column = conn.execute("SELECT id FROM columns ORDER BY id LIMIT 1").fetchone()[0]
+    record = conn.execute("SELECT id FROM maintenance WHERE instrument_id = ? LIMIT 1", (busiest,)).fetchone()[0]
+    name, last_id = conn.execute("SELECT name, id FROM instruments WHERE type = 'LC' ORDER BY name, id LIMIT 1 OFFSET 100").fetchone()
+    return {"busiest": busiest, "median": median, "column": column, "record": record, "cursor": (name, last_id)}
+
+
+def repository_scenarios(ids):
+    I, C, M = database.InstrumentRepository, database.ColumnRepository, database.MaintenanceRepository
+    S, Q = database.StatsRepository, database.SearchRepository
+    busiest, median = ids["busiest"], ids["median"]
+    return [
+        ("instruments.get_all", lambda: I.get_all()),
+        ("instruments.get_all(LC)", lambda: I.get_all("LC")),
+        ("instruments.get_page(LC)", lambda: I.get_page("LC")),
+        ("instruments.get_page(LC, after)", lambda: I.get_page("LC", after=ids["cursor"])),
+        ("instruments.get_by_id", lambda: I.get_by_id(median)),
+        ("instruments.get_detail(busiest)", lambda: I.get_detail(busiest)),
+        ("instruments.count", lambda: I.count()),
+        ("columns.get_by_instrument", lambda: C.get_by_instrument(median)),
+        ("columns.get_all", lambda: C.get_all()),
+        ("columns.get_page", lambda: C.get_page()),
+        ("columns.get_by_id", lambda: C.get_by_id(ids["column"])),
+        ("maintenance.get_by_instrument(busiest)", lambda: M.get_by_instrument(busiest)),
+        ("maintenance.get_page_by_instrument(busiest)", lambda: M.get_page_by_instrument(busiest)),
+        ("maintenance.get_recent", lambda: M.get_recent(5)),
+        ("maintenance.get_by_id", lambda: M.get_by_id(ids["record"])),
+        ("stats.get_dashboard", lambda: S.get_dashboard()),
+        ("stats.get_scope", lambda: S.get_scope("maintenance_month")),
+        ("search(agilent pump)", lambda: Q.search("agilent pump")),
+        ("search(sep)", lambda: Q.search("sep")),
+    ]
+
+
+def write_scenarios(ids):
+    I, C, M = database.InstrumentRepository, database.ColumnRepository, database.MaintenanceRepository
+    median = ids["median"]
+    created = {"instruments": [], "columns": [], "maintenance": []}
+
+    def create_instrument():
+        created["instruments"].append(I.create("Bench instrument", "LC", model="1260", serial_number="BENCH"))
+
+    def create_column():
+        created["columns"].append(C.create(median, "Bench column", column_type="C18", length_cm=15.0))
+
+    def create_maintenance():
+        created["maintenance"].append(M.create(median, "2025-06-01", "Repair", "Bench record", "Bench"))
+
+    def pop(table):
+        return lambda: created[table].pop()
+
+    return [
+        ("instruments.create", create_instrument, None),
+        ("instruments.update", lambda i: I.update(i, "Bench instrument 2", "GC"), lambda: created["instruments"][-1]),
+        ("instruments.delete", lambda i: I.delete(i), pop("instruments")),
+        ("columns.create", create_column, None),
+        ("columns.update", lambda c: C.update(c, "Bench column 2", status="Retired"), lambda: created["columns"][-1]),
+        ("columns.delete", lambda c: C.delete(c), pop("columns")),
+        ("maintenance.create", create_maintenance, None),
+        ("maintenance.update", lambda m: M.update(m, "2025-07-01", "Calibration", cost=10.0), lambda: created["maintenance"][-1]),
+        ("maintenance.delete", lambda m: M.delete(m), pop("maintenance")),
+    ]
+
+
+def run_database(db_path: str, repeat: int, heavy_repeat: int, results: dict):
+    import transfer
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work = os.path.join(tmp, "work.db")
+        _copy_database(db_path, work)
+        database.DATABASE_PATH = work
+        # Timings are for the query path; the read cache is measured by
+        # benchmarks.cache.
+        database.query_cache.enabled = False
+        database.init_db()
+        with database.get_connection() as conn:
+            ids = _sample_ids(conn)
+
+        for name, func in repository_scenarios(ids):
+            func()
+            results[f"repository.{name}"] = measure(func, repeat)
+        for name, func, setup in write_scenarios(ids):
+            results[f"repository.{name}"] = measure(func, repeat, setup=setup)
+
+        results["dashboard.get_dashboard"] = measure(database.StatsRepository.get_dashboard, repeat)
+        with database.get_connection() as conn:
+            results["dashboard.rebuild_stats"] = measure(lambda: database.rebuild_stats(conn), heavy_repeat)
+
+        from analytics import AnalyticsRepository
+        results["analytics.overview"] = measure(AnalyticsRepository.overview, repeat)
+        results["analytics.overview(12 months)"] = measure(
+            lambda: AnalyticsRepository.overview("2024-12-19", "2025-12-18"), repeat
+        )
+        with database.get_connection() as conn:
+            results["analytics.rebuild_rollups"] = measure(lambda: database.rebuild_rollups(conn), heavy_repeat)
+
+        # A plan per instrument type gives the due queries rows to read.
+        for instrument_type in ("LC", "GC", "GPC"):
+            database.PlanRepository.create("Calibration", 6, instrument_type=instrument_type)
+        results["due.get_page(30 days)"] = measure(lambda: database.DueRepository.get_page(30), repeat)
+        results["due.summary"] = measure(database.DueRepository.summary, repeat)
+
+        export_dir = os.path.join(tmp, "export")
+        results["transfer.export_all_to_csv"] = measure(
+            lambda: transfer.export_all_to_csv(export_dir), heavy_repeat, budget_s=120
+        )
+        results["transfer.export_all_to_csv(gzip)"] = measure(
+            lambda: transfer.export_all_to_csv(os.path.join(tmp, "export-gz"), compression="gzip"),
+            heavy_repeat, budget_s=120
+        )
+        database.close_connections()
+
+        def fresh_database():
+            target = os.path.join(tmp, "import.db")
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(target + suffix):
+                    os.remove(target + suffix)
+            database.close_connections()
+            database.DATABASE_PATH = target
+            database.init_db()
+
+        results["transfer.import_all_from_csv"] = measure(
+            lambda _: transfer.import_all_from_csv(export_dir), heavy_repeat, setup=fresh_database, budget_s=120
+        )
+        database.close_connections()
+        database.query_cache.enabled = True
+
+
+def _start_virtual_display():
+    # Returns (process, reason). Uses the existing display if there is one,
+    # otherwise starts Xvfb when it is installed.
+    if os.environ.get("DISPLAY"):
+        return None, None
+    xvfb = shutil.which("Xvfb")
+    if xvfb is None:
+        return None, "no DISPLAY and Xvfb is not installed"
+    display = ":97"
+    process = subprocess.Popen([xvfb, display, "-screen", "0", "1280x1024x24", "-nolisten", "tcp"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(0.5)
+    if process.poll() is not None:
+        return None, "Xvfb failed to start"
+    os.environ["DISPLAY"] = display
+    return process, None
+
+
+def run_views(db_path: str, repeat: int, results: dict):
+    process, reason = _start_virtual_display()
+    if reason:
+        return reason
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            work = os.path.join(tmp, "work.db")
+            _copy_database(db_path, work)
+            database.DATABASE_PATH = work
+            with database.get_connection() as conn:
+                ids = _sample_ids(conn)
+
+            from app import InstrumentApp
+
+            def settle(app):
+                # Done once every queued read has been rendered and Tk has
+                # drawn the result.
+                app.update()
+                while app.worker.busy:
+                    app.update()
+                    time.sleep(0.001)
+                app.update_idletasks()
+
+            start = time.perf_counter()
+            app = InstrumentApp()
+            settle(app)
+            results["views.startup"] = {"runs": 1, "median_ms": (time.perf_counter() - start) * 1000}
+            try:
+                screens = [
+                    ("dashboard", app.show_dashboard),
+                    ("list(LC)", lambda: app.show_instrument_list("LC")),
+                    ("detail(busiest)", lambda: app.show_instrument_detail(ids["busiest"])),
+                    ("detail(median)", lambda: app.show_instrument_detail(ids["median"])),
+                    ("columns", app.show_columns),
+                    ("due", app.show_due),
+                    ("analysis", app.show_analysis),
+                ]
+                for name, show in screens:
+                    # The first visit builds the view, later ones refresh it.
+                    start = time.perf_counter()
+                    show()
+                    settle(app)
+                    results[f"views.{name}.build"] = {"runs": 1, "median_ms": (time.perf_counter() - start) * 1000}
+                for name, show in screens:
+                    results[f"views.{name}.refresh"] = measure(lambda: (show(), settle(app)), repeat)
+            finally:
+                app.on_close()
+    finally:
+        database.close_connections()
+        if process is not None:
+            process.terminate()
+            process.wait()
+    return None
+
+
+def compare(results: dict, baseline: dict, threshold: float):
+    regressions = []
+    for name, current in sorted(results["scenarios"].items()):
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        ratio = current["median_ms"] / before["median_ms"] if before["median_ms"] else float("inf")
+        if ratio > threshold and current["median_ms"] - before["median_ms"] > NOISE_FLOOR_MS:
+            regressions.append((name, before["median_ms"], current["median_ms"], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Timed scenarios against a generated instrument database")
+    parser.add_argument("--db", help="database to run against (default: generate one for --scale)")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--heavy-repeat", type=int, default=3,
+                        help="runs for export, import and the stats and rollup rebuilds")
+    parser.add_argument("--no-views", action="store_true", help="skip the GUI view timings")
+    parser.add_argument("--out", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Keep the slow log of benchmark runs out of the working directory.
+        instrumentation.configure(log_path=os.path.join(tmp, "slow.jsonl"))
+        db_path = args.db
+        if db_path is None:
+            db_path = os.path.join(tmp, "fleet.db")
+            print(f"generating {args.scale} fleet...", flush=True)
+            generate(db_path, *SCALES[args.scale], seed=args.seed)
+
+        scenarios = {}
+        run_database(db_path, args.repeat, args.heavy_repeat, scenarios)
+        skipped = "disabled with --no-views" if args.no_views else run_views(db_path, args.repeat, scenarios)
+
+    results = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "scale": None if args.db else args.scale,
+            "database": args.db,
+            "seed": args.seed,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "schema_version": database.SCHEMA_VERSION,
+            "views_skipped": skipped,
+        },
+        "scenarios": scenarios,
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    width = max(len(name) for name in scenarios)
+    for name, timing in sorted(scenarios.items()):
+        print(f"{name:<{width}}  {timing['median_ms']:10.3f} ms  ({timing['runs']} runs)")
+    if skipped:
+        print(f"view timings skipped: {skipped}")
+    print(f"results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after, ratio in regressions:
+            print(f"REGRESSION {name}: {before:.3f} ms -> {after:.3f} ms ({ratio:.2f}x)")
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions against {args.baseline} (threshold {args.threshold:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+
+
+def _copy(value):
+    # Cached results are handed out as fresh containers so a caller editing
+    # one cannot change what the next caller gets. Lists hold flat row dicts,
+    # for which a shallow dict() copy is enough.
+    if isinstance(value, list):
+        return [dict(item) if type(item) is dict else _copy(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return tuple(_copy(item) for item in value)
+    return value
+
+
+# Bounded LRU cache for query results. Every entry remembers the generation of
+# each table it was read from; writes bump those generations, which turns the
+# entry into a miss on its next lookup instead of hunting entries down.
+class QueryCache:
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.enabled = True
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _snapshot(self, tables):
+        return (self._epoch, *(self._generations.get(table, 0) for table in tables))
+
+    def get(self, key, tables, load):
+        with self._lock:
+            snapshot = self._snapshot(tables)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == snapshot:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _copy(entry[1])
+            self.misses += 1
+        # Loaded outside the lock. A write landing meanwhile has already moved
+        # the generations past snapshot, so the stored entry is simply stale.
+        value = load()
+        with self._lock:
+            self._entries[key] = (snapshot, _copy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, *tables):
+        with self._lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+            self.invalidations += 1
+
+    def invalidate_all(self):
+        with self._lock:
+            self._epoch += 1
+            self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._epoch += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries),
+                "maxsize": self.maxsize,
+            }
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.invalidations = 0
@@ -0,0 +1,86 @@
+import http.client
+import json
+import threading
+from urllib.parse import urlsplit
+
+import database
+from server import READS, WRITES, repository_class
+
+
+class RemoteError(Exception):
+    pass
+
+
+class RemoteClient:
+    # Calls repository methods on a server.py instance. Each thread keeps its
+    # own keep-alive connection.
+    def __init__(self, url: str, timeout: float = 30):
+        parts = urlsplit(url if "://" in url else f"http://{url}")
+        self.url = url
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn
+
+    def _drop(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def request(self, method: str, path: str, body=None, retry: bool = False):
+        data = None if body is None else json.dumps(body).encode("utf-8")
+        headers = {"Content-Type": "application/json"} if data is not None else {}
+        try:
+            conn = self._connection()
+            conn.request(method, path, data, headers)
+            response = conn.getresponse()
+            payload = response.read()
+        except (http.client.HTTPException, OSError) as e:
+            self._drop()
+            # An idle keep-alive connection may have been closed by the
+            # server; only reads are safe to send again.
+            if retry:
+                return self.request(method, path, body)
+            raise RemoteError(f"Ingen kontakt med {self.url}: {e}") from None
+        try:
+            result = json.loads(payload)
+        except ValueError:
+            raise RemoteError(f"Ugyldig svar fra {self.url} ({response.status})") from None
+        if response.status == 409:
+            raise database.ConflictError(result.get("error"))
+        if response.status != 200:
+            raise RemoteError(result.get("error") or f"HTTP {response.status}")
+        return result
+
+    def call(self, repository: str, method: str, *args, **kwargs):
+        retry = method in READS.get(repository, ())
+        # The server logs writes under this machine's address, with this
+        # user@host next to it as what the client claims to be.
+        body = {"args": args, "kwargs": kwargs, "actor": database.current_actor()}
+        return self.request("POST", f"/{repository}/{method}", body, retry)["result"]
+
+    def health(self):
+        return self.request("GET", "/health", retry=True)
+
+    def data_version(self):
+        return self.request("GET", "/version", retry=True)["version"]
+
+
+def install(client: RemoteClient):
+    # Points the repository classes at the server, so everything that calls
+    # them (views, dialogs, the worker) works unchanged in client mode. Must
+    # run before any view is built.
+    for operations in (READS, WRITES):
+        for repository, methods in operations.items():
+            cls = repository_class(repository)
+            for method in methods:
+                setattr(cls, method, staticmethod(
+                    lambda *args, _r=repository, _m=method, **kwargs: client.call(_r, _m, *args, **kwargs)
+                ))
@@ -1,27 +1,341 @@
+import atexit
+import contextvars
+import getpass
+import json
+import re
+import socket
 import sqlite3
-from datetime import datetime
+import threading
+from datetime import date, datetime, timezone
 from typing import Optional
 from contextlib import contextmanager
+from functools import wraps
+
+import instrumentation
+from cache import QueryCache
 
 DATABASE_PATH = "instruments.db"
 
+# Applied to every connection the manager opens. cache_size is negative,
+# i.e. KiB rather than pages.
+PRAGMA_PROFILE = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "cache_size": -16000,
+    "mmap_size": 128 * 1024 * 1024,
+    "busy_timeout": 5000,
+}
+STATEMENT_CACHE_SIZE = 128
 
-@contextmanager
-def get_connection():
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
+
+class ConflictError(Exception):
+    # Raised by update() when the row changed (or vanished) since the caller
+    # read the version it passed as expected_version.
+    pass
+
+
+def _local_actor():
     try:
-        yield conn
-        conn.commit()
+        user = getpass.getuser()
     except Exception:
-        conn.rollback()
-        raise
+        user = "ukjent"
+    return f"{user}@{socket.gethostname()}"
+
+
+# Who the audit log records as making a change ("user@host"): whoever runs
+# this process, unless acting_as() says otherwise. The server does so for
+# each client's writes, naming the client by its address; the user@host
+# the client says it is cannot be checked, so it is kept apart as what the
+# client claimed. Write transactions hand both to the audit triggers
+# through audit_session.
+LOCAL_ACTOR = _local_actor()
+_actor = contextvars.ContextVar("actor", default=(None, None))
+
+
+def current_actor() -> str:
+    return _actor.get()[0] or LOCAL_ACTOR
+
+
+def claimed_actor() -> Optional[str]:
+    return _actor.get()[1]
+
+
+@contextmanager
+def acting_as(actor: Optional[str], claimed: Optional[str] = None):
+    token = _actor.set((actor, claimed))
+    try:
+        yield
     finally:
+        _actor.reset(token)
+
+
+class ConnectionManager:
+    def __init__(self, path: Optional[str] = None, pragmas: Optional[dict] = None,
+                 cached_statements: Optional[int] = None, on_commit=None):
+        self.path = path
+        self.pragmas = pragmas
+        self.cached_statements = cached_statements
+        # on_commit(tables, external) runs after every transaction that
+        # changed something: tables are those passed to touch(), or None when
+        # rows changed without being declared; external is True when another
+        # connection committed since the last check.
+        self.on_commit = on_commit
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._version_lock = threading.Lock()
+        self._watch = None
+        self._seen_version = None
+        # Number of commits by other connections seen so far; watchers compare
+        # it with the value they saw last.
+        self.external_count = 0
+
+    def _target_path(self):
+        return self.path or DATABASE_PATH
+
+    def _open(self, path: str):
+        conn = sqlite3.connect(
+            path,
+            cached_statements=self.cached_statements or STATEMENT_CACHE_SIZE,
+            check_same_thread=False,
+            factory=instrumentation.TracedConnection,
+        )
+        conn.row_factory = sqlite3.Row
+        for name, value in (self.pragmas or PRAGMA_PROFILE).items():
+            conn.execute(f"PRAGMA {name}={value}").fetchall()
+        with self._lock:
+            self._connections.add(conn)
+        return conn
+
+    def connection(self):
+        local = self._local
+        path = self._target_path()
+        conn = getattr(local, "conn", None)
+        if conn is not None and local.path != path:
+            self.close()
+            conn = None
+        if conn is None:
+            conn = self._open(path)
+            local.conn = conn
+            local.path = path
+            local.depth = 0
+            local.touched = set()
+            local.acting = False
+        return conn
+
+    def touch(self, *tables):
+        # Declares the tables the current transaction writes to, and who
+        # writes them.
+        self._local.touched.update(tables)
+        self.record_actor()
+
+    def record_actor(self):
+        # Fills in audit_session for the audit triggers. It is emptied again
+        # before the commit, so no other connection ever sees it filled.
+        self._local.conn.execute("INSERT OR REPLACE INTO audit_session (id, actor, claimed) VALUES (1, ?, ?)",
+                                 (current_actor(), claimed_actor()))
+        self._local.acting = True
+
+    def clear_actor(self):
+        local = self._local
+        if local.acting and local.conn.in_transaction:
+            local.conn.execute("DELETE FROM audit_session")
+        local.acting = False
+
+    def in_transaction(self):
+        conn = getattr(self._local, "conn", None)
+        return conn is not None and conn.in_transaction
+
+    def _data_version(self):
+        # PRAGMA data_version only moves for commits made by *other*
+        # connections, so it is read on a connection that never writes.
+        path = self._target_path()
+        if self._watch is None or self._watch[0] != path:
+            if self._watch is not None:
+                self._watch[1].close()
+            self._watch = (path, sqlite3.connect(path, check_same_thread=False))
+            self._seen_version = None
+        return self._watch[1].execute("PRAGMA data_version").fetchone()[0]
+
+    def external_changes(self):
+        with self._version_lock:
+            version = self._data_version()
+            changed = self._seen_version is not None and version != self._seen_version
+            self._seen_version = version
+            if changed:
+                self.external_count += 1
+        if changed and self.on_commit is not None:
+            self.on_commit(set(), True)
+        return changed
+
+    def _finish(self, conn, commit: bool):
+        local = self._local
+        changed = conn.total_changes != local.changes
+        touched, local.touched = local.touched, set()
+        external = False
+        if commit:
+            self.clear_actor()
+        local.acting = False
+        if conn.in_transaction and not commit:
+            conn.rollback()
+        elif conn.in_transaction:
+            # Our own commit moves data_version as well; checking just before
+            # and re-reading just after keeps it from looking external.
+            with self._version_lock:
+                version = self._data_version()
+                external = self._seen_version is not None and version != self._seen_version
+                conn.commit()
+                self._seen_version = self._data_version()
+                if external:
+                    self.external_count += 1
+        if self.on_commit is not None and (changed or external):
+            if changed and not touched:
+                touched = None
+            self.on_commit(touched, external)
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connection()
+        local = self._local
+        if local.depth == 0:
+            local.changes = conn.total_changes
+        local.depth += 1
+        try:
+            yield conn
+            if local.depth == 1:
+                self._finish(conn, commit=True)
+        except Exception:
+            if local.depth == 1:
+                self._finish(conn, commit=False)
+            raise
+        finally:
+            local.depth -= 1
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            return
+        self._local.conn = None
+        with self._lock:
+            self._connections.discard(conn)
         conn.close()
 
+    @contextmanager
+    def dedicated(self):
+        # A private connection outside the per-thread pool, for work that
+        # wants its own snapshot (e.g. parallel exports).
+        conn = self._open(self._target_path())
+        try:
+            yield conn
+        finally:
+            with self._lock:
+                self._connections.discard(conn)
+            conn.close()
+
+    def close_all(self):
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for conn in connections:
+            conn.close()
+        with self._version_lock:
+            if self._watch is not None:
+                self._watch[1].close()
+                self._watch = None
+        self._local = threading.local()
+
+
+# Repository reads go through query_cache. Writes invalidate the tables they
+# touch once their transaction ends; commits from other processes are picked
+# up through PRAGMA data_version and drop everything.
+query_cache = QueryCache()
+
+
+def _invalidate_cache(tables, external):
+    if external or tables is None:
+        query_cache.invalidate_all()
+    elif tables:
+        query_cache.invalidate(*tables)
+
+
+def cached(*tables):
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not query_cache.enabled or connection_manager.in_transaction():
+                # Reads inside a write transaction may see uncommitted rows.
+                return func(*args, **kwargs)
+            # Drops the whole cache (via on_commit) if another process wrote.
+            connection_manager.external_changes()
+            key = (func.__qualname__, args, tuple(sorted(kwargs.items())))
+            return query_cache.get(key, tables, lambda: func(*args, **kwargs))
+        return wrapper
+    return decorate
+
+
+def writes(*tables):
+    indexed = bool(SEARCH_TABLES.intersection(tables))
+
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_connection() as conn:
+                connection_manager.touch(*tables)
+                result = func(*args, **kwargs)
+                if indexed:
+                    # The search index catches up in the writing transaction,
+                    # so searching never has to write.
+                    sync_search_index(conn)
+                return result
+        return wrapper
+    return decorate
+
+
+connection_manager = ConnectionManager(on_commit=_invalidate_cache)
+
+
+def configure(path: Optional[str] = None, pragmas: Optional[dict] = None,
+              cached_statements: Optional[int] = None):
+    global connection_manager
+    connection_manager.close_all()
+    query_cache.clear()
+    connection_manager = ConnectionManager(path, pragmas, cached_statements, on_commit=_invalidate_cache)
+    return connection_manager
+
+
+def close_connections():
+    connection_manager.close_all()
+
+
+def external_change_count():
+    # Cheap enough to poll: one PRAGMA data_version on the watch connection.
+    connection_manager.external_changes()
+    return connection_manager.external_count
+
+
+atexit.register(close_connections)
+
+
+@contextmanager
+def get_connection():
+    # Nested use on the same thread joins the outer transaction; only the
+    # outermost block commits or rolls back.
+    with connection_manager.transaction() as conn:
+        yield conn
+
+
+def explain_query(sql: str, shape):
+    with get_connection() as conn:
+        return instrumentation.explain(conn, sql, shape)
+
 
 def init_db():
     with get_connection() as conn:
+        # An up-to-date user_version means the tables and every migration are
+        # in place, so a normal start costs one PRAGMA.
+        if schema_version(conn) == SCHEMA_VERSION:
+            return
         conn.execute("""
             CREATE TABLE IF NOT EXISTS instruments (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -65,10 +379,855 @@ def init_db():
                 FOREIGN KEY (instrument_id) REFERENCES instruments(id) ON DELETE CASCADE
             )
         """)
+    migrate()
+
+
+# search_index holds one row per instrument, column and maintenance record.
+# The rowid encodes both the source table and its id. Columns and
+# maintenance carry their instrument's name, manufacturer, model and serial
+# number as "context", so a query like "agilent pump seal" finds the
+# maintenance record on the Agilent.
+#
+# Triggers only record which index rows are stale in search_pending; the
+# index itself is brought up to date set-wise by sync_search_index(), which
+# @writes runs at the end of every write to SEARCH_TABLES (and the importer
+# at the end of an import). Writing FTS5 rows from row-level triggers would
+# flush a tiny index segment per statement and make bulk writes several
+# times slower.
+#
+# search_titles repeats just the titles under the same rowids. A title-only
+# walk over search_index would have to scan every hit of the other columns
+# to find the few title hits; the separate table answers it from its own
+# small doclists.
+SEARCH_KINDS = {"instrument": 0, "column": 1, "maintenance": 2}
+SEARCH_TABLES = {"instruments", "columns", "maintenance"}
+SEARCH_CANDIDATES = 200
+
+
+def _search_rowid(id_expr: str, kind: str) -> str:
+    return f"({id_expr}) * 4 + {SEARCH_KINDS[kind]}"
+
+
+_INSTRUMENT_BODY = ("coalesce({t}.model, '') || ' ' || coalesce({t}.manufacturer, '') || ' ' || "
+                    "coalesce({t}.serial_number, '') || ' ' || coalesce({t}.notes, '')")
+_INSTRUMENT_CONTEXT = ("coalesce({t}.name, '') || ' ' || coalesce({t}.manufacturer, '') || ' ' || "
+                       "coalesce({t}.model, '') || ' ' || coalesce({t}.serial_number, '')")
+_COLUMN_BODY = "coalesce({t}.column_type, '') || ' ' || coalesce({t}.notes, '')"
+_MAINTENANCE_TITLE = "{t}.date || ' ' || {t}.maintenance_type"
+_MAINTENANCE_BODY = "coalesce({t}.description, '') || ' ' || coalesce({t}.performed_by, '')"
+
+
+def _search_rows_sql(where_instruments: str, where_columns: str, where_maintenance: str):
+    return [
+        f"""
+            INSERT INTO search_index (rowid, kind, ref_id, instrument_id, title, body, context)
+            SELECT {_search_rowid("i.id", "instrument")}, 'instrument', i.id, i.id, i.name,
+                   {_INSTRUMENT_BODY.format(t="i")}, i.type
+            FROM instruments i {where_instruments}
+        """,
+        f"""
+            INSERT INTO search_index (rowid, kind, ref_id, instrument_id, title, body, context)
+            SELECT {_search_rowid("c.id", "column")}, 'column', c.id, c.instrument_id, c.name,
+                   {_COLUMN_BODY.format(t="c")}, {_INSTRUMENT_CONTEXT.format(t="i")}
+            FROM columns c LEFT JOIN instruments i ON i.id = c.instrument_id {where_columns}
+        """,
+        f"""
+            INSERT INTO search_index (rowid, kind, ref_id, instrument_id, title, body, context)
+            SELECT {_search_rowid("m.id", "maintenance")}, 'maintenance', m.id, m.instrument_id,
+                   {_MAINTENANCE_TITLE.format(t="m")}, {_MAINTENANCE_BODY.format(t="m")},
+                   {_INSTRUMENT_CONTEXT.format(t="i")}
+            FROM maintenance m LEFT JOIN instruments i ON i.id = m.instrument_id {where_maintenance}
+        """,
+    ]
+
+
+def rebuild_search_index(conn):
+    conn.execute("DELETE FROM search_index")
+    conn.execute("DELETE FROM search_pending")
+    for sql in _search_rows_sql("", "", ""):
+        conn.execute(sql)
+    conn.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+
+
+def rebuild_search_titles(conn):
+    conn.execute("DELETE FROM search_titles")
+    conn.execute("INSERT INTO search_titles (rowid, title) SELECT rowid, title FROM search_index")
+    conn.execute("INSERT INTO search_titles (search_titles) VALUES ('optimize')")
+
+
+def sync_search_index(conn):
+    if conn.execute("SELECT NOT EXISTS (SELECT 1 FROM search_pending)").fetchone()[0]:
+        return 0
+    conn.execute("DELETE FROM search_index WHERE rowid IN (SELECT rowid FROM search_pending)")
+    conn.execute("DELETE FROM search_titles WHERE rowid IN (SELECT rowid FROM search_pending)")
+    pending = "JOIN search_pending p ON p.rowid = {}"
+    for sql in _search_rows_sql(
+        pending.format(_search_rowid("i.id", "instrument")),
+        pending.format(_search_rowid("c.id", "column")),
+        pending.format(_search_rowid("m.id", "maintenance")),
+    ):
+        conn.execute(sql)
+    conn.execute("""
+        INSERT INTO search_titles (rowid, title)
+        SELECT rowid, title FROM search_index WHERE rowid IN (SELECT rowid FROM search_pending)
+    """)
+    return conn.execute("DELETE FROM search_pending").rowcount
+
+
+def _search_triggers():
+    statements = []
+    for table, kind, columns in (
+        ("instruments", "instrument", "name, type, model, manufacturer, serial_number, notes"),
+        ("columns", "column", "instrument_id, name, column_type, notes"),
+        ("maintenance", "maintenance", "instrument_id, date, maintenance_type, description, performed_by"),
+    ):
+        for event, ref in (("INSERT", "new"), (f"UPDATE OF {columns}", "new"), ("DELETE", "old")):
+            name = f"search_{table}_{event.split()[0].lower()}"
+            statements.append(f"""
+                CREATE TRIGGER {name} AFTER {event} ON {table} BEGIN
+                    INSERT OR IGNORE INTO search_pending (rowid) VALUES ({_search_rowid(f"{ref}.id", kind)});
+                END
+            """)
+    # Children repeat their instrument's identity in "context".
+    statements.append(f"""
+        CREATE TRIGGER search_instruments_context AFTER UPDATE OF name, model, manufacturer, serial_number
+        ON instruments
+        WHEN old.name IS NOT new.name OR old.model IS NOT new.model
+             OR old.manufacturer IS NOT new.manufacturer OR old.serial_number IS NOT new.serial_number
+        BEGIN
+            INSERT OR IGNORE INTO search_pending (rowid)
+            SELECT {_search_rowid("id", "column")} FROM columns WHERE instrument_id = new.id
+            UNION ALL
+            SELECT {_search_rowid("id", "maintenance")} FROM maintenance WHERE instrument_id = new.id;
+        END
+    """)
+    return statements
+
+
+# Dashboard figures are kept in the stats table by triggers, so reading them
+# costs a handful of rows however large the tables grow. Each scope counts the
+# rows of one table per key and sums a value; rebuild_stats recomputes all of
+# it from the base tables if the two ever disagree.
+STATS_SCOPES = {
+    # scope: (table, key expression, summed value, columns the trigger watches)
+    "instrument_type": ("instruments", "{t}.type", "0", "type"),
+    "instrument_status": ("instruments", "coalesce({t}.status, '')", "0", "status"),
+    "column_status": ("columns", "coalesce({t}.status, '')", "0", "status"),
+    "maintenance_month": ("maintenance", "substr({t}.date, 1, 7)", "coalesce({t}.cost, 0)", "date, cost"),
+}
+
+_STATS_UPSERT = """
+    INSERT INTO stats (scope, key, count, total) VALUES ('{scope}', {key}, {sign}1, {sign}{value})
+    ON CONFLICT (scope, key) DO UPDATE SET count = count + excluded.count, total = total + excluded.total;
+"""
+
+
+def rebuild_stats(conn):
+    conn.execute("DELETE FROM stats")
+    for scope, (table, key, value, _) in STATS_SCOPES.items():
+        conn.execute(f"""
+            INSERT INTO stats (scope, key, count, total)
+            SELECT '{scope}', {key.format(t=table)}, COUNT(*), SUM({value.format(t=table)})
+            FROM {table} GROUP BY 2
+        """)
+
+
+def _stats_triggers():
+    statements = []
+    for table in ("instruments", "columns", "maintenance"):
+        scopes = [(scope, spec) for scope, spec in STATS_SCOPES.items() if spec[0] == table]
+
+        def upserts(ref, sign):
+            return "".join(
+                _STATS_UPSERT.format(scope=scope, key=key.format(t=ref), value=value.format(t=ref), sign=sign)
+                for scope, (_, key, value, _) in scopes
+            )
+
+        watched = ", ".join(dict.fromkeys(c.strip() for _, spec in scopes for c in spec[3].split(",")))
+        statements.append(f"CREATE TRIGGER stats_{table}_insert AFTER INSERT ON {table} BEGIN {upserts('new', '+')} END")
+        statements.append(f"CREATE TRIGGER stats_{table}_delete AFTER DELETE ON {table} BEGIN {upserts('old', '-')} END")
+        statements.append(f"""
+            CREATE TRIGGER stats_{table}_update AFTER UPDATE OF {watched} ON {table} BEGIN
+                {upserts('old', '-')}{upserts('new', '+')}
+            END
+        """)
+    return statements
+
+
+# Maintenance analytics (analytics.py) read time-bucketed rollups instead of
+# the raw rows: count and cost per month and maintenance type, and per
+# instrument and year with the number of repairs. Triggers keep both up to
+# date; rebuild_rollups recomputes them from maintenance.
+REPAIR_TYPES = ("Repair",)
+ROLLUPS = {
+    # table: (key columns, key expressions, extra summed columns)
+    "maintenance_monthly": ("month, maintenance_type", "substr({t}.date, 1, 7), {t}.maintenance_type", {}),
+    "maintenance_yearly": ("year, instrument_id", "substr({t}.date, 1, 4), {t}.instrument_id", {
+        "repairs": "({t}.maintenance_type IN (" + ", ".join(f"'{kind}'" for kind in REPAIR_TYPES) + "))",
+    }),
+}
+
+
+def _rollup_upserts(ref: str, sign: str):
+    statements = []
+    for table, (keys, values, extra) in ROLLUPS.items():
+        columns = "".join(f", {name}" for name in extra)
+        sums = "".join(f", {sign}{value.format(t=ref)}" for value in extra.values())
+        updates = "".join(f", {name} = {name} + excluded.{name}" for name in extra)
+        statements.append(f"""
+            INSERT INTO {table} ({keys}, count, total{columns})
+            VALUES ({values.format(t=ref)}, {sign}1, {sign}coalesce({ref}.cost, 0){sums})
+            ON CONFLICT ({keys}) DO UPDATE SET count = count + excluded.count, total = total + excluded.total{updates};
+        """)
+    return "".join(statements)
+
+
+def rebuild_rollups(conn):
+    for table, (keys, values, extra) in ROLLUPS.items():
+        columns = "".join(f", {name}" for name in extra)
+        sums = "".join(f", SUM({value.format(t='m')})" for value in extra.values())
+        conn.execute(f"DELETE FROM {table}")
+        conn.execute(f"""
+            INSERT INTO {table} ({keys}, count, total{columns})
+            SELECT {values.format(t='m')}, COUNT(*), SUM(coalesce(m.cost, 0)){sums}
+            FROM maintenance m GROUP BY 1, 2
+        """)
+
+
+def _rollup_triggers():
+    return [
+        f"CREATE TRIGGER rollup_maintenance_insert AFTER INSERT ON maintenance BEGIN {_rollup_upserts('new', '+')} END",
+        f"CREATE TRIGGER rollup_maintenance_delete AFTER DELETE ON maintenance BEGIN {_rollup_upserts('old', '-')} END",
+        f"""
+            CREATE TRIGGER rollup_maintenance_update AFTER UPDATE OF instrument_id, date, maintenance_type, cost
+            ON maintenance BEGIN
+                {_rollup_upserts('old', '-')}{_rollup_upserts('new', '+')}
+            END
+        """,
+    ]
+
+
+# Every insert, update and delete on the main tables is logged in changes
+# with an ever-increasing seq, so readers can ask what happened since the
+# last seq they saw instead of re-reading everything. Old entries are removed
+# by ChangeRepository.compact().
+CHANGE_TABLES = ("instruments", "columns", "maintenance")
+CHANGES_KEEP_DAYS = 30
+CHANGES_KEEP_ROWS = 500_000
+
+
+def _change_triggers(tables=CHANGE_TABLES):
+    statements = []
+    for table in tables:
+        for event, ref in (("INSERT", "new"), ("UPDATE", "new"), ("DELETE", "old")):
+            statements.append(f"""
+                CREATE TRIGGER changes_{table}_{event.lower()} AFTER {event} ON {table} BEGIN
+                    INSERT INTO changes (table_name, row_id, op) VALUES ('{table}', {ref}.id, '{event.lower()}');
+                END
+            """)
+    return statements
+
+
+# A maintenance plan says how often one instrument (instrument_id) or every
+# instrument of a type (instrument_type) needs a kind of maintenance. An
+# instrument's own plan replaces its type's plans for the same kind.
+# maintenance_due has a row per instrument and plan that applies to it, with
+# the last such maintenance and the due date that follows, so "what is due
+# before X" is a range read on idx_due_date. Triggers keep the rows current
+# as maintenance is logged and plans and instruments change.
+_DUE_DATE = "date(coalesce(date({last}), since), '+' || interval_months || ' months')"
+_NOT_OVERRIDDEN = ("NOT EXISTS (SELECT 1 FROM maintenance_plans o "
+                   "WHERE o.instrument_id = i.id AND o.maintenance_type = p.maintenance_type)")
+
+
+def _insert_due(source: str):
+    # source is the FROM and WHERE pairing plans p with instruments i. The
+    # OFFSET keeps SQLite from flattening the subquery, which would look up
+    # the last record twice per row.
+    return f"""
+        INSERT INTO maintenance_due
+            (plan_id, instrument_id, maintenance_type, interval_months, since, last_date, due_date)
+        SELECT *, {_DUE_DATE.format(last="last_date")} FROM (
+            SELECT p.id, i.id, p.maintenance_type, p.interval_months,
+                   coalesce(date(i.purchase_date), date(p.created_at)) AS since,
+                   (SELECT m.date FROM maintenance m INDEXED BY idx_maintenance_instrument_date
+                    WHERE m.instrument_id = i.id AND m.maintenance_type = p.maintenance_type
+                    ORDER BY m.date DESC LIMIT 1) AS last_date
+            {source}
+            LIMIT -1 OFFSET 0
+        );
+    """
+
+
+_OWN_PLANS = "FROM maintenance_plans p JOIN instruments i ON i.id = p.instrument_id"
+_TYPE_PLANS = (f"FROM maintenance_plans p JOIN instruments i ON i.type = p.instrument_type "
+               f"WHERE p.instrument_id IS NULL AND {_NOT_OVERRIDDEN}")
+
+
+def _due_for_instrument(ref: str):
+    # All due rows of one instrument, from its own plans and its type's.
+    return f"""
+        DELETE FROM maintenance_due WHERE instrument_id = {ref};
+        {_insert_due(f"{_OWN_PLANS} WHERE p.instrument_id = {ref}")}
+        {_insert_due(f"{_TYPE_PLANS} AND i.id = {ref}")}
+    """
+
+
+def _due_for_type_plan(ref: str):
+    return f"""
+        DELETE FROM maintenance_due WHERE plan_id = {ref};
+        {_insert_due(f"{_TYPE_PLANS} AND p.id = {ref}")}
+    """
+
+
+def _logged(ref: str):
+    # A new latest record of its kind moves the due date on.
+    return f"""
+        UPDATE maintenance_due SET last_date = {ref}.date, due_date = {_DUE_DATE.format(last=f"{ref}.date")}
+        WHERE instrument_id = {ref}.instrument_id AND maintenance_type = {ref}.maintenance_type
+          AND (last_date IS NULL OR last_date < {ref}.date);
+    """
+
+
+def _unlogged(ref: str):
+    # Removing or moving a record only matters if it was the latest.
+    pair = f"instrument_id = {ref}.instrument_id AND maintenance_type = {ref}.maintenance_type"
+    return f"""
+        UPDATE maintenance_due
+        SET last_date = (SELECT date FROM maintenance WHERE {pair} ORDER BY date DESC LIMIT 1)
+        WHERE {pair} AND last_date = {ref}.date;
+        UPDATE maintenance_due SET due_date = {_DUE_DATE.format(last="last_date")} WHERE {pair};
+    """
+
+
+def rebuild_due(conn):
+    conn.execute("DELETE FROM maintenance_due")
+    conn.execute(_insert_due(_OWN_PLANS))
+    conn.execute(_insert_due(_TYPE_PLANS))
+
+
+def _due_triggers():
+    # A plan's statements are no-ops for the kind of plan it is not, and an
+    # instrument's for a NULL id, so no trigger needs a WHEN clause.
+    return [
+        f"CREATE TRIGGER due_maintenance_insert AFTER INSERT ON maintenance BEGIN {_logged('new')} END",
+        f"CREATE TRIGGER due_maintenance_delete AFTER DELETE ON maintenance BEGIN {_unlogged('old')} END",
+        f"""
+            CREATE TRIGGER due_maintenance_update AFTER UPDATE OF instrument_id, date, maintenance_type
+            ON maintenance BEGIN
+                {_unlogged('old')}{_logged('new')}
+            END
+        """,
+        f"CREATE TRIGGER due_instruments_insert AFTER INSERT ON instruments BEGIN {_due_for_instrument('new.id')} END",
+        f"""
+            CREATE TRIGGER due_instruments_update AFTER UPDATE OF type, purchase_date ON instruments BEGIN
+                {_due_for_instrument('new.id')}
+            END
+        """,
+        """
+            CREATE TRIGGER due_instruments_delete AFTER DELETE ON instruments BEGIN
+                DELETE FROM maintenance_due WHERE instrument_id = old.id;
+            END
+        """,
+        f"""
+            CREATE TRIGGER due_plans_insert AFTER INSERT ON maintenance_plans BEGIN
+                {_due_for_type_plan('new.id')}{_due_for_instrument('new.instrument_id')}
+            END
+        """,
+        f"""
+            CREATE TRIGGER due_plans_update AFTER UPDATE ON maintenance_plans BEGIN
+                DELETE FROM maintenance_due WHERE plan_id = old.id;
+                {_due_for_type_plan('new.id')}{_due_for_instrument('old.instrument_id')}
+                {_due_for_instrument('new.instrument_id')}
+            END
+        """,
+        f"""
+            CREATE TRIGGER due_plans_delete AFTER DELETE ON maintenance_plans BEGIN
+                DELETE FROM maintenance_due WHERE plan_id = old.id;
+                {_due_for_instrument('old.instrument_id')}
+            END
+        """,
+    ]
+
+
+# Dates are stored as ISO 8601 text, YYYY-MM-DD. That sorts and compares
+# correctly as text, so the date indexes answer ranges, and SQLite's date
+# functions (the rollups, the due dates) read it as it is. Everything written
+# goes through parse_date, which also accepts the spellings in DATE_FORMATS.
+DATE_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%d.%m.%y", "%d/%m/%Y", "%Y/%m/%d", "%Y.%m.%d")
+DATE_COLUMNS = {"instruments": "purchase_date", "columns": "install_date", "maintenance": "date"}
+_NOT_ISO = "{column} IS NOT date({column})"
+
+
+def parse_date(value) -> Optional[str]:
+    # None and blanks are None; a time of day after the date is dropped.
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    text = str(value).strip() if value is not None else ""
+    if not text:
+        return None
+    day = re.split(r"[ T]", text, maxsplit=1)[0]
+    try:
+        return date.fromisoformat(day).isoformat()
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(day, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"Ugyldig dato: {value!r} (bruk ÅÅÅÅ-MM-DD)")
+
+
+def _date_range(column: str, start, end):
+    # Conditions for start <= column <= end, either end open.
+    start, end = parse_date(start), parse_date(end)
+    if start and end and end < start:
+        raise ValueError(f"Ugyldig periode: {start} til {end}")
+    conditions, params = [], []
+    if start:
+        conditions.append(f"{column} >= ?")
+        params.append(start)
+    if end:
+        conditions.append(f"{column} <= ?")
+        params.append(end)
+    return conditions, params
+
+
+def _normalize_dates(conn):
+    # Rewrites every stored date parse_date can read. What it cannot read is
+    # left as it is and listed by DateRepository.issues().
+    for table, column in DATE_COLUMNS.items():
+        rows = conn.execute(f"SELECT id, {column} FROM {table} WHERE {_NOT_ISO.format(column=column)}").fetchall()
+        fixed = []
+        for row_id, value in rows:
+            try:
+                fixed.append((parse_date(value), row_id))
+            except ValueError:
+                continue
+        if table == "maintenance":
+            # date is NOT NULL; a blank one stays an issue.
+            fixed = [pair for pair in fixed if pair[0] is not None]
+        conn.executemany(f"UPDATE {table} SET {column} = ? WHERE id = ?", fixed)
+
+
+def _date_guards():
+    # Writes that bypass parse_date (raw SQL, other tools) are refused too.
+    triggers = []
+    for table, column in DATE_COLUMNS.items():
+        check = (f"WHEN {_NOT_ISO.format(column=f'new.{column}')} BEGIN "
+                 f"SELECT RAISE(ABORT, 'Ugyldig dato i {table}.{column} (bruk ÅÅÅÅ-MM-DD)'); END")
+        triggers.append(f"CREATE TRIGGER date_{table}_insert BEFORE INSERT ON {table} {check}")
+        triggers.append(f"CREATE TRIGGER date_{table}_update BEFORE UPDATE OF {column} ON {table} {check}")
+    return triggers
+
+
+# Columns a caller can set, per table: what the *_many methods may write or
+# select on, and what the audit log keeps the history of. A *_many batch is
+# one executemany or one set-based statement, in one transaction.
+BULK_FIELDS = {
+    "instruments": ("name", "type", "model", "manufacturer", "serial_number", "purchase_date", "notes", "status"),
+    "columns": ("instrument_id", "name", "column_type", "length_cm", "diameter_mm", "pore_size", "install_date",
+                "status", "notes"),
+    "maintenance": ("instrument_id", "date", "maintenance_type", "description", "performed_by", "cost"),
+}
+
+# audit_log holds reverse deltas: an update stores only the old values of
+# the fields it changed, an insert stores nothing (the row itself is its
+# first state) and a delete the whole row as it was. Walking back from the
+# current row through the deltas gives every earlier state. Every
+# AUDIT_SNAPSHOT_EVERY versions the whole row is stored too, so "as of"
+# never undoes more than that many deltas. Times are UTC milliseconds and
+# actors are numbered in audit_actors, to keep the rows small.
+#
+# The actor is read from audit_session, which only this program's write
+# transactions fill in (ConnectionManager.record_actor). Anything else that
+# writes to the database, the sqlite3 shell say, is logged as AUDIT_EXTERNAL.
+AUDIT_SNAPSHOT_EVERY = 16
+AUDIT_EXTERNAL = "extern"
+AUDIT_ACTOR_SQL = f"coalesce((SELECT actor FROM audit_session), '{AUDIT_EXTERNAL}')"
+_AUDIT_CLAIMED_ID = "(SELECT c.id FROM audit_session s JOIN audit_actors c ON c.name = s.claimed)"
+_NOW_MS = "CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)"
+
+
+def _audit_record(table: str, ref: str, op: str, actor: str, claimed: bool, data: str = "NULL", when: str = "1"):
+    columns, values = ("actor_id, claimed_id", f"id, {_AUDIT_CLAIMED_ID}") if claimed else ("actor_id", "id")
+    return f"""
+        INSERT INTO audit_log (table_name, row_id, op, at, {columns}, data)
+        SELECT '{table}', {ref}.id, '{op}', {_NOW_MS}, {values}, {data} FROM audit_actors
+        WHERE name = {actor} AND {when};
+    """
+
+
+def _audit_row(table: str, ref: str):
+    pairs = ", ".join(f"'{field}', {ref}.{field}" for field in (*BULK_FIELDS[table], "created_at"))
+    return f"json_object({pairs})"
+
+
+def _audit_triggers(actor: str = AUDIT_ACTOR_SQL, claimed: bool = True):
+    register = f"INSERT OR IGNORE INTO audit_actors (name) VALUES ({actor});"
+    if claimed:
+        register += (" INSERT OR IGNORE INTO audit_actors (name)"
+                     " SELECT claimed FROM audit_session WHERE claimed IS NOT NULL;")
+    triggers = []
+    for table, fields in BULK_FIELDS.items():
+        changed = " OR ".join(f"old.{field} IS NOT new.{field}" for field in fields)
+        delta = "(SELECT json_group_object(field, value) FROM ({}))".format(" UNION ALL ".join(
+            f"SELECT '{field}' AS field, old.{field} AS value WHERE old.{field} IS NOT new.{field}" for field in fields
+        ))
+        snapshot = _audit_record(table, "new", "S", actor, claimed, _audit_row(table, "new"),
+                                 when=f"new.version % {AUDIT_SNAPSHOT_EVERY} = 0")
+        triggers += [
+            f"CREATE TRIGGER audit_{table}_insert AFTER INSERT ON {table} BEGIN "
+            f"{register} {_audit_record(table, 'new', 'I', actor, claimed)} END",
+            f"CREATE TRIGGER audit_{table}_update AFTER UPDATE ON {table} WHEN {changed} BEGIN "
+            f"{register} {_audit_record(table, 'new', 'U', actor, claimed, delta)} {snapshot} END",
+            f"CREATE TRIGGER audit_{table}_delete AFTER DELETE ON {table} BEGIN "
+            f"{register} {_audit_record(table, 'old', 'D', actor, claimed, _audit_row(table, 'old'))} END",
+        ]
+    return triggers
+
+
+def _drop_audit_triggers():
+    return [f"DROP TRIGGER audit_{table}_{op}" for table in BULK_FIELDS for op in ("insert", "update", "delete")]
+
+
+# Each entry brings the schema from user_version N to N + 1. Steps are SQL
+# statements or callables taking the connection; a migration runs in a single
+# transaction together with its user_version bump. Only ever append here.
+MIGRATIONS = [
+    # 1: indexes for the list, detail, dashboard and import lookups
+    [
+        "CREATE INDEX IF NOT EXISTS idx_instruments_type_name ON instruments(type, name)",
+        "CREATE INDEX IF NOT EXISTS idx_instruments_name ON instruments(name)",
+        "CREATE INDEX IF NOT EXISTS idx_instruments_serial ON instruments(serial_number)",
+        "CREATE INDEX IF NOT EXISTS idx_columns_instrument_name ON columns(instrument_id, name)",
+        "CREATE INDEX IF NOT EXISTS idx_columns_name ON columns(name)",
+        "CREATE INDEX IF NOT EXISTS idx_maintenance_instrument_date ON maintenance(instrument_id, date DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_maintenance_date ON maintenance(date DESC, instrument_id)",
+    ],
+    # 2: full-text search index over instruments, columns and maintenance
+    [
+        """
+            CREATE VIRTUAL TABLE search_index USING fts5(
+                kind UNINDEXED, ref_id UNINDEXED, instrument_id UNINDEXED, title, body, context,
+                prefix='2 3 4 5 6', tokenize='unicode61 remove_diacritics 2'
+            )
+        """,
+        "CREATE TABLE search_pending (rowid INTEGER PRIMARY KEY)",
+        *_search_triggers(),
+        rebuild_search_index,
+    ],
+    # 3: keyset pagination of an instrument's history walks (date, id) newest first
+    [
+        "DROP INDEX IF EXISTS idx_maintenance_instrument_date",
+        "CREATE INDEX idx_maintenance_instrument_date ON maintenance(instrument_id, date DESC, id DESC)",
+    ],
+    # 4: trigger-maintained dashboard statistics
+    [
+        """
+            CREATE TABLE stats (
+                scope TEXT NOT NULL,
+                key TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                total REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (scope, key)
+            ) WITHOUT ROWID
+        """,
+        *_stats_triggers(),
+        rebuild_stats,
+    ],
+    # 5: row versions for optimistic concurrency
+    [
+        "ALTER TABLE instruments ADD COLUMN version INTEGER NOT NULL DEFAULT 1",
+        "ALTER TABLE columns ADD COLUMN version INTEGER NOT NULL DEFAULT 1",
+        "ALTER TABLE maintenance ADD COLUMN version INTEGER NOT NULL DEFAULT 1",
+    ],
+    # 6: trigger-fed change log for incremental refresh and delta exports
+    [
+        """
+            CREATE TABLE changes (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                table_name TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                op TEXT NOT NULL,
+                changed_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """,
+        *_change_triggers(),
+    ],
+    # 7: time-bucketed maintenance rollups for analytics
+    [
+        """
+            CREATE TABLE maintenance_monthly (
+                month TEXT NOT NULL,
+                maintenance_type TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                total REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (month, maintenance_type)
+            ) WITHOUT ROWID
+        """,
+        """
+            CREATE TABLE maintenance_yearly (
+                year TEXT NOT NULL,
+                instrument_id INTEGER NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                total REAL NOT NULL DEFAULT 0,
+                repairs INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (year, instrument_id)
+            ) WITHOUT ROWID
+        """,
+        *_rollup_triggers(),
+        rebuild_rollups,
+        # Partial buckets at the ends of a range are read from maintenance by
+        # date; covering type and cost saves a table lookup per row.
+        "DROP INDEX IF EXISTS idx_maintenance_date",
+        "CREATE INDEX idx_maintenance_date ON maintenance(date DESC, instrument_id, maintenance_type, cost)",
+    ],
+    # 8: maintenance plans and the due dates they give
+    [
+        """
+            CREATE TABLE maintenance_plans (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                instrument_id INTEGER REFERENCES instruments(id) ON DELETE CASCADE,
+                instrument_type TEXT,
+                maintenance_type TEXT NOT NULL,
+                interval_months INTEGER NOT NULL CHECK (interval_months > 0),
+                description TEXT,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                version INTEGER NOT NULL DEFAULT 1,
+                CHECK ((instrument_id IS NULL) != (instrument_type IS NULL))
+            )
+        """,
+        "CREATE INDEX idx_plans_instrument ON maintenance_plans(instrument_id, maintenance_type)",
+        "CREATE INDEX idx_plans_type ON maintenance_plans(instrument_type, maintenance_type)",
+        """
+            CREATE TABLE maintenance_due (
+                instrument_id INTEGER NOT NULL,
+                plan_id INTEGER NOT NULL,
+                maintenance_type TEXT NOT NULL,
+                interval_months INTEGER NOT NULL,
+                since TEXT NOT NULL,
+                last_date TEXT,
+                due_date TEXT NOT NULL,
+                PRIMARY KEY (instrument_id, plan_id)
+            ) WITHOUT ROWID
+        """,
+        "CREATE INDEX idx_due_date ON maintenance_due(due_date, instrument_id)",
+        "CREATE INDEX idx_due_plan ON maintenance_due(plan_id)",
+        *_due_triggers(),
+        *_change_triggers(("maintenance_plans",)),
+    ],
+    # 9: dates rewritten as ISO text and checked on write; install dates
+    # indexed for range reads
+    [
+        _normalize_dates,
+        "CREATE INDEX idx_columns_install_date ON columns(install_date)",
+        *_date_guards(),
+    ],
+    # 10: the audit log
+    [
+        "CREATE TABLE audit_actors (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)",
+        """
+            CREATE TABLE audit_log (
+                id INTEGER PRIMARY KEY,
+                table_name TEXT NOT NULL,
+                row_id INTEGER NOT NULL,
+                op TEXT NOT NULL,
+                at INTEGER NOT NULL,
+                actor_id INTEGER NOT NULL REFERENCES audit_actors(id),
+                data TEXT
+            )
+        """,
+        "CREATE INDEX idx_audit_row ON audit_log(table_name, row_id, at)",
+        *_audit_triggers("audit_actor()", claimed=False),
+    ],
+    # 11: titles on their own, so title hits are found without walking the rest
+    [
+        """
+            CREATE VIRTUAL TABLE search_titles USING fts5(
+                title, prefix='2 3 4 5 6', tokenize='unicode61 remove_diacritics 2'
+            )
+        """,
+        rebuild_search_titles,
+    ],
+    # 12: the audit actor from a table instead of a function only this program registers
+    [
+        "CREATE TABLE audit_session (id INTEGER PRIMARY KEY CHECK (id = 1), actor TEXT NOT NULL)",
+        *_drop_audit_triggers(),
+        *_audit_triggers(claimed=False),
+    ],
+    # 13: what a server client claims to be, kept apart from the address the server saw
+    [
+        "ALTER TABLE audit_log ADD COLUMN claimed_id INTEGER REFERENCES audit_actors(id)",
+        "ALTER TABLE audit_session ADD COLUMN claimed TEXT",
+        *_drop_audit_triggers(),
+        *_audit_triggers(),
+    ],
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn) -> int:
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate():
+    with get_connection() as conn:
+        conn.commit()
+        current = schema_version(conn)
+        if current > SCHEMA_VERSION:
+            raise RuntimeError(
+                f"{DATABASE_PATH} has schema version {current}, newer than this program ({SCHEMA_VERSION})"
+            )
+        for version in range(current + 1, SCHEMA_VERSION + 1):
+            conn.execute("BEGIN IMMEDIATE")
+            # Another process may have migrated while we waited for the lock.
+            if schema_version(conn) >= version:
+                conn.commit()
+                continue
+            for step in MIGRATIONS[version - 1]:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        if current < SCHEMA_VERSION:
+            conn.execute("PRAGMA optimize")
+    return SCHEMA_VERSION
+
+
+def _versioned_update(conn, table: str, row_id: int, expected_version: Optional[int], assignments: str, values):
+    # Every update bumps version. With expected_version the row is only
+    # written if nobody else has bumped it since; returns the new version.
+    sql = f"UPDATE {table} SET {assignments}, version = version + 1 WHERE id = ?"
+    params = (*values, row_id)
+    if expected_version is not None:
+        sql += " AND version = ?"
+        params += (expected_version,)
+    if conn.execute(sql, params).rowcount:
+        return conn.execute(f"SELECT version FROM {table} WHERE id = ?", (row_id,)).fetchone()[0]
+    row = conn.execute(f"SELECT version FROM {table} WHERE id = ?", (row_id,)).fetchone()
+    if row is None:
+        raise ConflictError(f"Raden finnes ikke lenger ({table} {row_id})")
+    raise ConflictError(f"Raden er endret av noen andre ({table} {row_id}: versjon {row[0]}, forventet {expected_version})")
+
+
+def _bulk_fields(table: str, names):
+    names = list(names)
+    unknown = set(names) - set(BULK_FIELDS[table])
+    if unknown:
+        raise ValueError(f"Ukjente felt for {table}: {', '.join(sorted(unknown))}")
+    return names
+
+
+def _stored(table: str, column: str, value):
+    # Values as they are stored: dates in ISO form.
+    return parse_date(value) if column == DATE_COLUMNS[table] else value
+
+
+def _selection(table: str, ids=None, where: Optional[dict] = None):
+    # ids and/or where ({column: value}, a list or tuple meaning any of its
+    # values). Nothing at all is refused rather than read as every row.
+    conditions, params = [], []
+    if ids is not None:
+        conditions.append("id IN (SELECT value FROM json_each(?))")
+        params.append(json.dumps(list(ids)))
+    for column in _bulk_fields(table, (where or {}).keys()):
+        value = where[column]
+        if isinstance(value, (list, tuple)):
+            conditions.append(f"{column} IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps([_stored(table, column, item) for item in value]))
+        elif value is None:
+            conditions.append(f"{column} IS NULL")
+        else:
+            conditions.append(f"{column} = ?")
+            params.append(_stored(table, column, value))
+    if not conditions:
+        raise ValueError("Ingen rader er valgt")
+    return " AND ".join(conditions), params
+
+
+def _create_many(table: str, rows):
+    # rows are dicts keyed by column, all with the keys of the first. One
+    # executemany holds the write lock throughout, so the new ids are
+    # consecutive and end at last_insert_rowid().
+    rows = list(rows)
+    if not rows:
+        return []
+    names = _bulk_fields(table, rows[0].keys())
+    with get_connection() as conn:
+        conn.executemany(
+            f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+            [[_stored(table, name, row[name]) for name in names] for row in rows]
+        )
+        last = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+    return list(range(last - len(rows) + 1, last + 1))
+
+
+def _update_many(table: str, rows):
+    # rows are dicts with id, the columns to set (those of the first row)
+    # and optionally version, checked like update()'s expected_version. If
+    # any row has moved on or is gone, nothing is written.
+    rows = list(rows)
+    if not rows:
+        return 0
+    names = _bulk_fields(table, (key for key in rows[0] if key not in ("id", "version")))
+    if not names:
+        raise ValueError("Ingen felt å oppdatere")
+    versioned = "version" in rows[0]
+    sql = f"UPDATE {table} SET {', '.join(f'{name}=?' for name in names)}, version = version + 1 WHERE id = ?"
+    if versioned:
+        sql += " AND version = ?"
+    params = [
+        [_stored(table, name, row[name]) for name in names] + [row["id"]] + ([row["version"]] if versioned else []) for row in rows
+    ]
+    with get_connection() as conn:
+        updated = conn.executemany(sql, params).rowcount
+        if updated != len(rows):
+            raise ConflictError(
+                f"{len(rows) - updated} av {len(rows)} rader er endret av noen andre eller finnes ikke lenger ({table})"
+            )
+    return updated
+
+
+def _set_many(table: str, values: dict, ids=None, where: Optional[dict] = None):
+    # The same values on every selected row; returns how many there were.
+    names = _bulk_fields(table, values.keys())
+    condition, params = _selection(table, ids, where)
+    with get_connection() as conn:
+        return conn.execute(
+            f"UPDATE {table} SET {', '.join(f'{name}=?' for name in names)}, version = version + 1 WHERE {condition}",
+            (*(_stored(table, name, values[name]) for name in names), *params)
+        ).rowcount
+
+
+def _delete_many(table: str, ids=None, where: Optional[dict] = None):
+    condition, params = _selection(table, ids, where)
+    with get_connection() as conn:
+        return conn.execute(f"DELETE FROM {table} WHERE {condition}", params).rowcount
+
+
+PAGE_SIZE = 100
+
+
+def _page(cursor, limit: int, *keys):
+    # Pages are fetched with one extra row to know whether another follows;
+    # the cursor is the sort key of the last row returned, or None at the end.
+    rows = [dict(row) for row in cursor.fetchall()]
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, tuple(rows[-1][key] for key in keys)
 
 
 class InstrumentRepository:
     @staticmethod
+    @cached("instruments")
     def get_all(instrument_type: Optional[str] = None):
         with get_connection() as conn:
             if instrument_type:
@@ -78,6 +1237,25 @@ class InstrumentRepository:
             return [dict(row) for row in cursor.fetchall()]
 
     @staticmethod
+    @cached("instruments")
+    def get_page(instrument_type: Optional[str] = None, after: Optional[tuple] = None, limit: int = PAGE_SIZE):
+        # after is the (name, id) cursor returned with the previous page.
+        conditions, params = [], []
+        if instrument_type:
+            conditions.append("type = ?")
+            params.append(instrument_type)
+        if after:
+            conditions.append("(name, id) > (?, ?)")
+            params.extend(after)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with get_connection() as conn:
+            cursor = conn.execute(
+                f"SELECT * FROM instruments {where} ORDER BY name, id LIMIT ?", (*params, limit + 1)
+            )
+            return _page(cursor, limit, "name", "id")
+
+    @staticmethod
+    @cached("instruments")
     def get_by_id(instrument_id: int):
         with get_connection() as conn:
             cursor = conn.execute("SELECT * FROM instruments WHERE id = ?", (instrument_id,))
@@ -85,32 +1263,94 @@ class InstrumentRepository:
             return dict(row) if row else None
 
     @staticmethod
+    @cached("instruments")
+    def get_by_ids(instrument_ids: tuple):
+        # Rows shaped like get_page's, for patching a loaded list; ids that
+        # no longer exist are left out.
+        with get_connection() as conn:
+            cursor = conn.execute(
+                "SELECT * FROM instruments WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(instrument_ids),)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    @cached("instruments", "columns", "maintenance")
+    def get_detail(instrument_id: int):
+        # Everything the detail page opens with, in one statement: the
+        # instrument, its columns (few per instrument) and the row counts of
+        # both tabs. Maintenance rows are paged in separately.
+        with get_connection() as conn:
+            row = conn.execute("""
+                SELECT i.*,
+                       (SELECT COUNT(*) FROM columns WHERE instrument_id = i.id) AS column_count,
+                       (SELECT COUNT(*) FROM maintenance WHERE instrument_id = i.id) AS maintenance_count,
+                       (SELECT json_group_array(json_object(
+                                   'id', id, 'instrument_id', instrument_id, 'name', name,
+                                   'column_type', column_type, 'length_cm', length_cm,
+                                   'diameter_mm', diameter_mm, 'pore_size', pore_size,
+                                   'install_date', install_date, 'status', status, 'notes', notes,
+                                   'created_at', created_at, 'version', version))
+                        FROM (SELECT * FROM columns WHERE instrument_id = i.id ORDER BY name)) AS columns_json
+                FROM instruments i
+                WHERE i.id = ?
+            """, (instrument_id,)).fetchone()
+        if row is None:
+            return None
+        detail = dict(row)
+        detail["columns"] = json.loads(detail.pop("columns_json"))
+        return detail
+
+    @staticmethod
+    @writes("instruments")
     def create(name: str, instrument_type: str, model: str = None, manufacturer: str = None,
                serial_number: str = None, purchase_date: str = None, notes: str = None):
         with get_connection() as conn:
             conn.execute("""
                 INSERT INTO instruments (name, type, model, manufacturer, serial_number, purchase_date, notes)
                 VALUES (?, ?, ?, ?, ?, ?, ?)
-            """, (name, instrument_type, model, manufacturer, serial_number, purchase_date, notes))
+            """, (name, instrument_type, model, manufacturer, serial_number, parse_date(purchase_date), notes))
             return conn.execute("SELECT last_insert_rowid()").fetchone()[0]
 
     @staticmethod
+    @writes("instruments")
     def update(instrument_id: int, name: str, instrument_type: str, model: str = None,
                manufacturer: str = None, serial_number: str = None, purchase_date: str = None,
-               notes: str = None, status: str = "Active"):
+               notes: str = None, status: str = "Active", expected_version: Optional[int] = None):
         with get_connection() as conn:
-            conn.execute("""
-                UPDATE instruments
-                SET name=?, type=?, model=?, manufacturer=?, serial_number=?, purchase_date=?, notes=?, status=?
-                WHERE id=?
-            """, (name, instrument_type, model, manufacturer, serial_number, purchase_date, notes, status, instrument_id))
+            return _versioned_update(
+                conn, "instruments", instrument_id, expected_version,
+                "name=?, type=?, model=?, manufacturer=?, serial_number=?, purchase_date=?, notes=?, status=?",
+                (name, instrument_type, model, manufacturer, serial_number, parse_date(purchase_date), notes, status),
+            )
 
     @staticmethod
+    @writes("instruments", "columns", "maintenance", "maintenance_plans")
     def delete(instrument_id: int):
         with get_connection() as conn:
             conn.execute("DELETE FROM instruments WHERE id = ?", (instrument_id,))
 
     @staticmethod
+    @writes("instruments")
+    def create_many(rows):
+        return _create_many("instruments", rows)
+
+    @staticmethod
+    @writes("instruments")
+    def update_many(rows):
+        return _update_many("instruments", rows)
+
+    @staticmethod
+    @writes("instruments")
+    def set_status_many(status: str, ids=None, where: Optional[dict] = None):
+        return _set_many("instruments", {"status": status}, ids, where)
+
+    @staticmethod
+    @writes("instruments", "columns", "maintenance", "maintenance_plans")
+    def delete_many(ids=None, where: Optional[dict] = None):
+        return _delete_many("instruments", ids, where)
+
+    @staticmethod
+    @cached("instruments")
     def count():
         with get_connection() as conn:
             return conn.execute("SELECT COUNT(*) FROM instruments").fetchone()[0]
@@ -118,12 +1358,14 @@ class InstrumentRepository:
 
 class ColumnRepository:
     @staticmethod
+    @cached("columns")
     def get_by_instrument(instrument_id: int):
         with get_connection() as conn:
             cursor = conn.execute("SELECT * FROM columns WHERE instrument_id = ? ORDER BY name", (instrument_id,))
             return [dict(row) for row in cursor.fetchall()]
 
     @staticmethod
+    @cached("columns", "instruments")
     def get_all():
         with get_connection() as conn:
             cursor = conn.execute("""
@@ -135,6 +1377,45 @@ class ColumnRepository:
             return [dict(row) for row in cursor.fetchall()]
 
     @staticmethod
+    @cached("columns", "instruments")
+    def get_page(after: Optional[tuple] = None, limit: int = PAGE_SIZE):
+        # after is the (name, id) cursor returned with the previous page.
+        with get_connection() as conn:
+            cursor = conn.execute(f"""
+                SELECT c.*, i.name as instrument_name, i.type as instrument_type
+                FROM columns c
+                LEFT JOIN instruments i ON c.instrument_id = i.id
+                {"WHERE (c.name, c.id) > (?, ?)" if after else ""}
+                ORDER BY c.name, c.id
+                LIMIT ?
+            """, (*(after or ()), limit + 1))
+            return _page(cursor, limit, "name", "id")
+
+    @staticmethod
+    @cached("columns", "instruments")
+    def get_installed_between(start: Optional[str] = None, end: Optional[str] = None,
+                              after: Optional[tuple] = None, limit: int = PAGE_SIZE):
+        # Columns installed start to end, both inclusive and either open, in
+        # install order; after is the (install_date, id) cursor returned with
+        # the previous page. Columns without an install date are left out.
+        conditions, params = _date_range("c.install_date", start, end)
+        conditions.append("c.install_date IS NOT NULL")
+        if after:
+            conditions.append("(c.install_date, c.id) > (?, ?)")
+            params.extend(after)
+        with get_connection() as conn:
+            cursor = conn.execute(f"""
+                SELECT c.*, i.name AS instrument_name, i.type AS instrument_type
+                FROM columns c
+                JOIN instruments i ON i.id = c.instrument_id
+                WHERE {' AND '.join(conditions)}
+                ORDER BY c.install_date, c.id
+                LIMIT ?
+            """, (*params, limit + 1))
+            return _page(cursor, limit, "install_date", "id")
+
+    @staticmethod
+    @cached("columns")
     def get_by_id(column_id: int):
         with get_connection() as conn:
             cursor = conn.execute("SELECT * FROM columns WHERE id = ?", (column_id,))
@@ -142,6 +1423,19 @@ class ColumnRepository:
             return dict(row) if row else None
 
     @staticmethod
+    @cached("columns", "instruments")
+    def get_by_ids(column_ids: tuple):
+        with get_connection() as conn:
+            cursor = conn.execute("""
+                SELECT c.*, i.name as instrument_name, i.type as instrument_type
+                FROM columns c
+                LEFT JOIN instruments i ON c.instrument_id = i.id
+                WHERE c.id IN (SELECT value FROM json_each(?))
+            """, (json.dumps(column_ids),))
+            return [dict(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    @writes("columns")
     def create(instrument_id: int, name: str, column_type: str = None, length_cm: float = None,
                diameter_mm: float = None, pore_size: str = None, install_date: str = None,
                notes: str = None):
@@ -149,28 +1443,51 @@ class ColumnRepository:
             conn.execute("""
                 INSERT INTO columns (instrument_id, name, column_type, length_cm, diameter_mm, pore_size, install_date, notes)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            """, (instrument_id, name, column_type, length_cm, diameter_mm, pore_size, install_date, notes))
+            """, (instrument_id, name, column_type, length_cm, diameter_mm, pore_size, parse_date(install_date), notes))
             return conn.execute("SELECT last_insert_rowid()").fetchone()[0]
 
     @staticmethod
+    @writes("columns")
     def update(column_id: int, name: str, column_type: str = None, length_cm: float = None,
                diameter_mm: float = None, pore_size: str = None, install_date: str = None,
-               status: str = "Active", notes: str = None):
+               status: str = "Active", notes: str = None, expected_version: Optional[int] = None):
         with get_connection() as conn:
-            conn.execute("""
-                UPDATE columns
-                SET name=?, column_type=?, length_cm=?, diameter_mm=?, pore_size=?, install_date=?, status=?, notes=?
-                WHERE id=?
-            """, (name, column_type, length_cm, diameter_mm, pore_size, install_date, status, notes, column_id))
+            return _versioned_update(
+                conn, "columns", column_id, expected_version,
+                "name=?, column_type=?, length_cm=?, diameter_mm=?, pore_size=?, install_date=?, status=?, notes=?",
+                (name, column_type, length_cm, diameter_mm, pore_size, parse_date(install_date), status, notes),
+            )
 
     @staticmethod
+    @writes("columns")
     def delete(column_id: int):
         with get_connection() as conn:
             conn.execute("DELETE FROM columns WHERE id = ?", (column_id,))
 
+    @staticmethod
+    @writes("columns")
+    def create_many(rows):
+        return _create_many("columns", rows)
+
+    @staticmethod
+    @writes("columns")
+    def update_many(rows):
+        return _update_many("columns", rows)
+
+    @staticmethod
+    @writes("columns")
+    def set_status_many(status: str, ids=None, where: Optional[dict] = None):
+        return _set_many("columns", {"status": status}, ids, where)
+
+    @staticmethod
+    @writes("columns")
+    def delete_many(ids=None, where: Optional[dict] = None):
+        return _delete_many("columns", ids, where)
+
 
 class MaintenanceRepository:
     @staticmethod
+    @cached("maintenance")
     def get_by_instrument(instrument_id: int):
         with get_connection() as conn:
             cursor = conn.execute("""
@@ -179,6 +1496,49 @@ class MaintenanceRepository:
             return [dict(row) for row in cursor.fetchall()]
 
     @staticmethod
+    @cached("maintenance")
+    def get_page_by_instrument(instrument_id: int, after: Optional[tuple] = None, limit: int = PAGE_SIZE):
+        # Newest first; after is the (date, id) cursor returned with the
+        # previous page.
+        with get_connection() as conn:
+            cursor = conn.execute(f"""
+                SELECT * FROM maintenance
+                WHERE instrument_id = ? {"AND (date, id) < (?, ?)" if after else ""}
+                ORDER BY date DESC, id DESC
+                LIMIT ?
+            """, (instrument_id, *(after or ()), limit + 1))
+            return _page(cursor, limit, "date", "id")
+
+    @staticmethod
+    @cached("maintenance", "instruments")
+    def get_between(start: Optional[str] = None, end: Optional[str] = None, instrument_id: Optional[int] = None,
+                    after: Optional[tuple] = None, limit: int = PAGE_SIZE):
+        # Records dated start to end, both inclusive and either open, newest
+        # first; after is the (date, id) cursor returned with the previous
+        # page. A range read on idx_maintenance_date, or on
+        # idx_maintenance_instrument_date for one instrument; CROSS JOIN
+        # keeps the planner from walking instruments and sorting instead.
+        conditions, params = _date_range("m.date", start, end)
+        if instrument_id is not None:
+            conditions.append("m.instrument_id = ?")
+            params.append(instrument_id)
+        if after:
+            conditions.append("(m.date, m.id) < (?, ?)")
+            params.extend(after)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with get_connection() as conn:
+            cursor = conn.execute(f"""
+                SELECT m.*, i.name AS instrument_name, i.type AS instrument_type
+                FROM maintenance m
+                CROSS JOIN instruments i ON i.id = m.instrument_id
+                {where}
+                ORDER BY m.date DESC, m.id DESC
+                LIMIT ?
+            """, (*params, limit + 1))
+            return _page(cursor, limit, "date", "id")
+
+    @staticmethod
+    @cached("maintenance", "instruments")
     def get_recent(limit: int = 10):
         with get_connection() as conn:
             cursor = conn.execute("""
@@ -191,6 +1551,7 @@ class MaintenanceRepository:
             return [dict(row) for row in cursor.fetchall()]
 
     @staticmethod
+    @cached("maintenance")
     def get_by_id(maintenance_id: int):
         with get_connection() as conn:
             cursor = conn.execute("SELECT * FROM maintenance WHERE id = ?", (maintenance_id,))
@@ -198,158 +1559,498 @@ class MaintenanceRepository:
             return dict(row) if row else None
 
     @staticmethod
+    @cached("maintenance")
+    def get_by_ids(maintenance_ids: tuple):
+        with get_connection() as conn:
+            cursor = conn.execute(
+                "SELECT * FROM maintenance WHERE id IN (SELECT value FROM json_each(?))", (json.dumps(maintenance_ids),)
+            )
+            return [dict(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    @writes("maintenance")
     def create(instrument_id: int, date: str, maintenance_type: str, description: str = None,
                performed_by: str = None, cost: float = None):
         with get_connection() as conn:
             conn.execute("""
                 INSERT INTO maintenance (instrument_id, date, maintenance_type, description, performed_by, cost)
                 VALUES (?, ?, ?, ?, ?, ?)
-            """, (instrument_id, date, maintenance_type, description, performed_by, cost))
+            """, (instrument_id, parse_date(date), maintenance_type, description, performed_by, cost))
             return conn.execute("SELECT last_insert_rowid()").fetchone()[0]
 
     @staticmethod
+    @writes("maintenance")
     def update(maintenance_id: int, date: str, maintenance_type: str, description: str = None,
-               performed_by: str = None, cost: float = None):
+               performed_by: str = None, cost: float = None, expected_version: Optional[int] = None):
         with get_connection() as conn:
-            conn.execute("""
-                UPDATE maintenance
-                SET date=?, maintenance_type=?, description=?, performed_by=?, cost=?
-                WHERE id=?
-            """, (date, maintenance_type, description, performed_by, cost, maintenance_id))
+            return _versioned_update(
+                conn, "maintenance", maintenance_id, expected_version,
+                "date=?, maintenance_type=?, description=?, performed_by=?, cost=?",
+                (parse_date(date), maintenance_type, description, performed_by, cost),
+            )
 
     @staticmethod
+    @writes("maintenance")
     def delete(maintenance_id: int):
         with get_connection() as conn:
             conn.execute("DELETE FROM maintenance WHERE id = ?", (maintenance_id,))
 
+    @staticmethod
+    @writes("maintenance")
+    def create_many(rows):
+        return _create_many("maintenance", rows)
+
+    @staticmethod
+    @writes("maintenance")
+    def update_many(rows):
+        return _update_many("maintenance", rows)
 
-import csv
-import os
+    @staticmethod
+    @writes("maintenance")
+    def delete_many(ids=None, where: Optional[dict] = None):
+        return _delete_many("maintenance", ids, where)
 
 
-def export_all_to_csv(export_dir: str):
-    os.makedirs(export_dir, exist_ok=True)
-    
-    with get_connection() as conn:
-        instruments = conn.execute("""
-            SELECT name, type, model, manufacturer, serial_number, purchase_date, notes, status
-            FROM instruments ORDER BY name
-        """).fetchall()
-        
-        with open(os.path.join(export_dir, "instruments.csv"), "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(["name", "type", "model", "manufacturer", "serial_number", "purchase_date", "notes", "status"])
-            for row in instruments:
-                writer.writerow([row["name"], row["type"], row["model"], row["manufacturer"], 
-                               row["serial_number"], row["purchase_date"], row["notes"], row["status"]])
-        
-        columns = conn.execute("""
-            SELECT i.name as instrument_name, c.name, c.column_type, c.length_cm, c.diameter_mm,
-                   c.pore_size, c.install_date, c.status, c.notes
-            FROM columns c
-            JOIN instruments i ON c.instrument_id = i.id
-            ORDER BY i.name, c.name
-        """).fetchall()
-        
-        with open(os.path.join(export_dir, "columns.csv"), "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(["instrument_name", "name", "column_type", "length_cm", "diameter_mm",
-                           "pore_size", "install_date", "status", "notes"])
-            for row in columns:
-                writer.writerow([row["instrument_name"], row["name"], row["column_type"],
-                               row["length_cm"], row["diameter_mm"], row["pore_size"],
-                               row["install_date"], row["status"], row["notes"]])
-        
-        maintenance = conn.execute("""
-            SELECT i.name as instrument_name, m.date, m.maintenance_type, m.description,
-                   m.performed_by, m.cost
-            FROM maintenance m
-            JOIN instruments i ON m.instrument_id = i.id
-            ORDER BY i.name, m.date
-        """).fetchall()
-        
-        with open(os.path.join(export_dir, "maintenance.csv"), "w", newline="", encoding="utf-8") as f:
-            writer = csv.writer(f)
-            writer.writerow(["instrument_name", "date", "maintenance_type", "description", "performed_by", "cost"])
-            for row in maintenance:
-                writer.writerow([row["instrument_name"], row["date"], row["maintenance_type"],
-                               row["description"], row["performed_by"], row["cost"]])
-
-
-def import_all_from_csv(import_dir: str):
-    instruments_file = os.path.join(import_dir, "instruments.csv")
-    columns_file = os.path.join(import_dir, "columns.csv")
-    maintenance_file = os.path.join(import_dir, "maintenance.csv")
-    
-    instrument_map = {}
-    
-    with get_connection() as conn:
-        if os.path.exists(instruments_file):
-            with open(instruments_file, "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    serial = row.get("serial_number", "").strip()
-                    
-                    if serial:
-                        existing = conn.execute(
-                            "SELECT id FROM instruments WHERE serial_number = ?", (serial,)
-                        ).fetchone()
-                        
-                        if existing:
-                            conn.execute("""
-                                UPDATE instruments SET name=?, type=?, model=?, manufacturer=?,
-                                purchase_date=?, notes=?, status=?
-                                WHERE serial_number=?
-                            """, (row["name"], row["type"], row.get("model"), row.get("manufacturer"),
-                                  row.get("purchase_date"), row.get("notes"), row.get("status", "Active"), serial))
-                            instrument_map[row["name"]] = existing["id"]
-                        else:
-                            cursor = conn.execute("""
-                                INSERT INTO instruments (name, type, model, manufacturer, serial_number, purchase_date, notes, status)
-                                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                            """, (row["name"], row["type"], row.get("model"), row.get("manufacturer"),
-                                  serial, row.get("purchase_date"), row.get("notes"), row.get("status", "Active")))
-                            instrument_map[row["name"]] = cursor.lastrowid
-                    else:
-                        cursor = conn.execute("""
-                            INSERT INTO instruments (name, type, model, manufacturer, serial_number, purchase_date, notes, status)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        """, (row["name"], row["type"], row.get("model"), row.get("manufacturer"),
-                              serial, row.get("purchase_date"), row.get("notes"), row.get("status", "Active")))
-                        instrument_map[row["name"]] = cursor.lastrowid
-        
-        if os.path.exists(columns_file):
-            with open(columns_file, "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    instrument_name = row.get("instrument_name", "").strip()
-                    if instrument_name and instrument_name in instrument_map:
-                        instrument_id = instrument_map[instrument_name]
-                        
-                        conn.execute("DELETE FROM columns WHERE instrument_id = ?", (instrument_id,))
-                        
-                        conn.execute("""
-                            INSERT INTO columns (instrument_id, name, column_type, length_cm, diameter_mm, pore_size, install_date, status, notes)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """, (instrument_id, row["name"], row.get("column_type"),
-                              float(row["length_cm"]) if row.get("length_cm") else None,
-                              float(row["diameter_mm"]) if row.get("diameter_mm") else None,
-                              row.get("pore_size"), row.get("install_date"),
-                              row.get("status", "Active"), row.get("notes")))
-        
-        if os.path.exists(maintenance_file):
-            with open(maintenance_file, "r", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    instrument_name = row.get("instrument_name", "").strip()
-                    if instrument_name and instrument_name in instrument_map:
-                        instrument_id = instrument_map[instrument_name]
-                        
-                        conn.execute("DELETE FROM maintenance WHERE instrument_id = ?", (instrument_id,))
-                        
-                        conn.execute("""
-                            INSERT INTO maintenance (instrument_id, date, maintenance_type, description, performed_by, cost)
-                            VALUES (?, ?, ?, ?, ?, ?)
-                        """, (instrument_id, row["date"], row["maintenance_type"],
-                              row.get("description"), row.get("performed_by"),
-                              float(row["cost"]) if row.get("cost") else None))
+class DateRepository:
+    @staticmethod
+    @cached("instruments", "columns", "maintenance")
+    def issues():
+        # Stored dates that are not ISO: those the migration could not read.
+        # Writes are checked, so nothing newer can turn up here.
+        parts = [
+            f"SELECT '{table}' AS table_name, id AS row_id, '{column}' AS column_name, {column} AS value "
+            f"FROM {table} WHERE {_NOT_ISO.format(column=column)}"
+            for table, column in DATE_COLUMNS.items()
+        ]
+        with get_connection() as conn:
+            return [dict(row) for row in conn.execute(" UNION ALL ".join(parts) + " ORDER BY 1, 2")]
+
+
+AUDIT_OPS = {"I": "insert", "U": "update", "D": "delete"}
+
+
+def _audit_time(ms: int):
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+def _audit_ms(at):
+    # An ISO date or time, UTC like created_at; a date means its midnight.
+    try:
+        moment = at if isinstance(at, datetime) else datetime.fromisoformat(str(at).strip())
+    except ValueError:
+        raise ValueError(f"Ugyldig tidspunkt: {at!r} (bruk ÅÅÅÅ-MM-DD TT:MM:SS)") from None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def _audited(table: str):
+    if table not in BULK_FIELDS:
+        raise ValueError(f"Ukjent tabell: {table}")
+    return BULK_FIELDS[table]
+
+
+class AuditRepository:
+    @staticmethod
+    @cached("instruments", "columns", "maintenance")
+    def history(table: str, row_id: int):
+        # Newest first. Updates list {field: [old, new]}; inserts and deletes
+        # the whole row as it was created or removed.
+        fields = _audited(table)
+        with get_connection() as conn:
+            current = conn.execute(f"SELECT {', '.join(fields)} FROM {table} WHERE id = ?", (row_id,)).fetchone()
+            records = conn.execute("""
+                SELECT l.op, l.at, a.name AS actor, c.name AS claimed, l.data
+                FROM audit_log l
+                JOIN audit_actors a ON a.id = l.actor_id
+                LEFT JOIN audit_actors c ON c.id = l.claimed_id
+                WHERE l.table_name = ? AND l.row_id = ? AND l.op != 'S'
+                ORDER BY l.at DESC, l.id DESC
+            """, (table, row_id)).fetchall()
+        state = dict(current) if current else {}
+        history = []
+        for op, at, actor, claimed, data in records:
+            entry = {"op": AUDIT_OPS[op], "at": _audit_time(at), "actor": actor, "claimed": claimed}
+            if op == "U":
+                old = json.loads(data)
+                entry["changes"] = {field: [value, state.get(field)] for field, value in old.items()}
+                state.update(old)
+            else:
+                if op == "D":
+                    state = {field: value for field, value in json.loads(data).items() if field in fields}
+                entry["row"] = dict(state)
+            history.append(entry)
+        return history
+
+    @staticmethod
+    @cached("instruments", "columns", "maintenance")
+    def as_of(table: str, row_id: int, at):
+        # The row's fields as they were at that moment, or None if it did not
+        # exist then. Starts from the first full copy (snapshot or delete)
+        # after the moment, or the current row, and undoes the deltas between.
+        fields = _audited(table)
+        at_ms = _audit_ms(at)
+        with get_connection() as conn:
+            records = conn.execute("""
+                SELECT op, data FROM audit_log
+                WHERE table_name = ? AND row_id = ? AND at > ?
+                ORDER BY at, id
+            """, (table, row_id, at_ms))
+            deltas, base = [], None
+            for op, data in records:
+                if op == "I":
+                    return None
+                if op == "U":
+                    deltas.append(json.loads(data))
+                else:
+                    base = json.loads(data)
+                    break
+            if base is None:
+                row = conn.execute(
+                    f"SELECT {', '.join(fields)}, created_at FROM {table} WHERE id = ?", (row_id,)
+                ).fetchone()
+                if row is None:
+                    return None
+                base = dict(row)
+        # Rows from before the audit log have no insert record.
+        if (base.pop("created_at", None) or "") > _audit_time(at_ms)[:19]:
+            return None
+        for delta in reversed(deltas):
+            base.update(delta)
+        return {"id": row_id, **base}
+
+
+class PlanRepository:
+    @staticmethod
+    @cached("maintenance_plans")
+    def get_type_plans():
+        with get_connection() as conn:
+            cursor = conn.execute("""
+                SELECT * FROM maintenance_plans WHERE instrument_id IS NULL
+                ORDER BY instrument_type, maintenance_type, interval_months, id
+            """)
+            return [dict(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    @cached("maintenance_plans")
+    def get_by_instrument(instrument_id: int):
+        with get_connection() as conn:
+            cursor = conn.execute("""
+                SELECT * FROM maintenance_plans WHERE instrument_id = ?
+                ORDER BY maintenance_type, interval_months, id
+            """, (instrument_id,))
+            return [dict(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    @writes("maintenance_plans")
+    def create(maintenance_type: str, interval_months: int, instrument_id: Optional[int] = None,
+               instrument_type: Optional[str] = None, description: str = None):
+        # A plan is for one instrument or for every instrument of a type.
+        if (instrument_id is None) == (instrument_type is None):
+            raise ValueError("En plan gjelder enten ett instrument eller en instrumenttype")
+        with get_connection() as conn:
+            conn.execute("""
+                INSERT INTO maintenance_plans (instrument_id, instrument_type, maintenance_type, interval_months, description)
+                VALUES (?, ?, ?, ?, ?)
+            """, (instrument_id, instrument_type, maintenance_type, interval_months, description))
+            return conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+
+    @staticmethod
+    @writes("maintenance_plans")
+    def update(plan_id: int, maintenance_type: str, interval_months: int, description: str = None,
+               expected_version: Optional[int] = None):
+        with get_connection() as conn:
+            return _versioned_update(
+                conn, "maintenance_plans", plan_id, expected_version,
+                "maintenance_type=?, interval_months=?, description=?",
+                (maintenance_type, interval_months, description),
+            )
+
+    @staticmethod
+    @writes("maintenance_plans")
+    def delete(plan_id: int):
+        with get_connection() as conn:
+            conn.execute("DELETE FROM maintenance_plans WHERE id = ?", (plan_id,))
+
+
+_DUE_ROWS = """
+    SELECT d.instrument_id, d.plan_id, d.maintenance_type, d.interval_months, d.last_date, d.due_date,
+           CAST(julianday(d.due_date) - julianday('now', 'localtime', 'start of day') AS INTEGER) AS days_left,
+           i.name AS instrument_name, i.type AS instrument_type, i.status AS instrument_status,
+           p.instrument_type AS plan_type, p.description
+    FROM maintenance_due d
+    CROSS JOIN instruments i ON i.id = d.instrument_id
+    CROSS JOIN maintenance_plans p ON p.id = d.plan_id
+"""
+
+
+class DueRepository:
+    # Not cached: what is due moves with the date, and every read is a range
+    # on idx_due_date (or one instrument's few rows). CROSS JOIN in _DUE_ROWS
+    # keeps maintenance_due first, so pages come in index order unsorted.
+    @staticmethod
+    def get_page(within_days: Optional[int] = 30, after: Optional[tuple] = None, limit: int = PAGE_SIZE):
+        # Soonest first, overdue included; within_days=None lists every
+        # plan, a negative value only those overdue by more than that.
+        # after is the (due_date, instrument_id, plan_id) cursor returned
+        # with the previous page.
+        conditions, params = [], []
+        if within_days is not None:
+            conditions.append("d.due_date <= date('now', 'localtime', ?)")
+            params.append(f"{within_days:+d} days")
+        if after:
+            conditions.append("(d.due_date, d.instrument_id, d.plan_id) > (?, ?, ?)")
+            params.extend(after)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with get_connection() as conn:
+            cursor = conn.execute(
+                f"{_DUE_ROWS} {where} ORDER BY d.due_date, d.instrument_id, d.plan_id LIMIT ?", (*params, limit + 1)
+            )
+            return _page(cursor, limit, "due_date", "instrument_id", "plan_id")
+
+    @staticmethod
+    def get_by_instrument(instrument_id: int):
+        with get_connection() as conn:
+            cursor = conn.execute(f"{_DUE_ROWS} WHERE d.instrument_id = ? ORDER BY d.due_date, d.plan_id",
+                                  (instrument_id,))
+            return [dict(row) for row in cursor.fetchall()]
+
+    @staticmethod
+    def summary(within_days: int = 30):
+        # Counts of overdue plans and plans due within within_days, and the
+        # instruments needing attention: out of normal operation, or with a
+        # plan overdue.
+        with get_connection() as conn:
+            overdue, due_soon = (conn.execute(
+                "SELECT count(*) FROM maintenance_due WHERE due_date < date('now', 'localtime', ?)", (days,)
+            ).fetchone()[0] for days in ("+0 days", f"+{within_days + 1} days"))
+            # One short index probe per instrument is far cheaper than
+            # de-duplicating a long list of overdue rows.
+            instruments_overdue, overdue_active = conn.execute("""
+                SELECT count(*), count(*) FILTER (WHERE status = 'Active') FROM instruments i
+                WHERE EXISTS (SELECT 1 FROM maintenance_due
+                              WHERE instrument_id = i.id AND due_date < date('now', 'localtime'))
+            """).fetchone()
+            inactive = conn.execute(
+                "SELECT coalesce(sum(count), 0) FROM stats WHERE scope = 'instrument_status' AND key != 'Active'"
+            ).fetchone()[0]
+        return {
+            "overdue": overdue,
+            "due_soon": due_soon - overdue,
+            "instruments_overdue": instruments_overdue,
+            "needs_attention": inactive + overdue_active,
+        }
+
+    @staticmethod
+    @writes("maintenance_plans")
+    def rebuild():
+        with get_connection() as conn:
+            rebuild_due(conn)
+
+
+class StatsRepository:
+    @staticmethod
+    @cached("stats", "instruments", "columns", "maintenance")
+    def get_scope(scope: str):
+        with get_connection() as conn:
+            cursor = conn.execute(
+                "SELECT key, count, total FROM stats WHERE scope = ? AND count > 0 ORDER BY key", (scope,)
+            )
+            return {row["key"]: (row["count"], row["total"]) for row in cursor.fetchall()}
+
+    @staticmethod
+    @cached("stats", "instruments", "columns", "maintenance")
+    def get_dashboard(months: int = 12):
+        with get_connection() as conn:
+            rows = conn.execute("""
+                SELECT scope, key, count, total FROM stats
+                WHERE scope IN ('instrument_type', 'instrument_status', 'column_status') AND count > 0
+            """).fetchall()
+            recent_months = conn.execute("""
+                SELECT key, count, total FROM stats
+                WHERE scope = 'maintenance_month' AND count > 0
+                  AND key > strftime('%Y-%m', 'now', 'localtime', 'start of month', ?)
+                  AND key <= strftime('%Y-%m', 'now', 'localtime')
+                ORDER BY key
+            """, (f"-{months} months",)).fetchall()
+        counts = {"instrument_type": {}, "instrument_status": {}, "column_status": {}}
+        for row in rows:
+            counts[row["scope"]][row["key"]] = row["count"]
+        instruments = sum(counts["instrument_type"].values())
+        return {
+            "instruments": instruments,
+            "instrument_types": counts["instrument_type"],
+            "instrument_statuses": counts["instrument_status"],
+            # Only the status half of "needs attention"; DueRepository.summary()
+            # adds the overdue plans and is the figure the dashboard shows.
+            "not_active": instruments - counts["instrument_status"].get("Active", 0),
+            "column_statuses": counts["column_status"],
+            "maintenance_months": [dict(row) for row in recent_months],
+        }
+
+    @staticmethod
+    @writes("stats")
+    def rebuild():
+        with get_connection() as conn:
+            rebuild_stats(conn)
+
+
+class ChangeRepository:
+    # Not cached: the log is written by triggers, not by the repository
+    # methods the cache tracks, and reading it is a primary key range scan.
+    @staticmethod
+    def latest_seq():
+        # From sqlite_sequence, so it stays right after compact() has
+        # emptied the table.
+        with get_connection() as conn:
+            row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'changes'").fetchone()
+            return row[0] if row else 0
+
+    @staticmethod
+    def since(seq: int, limit: int = 1000):
+        # Changes after seq, oldest first. last_seq is where to continue from;
+        # reset means entries after seq were compacted away, so the reader
+        # must reload everything instead.
+        with get_connection() as conn:
+            latest = ChangeRepository.latest_seq()
+            oldest = conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+            reset = seq < latest and (oldest is None or oldest > seq + 1)
+            cursor = conn.execute("""
+                SELECT seq, table_name, row_id, op, changed_at FROM changes
+                WHERE seq > ? AND seq <= ? ORDER BY seq LIMIT ?
+            """, (seq, latest, limit + 1))
+            changes = [dict(row) for row in cursor.fetchall()]
+        more = len(changes) > limit
+        if more:
+            changes = changes[:limit]
+        return {
+            "changes": changes,
+            "last_seq": changes[-1]["seq"] if more else max(seq, latest),
+            "more": more,
+            "reset": reset,
+        }
+
+    @staticmethod
+    def compact(keep_days: int = CHANGES_KEEP_DAYS, keep_rows: int = CHANGES_KEEP_ROWS):
+        # Entries are kept for keep_days, but never more than the newest
+        # keep_rows of them. Returns the number of entries removed.
+        with get_connection() as conn:
+            latest = ChangeRepository.latest_seq()
+            # seq and changed_at grow together, so walking back from the
+            # newest entry stops at the first one that is old enough.
+            row = conn.execute(
+                "SELECT seq FROM changes WHERE changed_at < datetime('now', ?) ORDER BY seq DESC LIMIT 1",
+                (f"-{keep_days} days",)
+            ).fetchone()
+            cutoff = max(latest - keep_rows, row[0] if row else 0)
+            if cutoff <= 0:
+                return 0
+            return conn.execute("DELETE FROM changes WHERE seq <= ?", (cutoff,)).rowcount
+
+
+class SearchRepository:
+    FIELD_WEIGHTS = {"title": 10, "body": 3, "context": 1}
+    SNIPPET_WORDS = 10
+
+    @staticmethod
+    def catch_up():
+        # Indexes rows written by tools that do not go through @writes (the
+        # sqlite3 shell, say); run where the app and server start.
+        with get_connection() as conn:
+            connection_manager.touch("search_index")
+            return sync_search_index(conn)
+
+    @staticmethod
+    def terms(text: str):
+        # Words followed by a space are finished and match whole tokens; only
+        # the word still being typed is matched as a prefix. Single letters
+        # would match most of the index and are ignored until a second one.
+        words = re.findall(r"\w+", text.casefold())
+        if not words:
+            return []
+        terms = [(word, False) for word in words[:-1]]
+        if text[-1:].isspace():
+            terms.append((words[-1], False))
+        elif len(words[-1]) >= 2:
+            terms.append((words[-1], True))
+        return terms
+
+    @staticmethod
+    def build_query(terms) -> Optional[str]:
+        return " ".join(f'"{word}"*' if prefix else f'"{word}"' for word, prefix in terms) or None
+
+    @staticmethod
+    def _pattern(terms):
+        # One match per token that equals a finished word or starts with the
+        # word being typed; a token-by-token loop made scoring the candidates
+        # the larger part of a keystroke.
+        words = [rf"{re.escape(word)}\w*" if prefix else rf"{re.escape(word)}(?!\w)" for word, prefix in terms]
+        return re.compile(rf"(?<!\w)(?:{'|'.join(words)})")
+
+    @staticmethod
+    def _score(result, pattern):
+        return sum(weight * len(pattern.findall((result[field] or "").casefold()))
+                   for field, weight in SearchRepository.FIELD_WEIGHTS.items())
+
+    @staticmethod
+    def _snippet(text: str, pattern):
+        words = (text or "").split()
+        for i, word in enumerate(words):
+            if pattern.search(word.casefold()):
+                start = max(0, i - 2)
+                break
+        else:
+            start = 0
+        snippet = " ".join(words[start:start + SearchRepository.SNIPPET_WORDS])
+        if start > 0:
+            snippet = "…" + snippet
+        if start + SearchRepository.SNIPPET_WORDS < len(words):
+            snippet += "…"
+        return snippet
+
+    @staticmethod
+    def search(text: str, limit: int = 50, candidates: int = SEARCH_CANDIDATES):
+        terms = SearchRepository.terms(text)
+        query = SearchRepository.build_query(terms)
+        if query is None:
+            return []
+        with get_connection() as conn:
+            # Ranking every hit of a common prefix (bm25 or otherwise) does not
+            # fit a keystroke budget on large tables. Walking the index in rowid
+            # order lets FTS5 stop after the newest candidates, which are then
+            # ranked here by where the terms match. Title hits get a walk of
+            # their own first, in search_titles, so a flood of newer body or
+            # context hits (an instrument's maintenance, say) cannot crowd out
+            # the row it names.
+            columns = "rowid, kind, ref_id, instrument_id, title, body, context"
+            cursor = conn.execute(f"""
+                SELECT {columns}
+                FROM search_index
+                WHERE rowid IN (
+                    SELECT rowid FROM search_titles WHERE search_titles MATCH ? ORDER BY rowid DESC LIMIT ?
+                )
+            """, (query, candidates))
+            rows = {row["rowid"]: dict(row) for row in cursor.fetchall()}
+            cursor = conn.execute(f"""
+                SELECT {columns}
+                FROM search_index
+                WHERE search_index MATCH ?
+                ORDER BY rowid DESC
+                LIMIT ?
+            """, (query, candidates))
+            for row in cursor.fetchall():
+                rows.setdefault(row["rowid"], dict(row))
+        pattern = SearchRepository._pattern(terms)
+        rows = sorted(rows.values(), key=lambda row: SearchRepository._score(row, pattern), reverse=True)
+        results = []
+        for row in rows[:limit]:
+            results.append({
+                "rowid": row["rowid"],
+                "kind": row["kind"],
+                "ref_id": row["ref_id"],
+                "instrument_id": row["instrument_id"],
+                "title": row["title"],
+                "context": row["context"],
+                "snippet": SearchRepository._snippet(row["body"] or row["title"], pattern),
+            })
+        return results
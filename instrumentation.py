@@ -0,0 +1,255 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+# Queries and views slower than these (milliseconds) are written to the slow
+# log. Everything is aggregated in memory for the diagnostics view.
+SLOW_QUERY_MS = 50.0
+SLOW_VIEW_MS = 200.0
+LOG_PATH = "instruments-slow.jsonl"
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+MAX_TRACKED = 500
+
+_lock = threading.Lock()
+_queries = {}
+_views = {}
+_logger = None
+enabled = True
+
+
+def configure(log_path: str = None, slow_query_ms: float = None, slow_view_ms: float = None,
+              max_bytes: int = None, backups: int = None, enable: bool = None):
+    global LOG_PATH, SLOW_QUERY_MS, SLOW_VIEW_MS, LOG_MAX_BYTES, LOG_BACKUPS, _logger, enabled
+    with _lock:
+        if log_path is not None:
+            LOG_PATH = log_path
+        if slow_query_ms is not None:
+            SLOW_QUERY_MS = slow_query_ms
+        if slow_view_ms is not None:
+            SLOW_VIEW_MS = slow_view_ms
+        if max_bytes is not None:
+            LOG_MAX_BYTES = max_bytes
+        if backups is not None:
+            LOG_BACKUPS = backups
+        if enable is not None:
+            enabled = enable
+        if _logger is not None:
+            for handler in list(_logger.handlers):
+                _logger.removeHandler(handler)
+                handler.close()
+            _logger = None
+
+
+def _log(event: dict):
+    # The log file is only created once something slow happens, and logging
+    # is only imported then, which keeps it off the startup path.
+    global _logger
+    with _lock:
+        if _logger is None:
+            import logging
+            from logging.handlers import RotatingFileHandler
+            _logger = logging.getLogger("instruments.slow")
+            _logger.propagate = False
+            _logger.setLevel(logging.INFO)
+            handler = RotatingFileHandler(LOG_PATH, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS,
+                                          encoding="utf-8", delay=True)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            _logger.addHandler(handler)
+        logger = _logger
+    event["at"] = datetime.now().isoformat(timespec="milliseconds")
+    logger.info(json.dumps(event, ensure_ascii=False))
+
+
+def _track(table: dict, key, ms: float, **fields):
+    with _lock:
+        entry = table.get(key)
+        if entry is None:
+            if len(table) >= MAX_TRACKED:
+                # Forget the fastest entry to make room.
+                del table[min(table, key=lambda k: table[k]["max_ms"])]
+            entry = table[key] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0}
+        entry["count"] += 1
+        entry["total_ms"] += ms
+        if ms >= entry["max_ms"]:
+            entry["max_ms"] = ms
+            entry.update(fields)
+
+
+def param_shape(parameters):
+    # Types only: parameter values may be personal data and stay out of logs.
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    try:
+        return [type(value).__name__ for value in parameters]
+    except TypeError:
+        return None
+
+
+def record_query(sql: str, shape, ms: float, rows: int):
+    sql = " ".join(sql.split())
+    _track(_queries, sql, ms, shape=shape, rows=rows)
+    if ms >= SLOW_QUERY_MS:
+        _log({"type": "query", "sql": sql, "params": shape, "ms": round(ms, 3), "rows": rows,
+              "thread": threading.current_thread().name})
+
+
+def record_view(name: str, build_ms: float, wait_ms: float, render_ms: float):
+    total = build_ms + wait_ms + render_ms
+    _track(_views, name, total, build_ms=build_ms, wait_ms=wait_ms, render_ms=render_ms)
+    if total >= SLOW_VIEW_MS:
+        _log({"type": "view", "name": name, "ms": round(total, 3), "build_ms": round(build_ms, 3),
+              "wait_ms": round(wait_ms, 3), "render_ms": round(render_ms, 3)})
+
+
+def slowest_queries(n: int = 20):
+    with _lock:
+        items = [dict(entry, sql=sql) for sql, entry in _queries.items()]
+    return sorted(items, key=lambda entry: entry["max_ms"], reverse=True)[:n]
+
+
+def slowest_views(n: int = 20):
+    with _lock:
+        items = [dict(entry, name=name) for name, entry in _views.items()]
+    return sorted(items, key=lambda entry: entry["max_ms"], reverse=True)[:n]
+
+
+def reset():
+    with _lock:
+        _queries.clear()
+        _views.clear()
+
+
+def explain(conn, sql: str, shape):
+    # Plans are taken with NULL for every parameter, since values are not kept.
+    if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+        return []
+    if isinstance(shape, dict):
+        parameters = dict.fromkeys(shape)
+    else:
+        parameters = [None] * len(shape or ())
+    cursor = sqlite3.Cursor.execute(conn.cursor(), f"EXPLAIN QUERY PLAN {sql}", parameters)
+    return [(row[0], row[1], row[3]) for row in cursor.fetchall()]
+
+
+# Connection and cursor classes that time every statement. The trace callback
+# hook only reports SQL text, so timing wraps execute() and the fetch calls:
+# a statement's time is its execute plus all fetches until the rows run out
+# or the cursor is reused or dropped.
+class TracedCursor(sqlite3.Cursor):
+    _record = None
+
+    def _finish(self):
+        record = self._record
+        if record is not None:
+            self._record = None
+            record_query(record[0], record[1], record[2] * 1000, record[3])
+
+    def _start(self, sql, shape, started):
+        elapsed = time.perf_counter() - started
+        self._record = [sql, shape, elapsed, 0]
+        if self.description is None:
+            # Nothing to fetch (INSERT, UPDATE, DDL): done already.
+            self._record[3] = max(self.rowcount, 0)
+            self._finish()
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        if not enabled:
+            return super().execute(sql, parameters)
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self._start(sql, param_shape(parameters), started)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        if not enabled:
+            return super().executemany(sql, seq_of_parameters)
+        started = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._start(sql, "many", started)
+        return self
+
+    def _fetched(self, started, count, exhausted):
+        record = self._record
+        if record is not None:
+            record[2] += time.perf_counter() - started
+            record[3] += count
+            if exhausted:
+                self._finish()
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows), not rows)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows), True)
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0, True)
+            raise
+        self._fetched(started, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+
+class TracedConnection(sqlite3.Connection):
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class ViewTiming:
+    # Times one show_* call: build is the synchronous part (creating or
+    # reusing the view and queueing its reads), wait is until the data
+    # arrives on the Tk thread, render is the callback that draws it.
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.dispatched = None
+        self.finished = None
+
+    def dispatch(self):
+        self.dispatched = time.perf_counter()
+
+    def wrap(self, callback):
+        def timed(*args):
+            arrived = time.perf_counter()
+            try:
+                return callback(*args)
+            finally:
+                self.finished = time.perf_counter()
+                if enabled:
+                    dispatched = self.dispatched or arrived
+                    record_view(self.name, (dispatched - self.started) * 1000, (arrived - dispatched) * 1000,
+                                (self.finished - arrived) * 1000)
+        return timed
@@ -1,9 +1,436 @@
-import customtkinter as ctk
-from app import InstrumentApp
+import argparse
+import json
+import os
+import sys
+import time
 
-def main():
-    app = InstrumentApp()
+STARTED = time.perf_counter()
+
+# Headless commands only import database (and transfer for import/export);
+# customtkinter is loaded by the gui command alone.
+QUERY_PAGE_SIZE = 1000
+FORMATS = ("json", "jsonl", "csv")
+
+
+def profile_startup(client=None):
+    # Imports the app's modules one at a time so each line is that module's
+    # own cost, then starts the app and quits once the dashboard is drawn.
+    marks = []
+    for module in ("customtkinter", "instrumentation", "database", "widgets", "views", "worker", "app"):
+        __import__(module)
+        marks.append((f"import {module}", time.perf_counter()))
+
+    from app import InstrumentApp
+    app = InstrumentApp(client)
+
+    def wait():
+        if app.first_view is None or app.first_view.finished is None:
+            app.after(5, wait)
+            return
+        marks.extend((f"init: {name}", at) for name, at in app.startup_marks.items())
+        marks.append(("init: dashboard", app.first_view.finished))
+        app.on_close()
+
+    app.after(5, wait)
+    app.mainloop()
+
+    previous = STARTED
+    for name, at in marks:
+        print(f"{name:<28}{(at - previous) * 1000:>9.1f} ms")
+        previous = at
+    print(f"{'total':<28}{(previous - STARTED) * 1000:>9.1f} ms")
+
+
+def run_gui(args):
+    client = None
+    if args.server:
+        from client import RemoteClient, install
+        client = RemoteClient(args.server)
+        install(client)
+    if args.profile_startup:
+        profile_startup(client)
+        return 0
+    from app import InstrumentApp
+    app = InstrumentApp(client)
     app.mainloop()
+    return 0
+
+
+def run_serve(args):
+    import server
+
+    scheduler = None
+    if args.backup_every:
+        from backup import BackupScheduler
+        scheduler = BackupScheduler(
+            args.backup_dir, args.backup_every * 60,
+            on_done=lambda manifest, removed: print(
+                f"sikkerhetskopi {manifest['file']}: {manifest['copy_mb_per_s']} MB/s, "
+                f"lengste lås {manifest['lock_max_ms']} ms", flush=True
+            ),
+            on_error=lambda e: print(f"sikkerhetskopi feilet: {e}", file=sys.stderr, flush=True)
+        )
+        scheduler.start()
+    try:
+        server.serve(
+            args.host, args.port, readers=args.readers, group_max=args.group_max,
+            on_ready=lambda port: print(f"lytter på http://{args.host}:{port}", flush=True)
+        )
+    finally:
+        if scheduler is not None:
+            scheduler.stop()
+    return 0
+
+
+def write_rows(rows, fmt: str, out):
+    # Writes rows (dicts) as they come, so paged queries stream instead of
+    # being collected first.
+    if fmt == "csv":
+        import csv
+        writer = None
+        for row in rows:
+            if writer is None:
+                writer = csv.DictWriter(out, fieldnames=list(row), extrasaction="ignore")
+                writer.writeheader()
+            writer.writerow(row)
+    elif fmt == "jsonl":
+        for row in rows:
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+    else:
+        out.write("[")
+        for i, row in enumerate(rows):
+            out.write(("," if i else "") + "\n  " + json.dumps(row, ensure_ascii=False))
+        out.write("\n]\n")
+
+
+def paged(fetch, *args):
+    after = None
+    while True:
+        rows, after = fetch(*args, after=after, limit=QUERY_PAGE_SIZE)
+        yield from rows
+        if after is None:
+            return
+
+
+def change_log(since):
+    # since=None lists whatever the log still holds.
+    from database import ChangeRepository
+
+    strict, since = since is not None, since or 0
+    while True:
+        log = ChangeRepository.since(since, limit=QUERY_PAGE_SIZE)
+        if log["reset"] and strict:
+            raise ValueError(f"Endringsloggen har ikke lenger alt etter {since}")
+        yield from log["changes"]
+        if not log["more"]:
+            return
+        since = log["last_seq"]
+
+
+def run_query(args):
+    from database import (InstrumentRepository, ColumnRepository, MaintenanceRepository, SearchRepository,
+                          PlanRepository, DueRepository, DateRepository)
+
+    if args.what == "instruments":
+        rows = paged(InstrumentRepository.get_page, args.type)
+    elif args.what == "columns":
+        rows = paged(ColumnRepository.get_page)
+    elif args.what == "maintenance":
+        if args.start or args.end:
+            rows = paged(MaintenanceRepository.get_between, args.start, args.end, args.instrument)
+        elif args.instrument is None:
+            raise ValueError("query maintenance krever --instrument ID eller --from/--to")
+        else:
+            rows = paged(MaintenanceRepository.get_page_by_instrument, args.instrument)
+    elif args.what == "installs":
+        rows = paged(ColumnRepository.get_installed_between, args.start, args.end)
+    elif args.what == "date-issues":
+        rows = DateRepository.issues()
+    elif args.what == "recent":
+        rows = MaintenanceRepository.get_recent(args.limit or 10)
+    elif args.what == "changes":
+        rows = change_log(args.since)
+    elif args.what == "due":
+        rows = (DueRepository.get_by_instrument(args.instrument) if args.instrument is not None
+                else paged(DueRepository.get_page, args.days))
+    elif args.what == "plans":
+        rows = (PlanRepository.get_by_instrument(args.instrument) if args.instrument is not None
+                else PlanRepository.get_type_plans())
+    else:
+        if not args.text:
+            raise ValueError("query search krever en søketekst")
+        rows = SearchRepository.search(" ".join(args.text), limit=args.limit or 50)
+    write_rows(rows, args.format, sys.stdout)
+    return 0
+
+
+def run_plan(args):
+    from database import PlanRepository
+
+    if args.action == "delete":
+        if args.id is None:
+            raise ValueError("plan delete krever --id")
+        PlanRepository.delete(args.id)
+        return 0
+    if args.maintenance is None or args.months is None:
+        raise ValueError("plan add krever --maintenance og --months")
+    plan_id = PlanRepository.create(
+        args.maintenance, args.months, instrument_id=args.instrument, instrument_type=args.type,
+        description=args.description
+    )
+    print(plan_id)
+    return 0
+
+
+def run_audit(args):
+    from database import AuditRepository
+
+    if args.at:
+        row = AuditRepository.as_of(args.table, args.id, args.at)
+        if row is None:
+            raise ValueError(f"{args.table} {args.id} fantes ikke {args.at}")
+        rows = [row]
+    else:
+        rows = AuditRepository.history(args.table, args.id)
+    write_rows(rows, args.format, sys.stdout)
+    return 0
+
+
+def run_backup(args):
+    import backup
+
+    if args.action == "create":
+        manifest = backup.create_backup(args.dir, compression=args.compression)
+        manifest["removed"] = [] if args.keep_all else backup.prune(args.dir)
+        json.dump(manifest, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return 0
+    if args.action == "list":
+        write_rows(backup.list_backups(args.dir), args.format, sys.stdout)
+        return 0
+    if args.action == "prune":
+        write_rows(({"removed": name} for name in backup.prune(args.dir)), args.format, sys.stdout)
+        return 0
+    if args.action == "restore":
+        if args.file is None:
+            raise ValueError("backup restore krever en fil")
+        json.dump(backup.restore_backup(args.file, keep_current=not args.no_copy, directory=args.dir), sys.stdout,
+                  indent=2)
+        sys.stdout.write("\n")
+        return 0
+    # verify: the file given, or every snapshot in the directory.
+    directory = args.dir or backup.default_directory()
+    paths = [args.file] if args.file else [os.path.join(directory, manifest["file"])
+                                           for manifest in backup.list_backups(directory)]
+    results = [{"file": path, "problems": backup.verify_backup(path)} for path in paths]
+    write_rows(results, args.format, sys.stdout)
+    return 1 if any(result["problems"] for result in results) else 0
+
+
+def run_stats(args):
+    from database import STATS_SCOPES, StatsRepository
+
+    if args.format == "json":
+        json.dump(StatsRepository.get_dashboard(args.months), sys.stdout, indent=2, ensure_ascii=False)
+        sys.stdout.write("\n")
+        return 0
+    rows = (
+        {"scope": scope, "key": key, "count": count, "total": total}
+        for scope in STATS_SCOPES
+        for key, (count, total) in StatsRepository.get_scope(scope).items()
+    )
+    write_rows(rows, args.format, sys.stdout)
+    return 0
+
+
+def run_analyse(args):
+    from analytics import PERIODS, AnalyticsRepository
+
+    if args.by in PERIODS:
+        rows = AnalyticsRepository.over_time(args.by, args.start, args.end, args.type)
+    elif args.type:
+        raise ValueError("--type gjelder bare month, quarter og year")
+    elif args.by == "type":
+        rows = AnalyticsRepository.by_type(args.start, args.end)
+    elif args.by == "manufacturer":
+        rows = AnalyticsRepository.by_manufacturer(args.start, args.end)
+    else:
+        rows = AnalyticsRepository.by_instrument(args.start, args.end)
+    write_rows(rows, args.format, sys.stdout)
+    return 0
+
+
+def run_export(args):
+    import transfer
+
+    if args.target == "-":
+        if args.table is None:
+            raise ValueError("eksport til stdout krever --table")
+        from database import ChangeRepository, get_connection
+        delta = None
+        if args.since is not None:
+            if ChangeRepository.since(args.since, limit=1)["reset"]:
+                raise ValueError(f"Endringsloggen har ikke lenger alt etter {args.since}; ta en full eksport")
+            delta = (args.since, ChangeRepository.latest_seq())
+        with get_connection() as conn:
+            transfer.write_table_csv(conn, args.table, sys.stdout, delta=delta)
+        return 0
+    manifest = transfer.export_all_to_csv(args.target, compression=args.compression, since=args.since)
+    json.dump(manifest, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 0
+
+
+def run_import(args):
+    import shutil
+    import tempfile
+    import transfer
+
+    if args.source != "-":
+        if not any(transfer.find_table_file(args.source, table) for table in transfer.EXPORT_TABLES):
+            raise FileNotFoundError(f"Fant ingen CSV-filer i {args.source}")
+        summary = transfer.import_all_from_csv(args.source)
+    else:
+        if args.table is None:
+            raise ValueError("import fra stdin krever --table")
+        # The importer reads table files from a folder; stdin is copied into
+        # one in chunks, so memory use stays flat.
+        with tempfile.TemporaryDirectory() as tmp:
+            with open(os.path.join(tmp, f"{args.table}.csv"), "wb") as f:
+                shutil.copyfileobj(sys.stdin.buffer, f, 1 << 20)
+            summary = transfer.import_all_from_csv(tmp)
+    json.dump(summary, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 0 if not summary["skipped"] or not args.strict else 1
+
+
+def build_parser():
+    tables = ("instruments", "columns", "maintenance")
+    parser = argparse.ArgumentParser(description="Instrumentoversikt")
+    parser.add_argument("--db", help="databasefil (standard: instruments.db)")
+    commands = parser.add_subparsers(dest="command")
+
+    gui = commands.add_parser("gui", help="start det grafiske programmet (standard)")
+    gui.add_argument("--profile-startup", action="store_true", help="skriv ut import- og oppstartstider og avslutt")
+    gui.add_argument("--server", help="bruk en server (f.eks. http://lab-pc:8765) i stedet for databasefilen")
+    gui.set_defaults(run=run_gui)
+
+    serve = commands.add_parser("serve", help="del databasen med andre klienter over HTTP/JSON")
+    serve.add_argument("--host", default="127.0.0.1", help="adressen det lyttes på (standard: bare lokalt)")
+    serve.add_argument("--port", type=int, default=8765, help="0 velger en ledig port")
+    serve.add_argument("--readers", type=int, default=4, help="antall lesetråder")
+    serve.add_argument("--group-max", type=int, default=100, help="maks skrivinger per transaksjon")
+    serve.add_argument("--backup-every", type=int, metavar="MIN", help="ta sikkerhetskopi hvert MIN. minutt")
+    serve.add_argument("--backup-dir", help="mappe for sikkerhetskopier (standard: backups ved databasen)")
+    serve.set_defaults(run=run_serve)
+
+    imp = commands.add_parser("import", help="importer CSV-filer fra en mappe, eller én tabell fra stdin")
+    imp.add_argument("source", help="mappe, eller - for stdin")
+    imp.add_argument("--table", choices=tables, help="tabellen som leses fra stdin")
+    imp.add_argument("--strict", action="store_true", help="avslutt med kode 1 hvis rader ble hoppet over")
+    imp.set_defaults(run=run_import)
+
+    exp = commands.add_parser("export", help="eksporter til en mappe, eller én tabell som CSV til stdout")
+    exp.add_argument("target", help="mappe, eller - for stdout")
+    exp.add_argument("--table", choices=tables, help="tabellen som skrives til stdout")
+    exp.add_argument("--compression", choices=("gzip", "xz"))
+    exp.add_argument("--since", type=int, help="bare endringer etter denne sekvensen (seq i en tidligere manifest.json)")
+    exp.set_defaults(run=run_export)
+
+    query = commands.add_parser(
+        "query", help="skriv ut instrumenter, kolonner, vedlikehold, søketreff, endringer, forfall eller planer"
+    )
+    query.add_argument(
+        "what", choices=("instruments", "columns", "maintenance", "installs", "recent", "search", "changes", "due",
+                         "plans", "date-issues")
+    )
+    query.add_argument("text", nargs="*", help="søketekst for search")
+    query.add_argument("--type", help="instrumenttype for instruments")
+    query.add_argument("--instrument", type=int, help="instrument-id for maintenance, due og plans")
+    query.add_argument("--limit", type=int, help="antall rader for recent og search")
+    query.add_argument("--since", type=int, help="sekvensen changes starter etter (standard: alt som er lagret)")
+    query.add_argument("--days", type=int, default=30, help="due: forfall innen så mange dager (standard 30)")
+    query.add_argument("--from", dest="start", help="maintenance og installs: første dato (ÅÅÅÅ-MM-DD)")
+    query.add_argument("--to", dest="end", help="maintenance og installs: siste dato (ÅÅÅÅ-MM-DD)")
+    query.add_argument("--format", choices=FORMATS, default="json")
+    query.set_defaults(run=run_query)
+
+    plan = commands.add_parser("plan", help="legg til eller slett en vedlikeholdsplan")
+    plan.add_argument("action", choices=("add", "delete"))
+    plan.add_argument("--id", type=int, help="planen som skal slettes")
+    plan.add_argument("--instrument", type=int, help="planen gjelder dette instrumentet")
+    plan.add_argument("--type", help="planen gjelder alle instrumenter av denne typen")
+    plan.add_argument("--maintenance", help="vedlikeholdstype, f.eks. Calibration")
+    plan.add_argument("--months", type=int, help="intervall i måneder")
+    plan.add_argument("--description", help="beskrivelse")
+    plan.set_defaults(run=run_plan)
+
+    analyse = commands.add_parser("analyse", help="vedlikeholdskostnader per periode, type, produsent eller instrument")
+    analyse.add_argument("by", choices=("month", "quarter", "year", "type", "manufacturer", "instrument"))
+    analyse.add_argument("--from", dest="start", help="første dato (ÅÅÅÅ-MM-DD)")
+    analyse.add_argument("--to", dest="end", help="siste dato (ÅÅÅÅ-MM-DD)")
+    analyse.add_argument("--type", help="bare én vedlikeholdstype (for month, quarter og year)")
+    analyse.add_argument("--format", choices=FORMATS, default="json")
+    analyse.set_defaults(run=run_analyse)
+
+    audit = commands.add_parser("audit", help="endringshistorikken til en rad, eller raden slik den var --at")
+    audit.add_argument("table", choices=tables)
+    audit.add_argument("id", type=int)
+    audit.add_argument("--at", help="tidspunkt i UTC (ÅÅÅÅ-MM-DD eller ÅÅÅÅ-MM-DD TT:MM:SS)")
+    audit.add_argument("--format", choices=FORMATS, default="json")
+    audit.set_defaults(run=run_audit)
+
+    bak = commands.add_parser("backup", help="ta, list, kontroller, rydd eller gjenopprett sikkerhetskopier")
+    bak.add_argument("action", choices=("create", "list", "verify", "prune", "restore"))
+    bak.add_argument("file", nargs="?", help="sikkerhetskopien for verify og restore")
+    bak.add_argument("--dir", help="mappe for sikkerhetskopier (standard: backups ved databasen)")
+    bak.add_argument("--compression", choices=("gzip", "xz"), default="gzip")
+    bak.add_argument("--keep-all", action="store_true", help="create: ikke slett gamle sikkerhetskopier")
+    bak.add_argument("--no-copy", action="store_true", help="restore: ikke ta kopi av databasen først")
+    bak.add_argument("--format", choices=FORMATS, default="json")
+    bak.set_defaults(run=run_backup)
+
+    stats = commands.add_parser("stats", help="skriv ut statistikk")
+    stats.add_argument("--months", type=int, default=12, help="måneder med vedlikehold i json-utdata")
+    stats.add_argument("--format", choices=FORMATS, default="json")
+    stats.set_defaults(run=run_stats)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.command is None:
+        args.command, args.run, args.profile_startup, args.server = "gui", run_gui, False, None
+
+    import database
+    if args.db:
+        database.DATABASE_PATH = args.db
+    if args.command == "gui":
+        return args.run(args)
+
+    if hasattr(sys.stdout, "reconfigure"):
+        # csv writes its own line endings.
+        sys.stdout.reconfigure(newline="")
+    if args.command != "serve":
+        # One-shot commands read each row once, so caching them only costs
+        # copies.
+        database.query_cache.enabled = False
+    try:
+        if args.command != "backup":
+            # A backup copies the file as it is, and a restore must work even
+            # when the current database does not open.
+            database.init_db()
+        return args.run(args)
+    except BrokenPipeError:
+        # The reader went away (e.g. piped into head); that is not an error.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    except Exception as e:
+        print(f"feil: {e}", file=sys.stderr)
+        return 1
+    finally:
+        database.close_connections()
+
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
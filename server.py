@@ -0,0 +1,237 @@
+import asyncio
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import analytics
+import database
+from database import get_connection, init_db
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+READERS = 4
+# Writes queued while a group is being applied go into the next group, up to
+# this many per transaction.
+GROUP_COMMIT_MAX = 100
+MAX_BODY_BYTES = 1024 * 1024
+
+# Repository methods the server exposes, as /<Repository>/<method>.
+READS = {
+    "InstrumentRepository": ("get_all", "get_page", "get_by_id", "get_by_ids", "get_detail", "count"),
+    "ColumnRepository": ("get_by_instrument", "get_all", "get_page", "get_by_id", "get_by_ids",
+                         "get_installed_between"),
+    "MaintenanceRepository": ("get_by_instrument", "get_page_by_instrument", "get_recent", "get_by_id",
+                              "get_by_ids", "get_between"),
+    "StatsRepository": ("get_scope", "get_dashboard"),
+    "SearchRepository": ("search",),
+    "ChangeRepository": ("latest_seq", "since"),
+    "PlanRepository": ("get_type_plans", "get_by_instrument"),
+    "DueRepository": ("get_page", "get_by_instrument", "summary"),
+    "DateRepository": ("issues",),
+    "AuditRepository": ("history", "as_of"),
+    "AnalyticsRepository": ("by_type", "over_time", "by_instrument", "by_manufacturer", "overview"),
+}
+WRITES = {
+    "InstrumentRepository": ("create", "update", "delete", "create_many", "update_many", "set_status_many",
+                             "delete_many"),
+    "ColumnRepository": ("create", "update", "delete", "create_many", "update_many", "set_status_many", "delete_many"),
+    "MaintenanceRepository": ("create", "update", "delete", "create_many", "update_many", "delete_many"),
+    "PlanRepository": ("create", "update", "delete"),
+}
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 409: "Conflict",
+           413: "Payload Too Large", 500: "Internal Server Error"}
+# Errors caused by the request rather than the server.
+CLIENT_ERRORS = (ValueError, TypeError, sqlite3.IntegrityError)
+
+
+def repository_class(name: str):
+    # Repositories live in database, apart from the analytics one.
+    return getattr(analytics if name == "AnalyticsRepository" else database, name)
+
+
+def _operation(repository: str, method: str):
+    if method in READS.get(repository, ()):
+        return getattr(repository_class(repository), method), False
+    if method in WRITES.get(repository, ()):
+        return getattr(repository_class(repository), method), True
+    return None, False
+
+
+def _arguments(values):
+    # JSON has no tuples; page cursors come back as lists and must be
+    # hashable for the read cache.
+    return [tuple(value) if isinstance(value, list) else value for value in values]
+
+
+def prepare():
+    init_db()
+    database.ChangeRepository.compact()
+    database.SearchRepository.catch_up()
+
+
+def apply_group(calls):
+    # Runs a group of writes in one transaction on the writer thread. Each
+    # call gets its own savepoint, so a failing call is undone alone and the
+    # rest still commit together.
+    results = []
+    with get_connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        for func, args, kwargs, actor, claimed in calls:
+            conn.execute("SAVEPOINT request")
+            try:
+                with database.acting_as(actor, claimed):
+                    results.append((True, func(*args, **kwargs)))
+            except Exception as e:
+                conn.execute("ROLLBACK TO request")
+                results.append((False, e))
+            conn.execute("RELEASE request")
+    return results
+
+
+class Server:
+    def __init__(self, readers: int = READERS, group_max: int = GROUP_COMMIT_MAX):
+        self.group_max = group_max
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="api-read")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="api-write")
+        self._queue = None
+        self.groups = 0
+        self.writes = 0
+
+    async def _write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            group = [await self._queue.get()]
+            while len(group) < self.group_max and not self._queue.empty():
+                group.append(self._queue.get_nowait())
+            try:
+                results = await loop.run_in_executor(self._writer, apply_group, [call for call, _ in group])
+            except Exception as e:
+                # The commit itself failed: nothing in the group was written.
+                results = [(False, e)] * len(group)
+            self.groups += 1
+            self.writes += len(group)
+            for (_, future), (ok, value) in zip(group, results):
+                if future.cancelled():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    async def run(self, func, write: bool, args, kwargs, actor: str = None, claimed: str = None):
+        loop = asyncio.get_running_loop()
+        if not write:
+            return await loop.run_in_executor(self._readers, lambda: func(*args, **kwargs))
+        future = loop.create_future()
+        await self._queue.put(((func, args, kwargs, actor, claimed), future))
+        return await future
+
+    async def _dispatch(self, method: str, path: str, body: bytes, peer: str = None):
+        parts = path.split("?", 1)[0].strip("/").split("/")
+        if method == "GET" and parts == ["health"]:
+            return 200, {"ok": True, "schema_version": database.SCHEMA_VERSION}
+        if method == "GET" and parts == ["version"]:
+            # Changes whenever data may have changed: a write group was
+            # applied here, or another process committed to the file.
+            database.connection_manager.external_changes()
+            return 200, {"version": f"{self.groups}:{database.connection_manager.external_count}"}
+        if len(parts) != 2:
+            return 404, {"error": f"Ukjent adresse: {path}"}
+        if method != "POST":
+            return 405, {"error": "Bruk POST"}
+        func, write = _operation(*parts)
+        if func is None:
+            return 404, {"error": f"Ukjent operasjon: {'.'.join(parts)}"}
+        try:
+            request = json.loads(body or b"{}")
+            args = request.get("args", [])
+            kwargs = request.get("kwargs", {})
+            if not isinstance(args, list) or not isinstance(kwargs, dict):
+                raise ValueError("args må være en liste og kwargs et objekt")
+            args = _arguments(args)
+            kwargs = dict(zip(kwargs, _arguments(kwargs.values())))
+            # The audit log names the client by the address it connected
+            # from. The user@host it sends is only what it says it is, and
+            # is logged apart from that as claimed.
+            claimed = request.get("actor")
+            if claimed is not None and not isinstance(claimed, str):
+                raise ValueError("actor må være tekst")
+        except (ValueError, AttributeError) as e:
+            return 400, {"error": f"Ugyldig forespørsel: {e}"}
+        try:
+            return 200, {"result": await self.run(func, write, args, kwargs, peer, claimed)}
+        except database.ConflictError as e:
+            return 409, {"error": str(e)}
+        except CLIENT_ERRORS as e:
+            return 400, {"error": str(e)}
+        except Exception as e:
+            return 500, {"error": str(e)}
+
+    async def _handle(self, reader, writer):
+        # Minimal HTTP/1.1 with keep-alive: one JSON request and response at
+        # a time per connection.
+        peer = writer.get_extra_info("peername")
+        address = f"klient@{peer[0]}" if peer else None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    method, path, version = line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY_BYTES:
+                    status, payload, keep_alive = 413, {"error": "For stor forespørsel"}, False
+                else:
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = await self._dispatch(method, path, body, address)
+                    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    f"Content-Type: application/json; charset=utf-8\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            # Dropped connection or a malformed request: close it.
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, on_ready=None):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._writer, prepare)
+        self._queue = asyncio.Queue()
+        write_loop = asyncio.create_task(self._write_loop())
+        server = await asyncio.start_server(self._handle, host, port)
+        if on_ready:
+            on_ready(server.sockets[0].getsockname()[1])
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            write_loop.cancel()
+            self._readers.shutdown(wait=False, cancel_futures=True)
+            self._writer.shutdown(wait=True)
+
+
+def serve(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, readers: int = READERS,
+          group_max: int = GROUP_COMMIT_MAX, on_ready=None):
+    try:
+        asyncio.run(Server(readers, group_max).serve(host, port, on_ready))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,554 @@
+import csv
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from database import (SCHEMA_VERSION, ChangeRepository, connection_manager, get_connection, parse_date,
+                      sync_search_index)
+
+IMPORT_BATCH_SIZE = 5000
+EXPORT_CHUNK_SIZE = 5000
+
+# File suffix and opener per supported compression.
+COMPRESSIONS = {
+    None: ("", None),
+    "gzip": (".gz", lambda raw, mode: gzip.GzipFile(fileobj=raw, mode=mode)),
+    "xz": (".xz", lambda raw, mode: lzma.LZMAFile(raw, mode=mode)),
+}
+
+INSTRUMENT_FIELDS = ["name", "type", "model", "manufacturer", "serial_number", "purchase_date", "notes", "status"]
+COLUMN_FIELDS = ["name", "column_type", "length_cm", "diameter_mm", "pore_size", "install_date", "status", "notes"]
+MAINTENANCE_FIELDS = ["date", "maintenance_type", "description", "performed_by", "cost"]
+
+
+def _text(row, key):
+    value = row.get(key)
+    if value is None:
+        return None
+    value = value.strip()
+    return value or None
+
+
+def _float(row, key, path, line):
+    value = _text(row, key)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{os.path.basename(path)} linje {line}: ugyldig tall i {key}: {value!r}") from None
+
+
+def _date(row, key, path, line):
+    # Stored as ISO whatever spelling the file uses (see parse_date).
+    try:
+        return parse_date(_text(row, key))
+    except ValueError as e:
+        raise ValueError(f"{os.path.basename(path)} linje {line}: {key}: {e}") from None
+
+
+def find_table_file(directory: str, table: str):
+    for compression, (suffix, _) in COMPRESSIONS.items():
+        path = os.path.join(directory, f"{table}.csv{suffix}")
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _compression_for(path):
+    for compression, (suffix, _) in COMPRESSIONS.items():
+        if compression and path.endswith(suffix):
+            return compression
+    return None
+
+
+def _read_batches(path, convert, batch_size, progress, stage):
+    size = os.path.getsize(path) or 1
+    opener = COMPRESSIONS[_compression_for(path)][1]
+    with open(path, "rb") as raw:
+        # Progress is measured on the file as stored, compressed or not.
+        stream = opener(raw, "rb") if opener else raw
+        with io.TextIOWrapper(stream, encoding="utf-8", newline="") as f:
+            reader = csv.DictReader(f)
+            batch = []
+            count = 0
+            for row in reader:
+                # Line 1 is the header.
+                batch.append(convert(row, reader.line_num))
+                if len(batch) >= batch_size:
+                    count += len(batch)
+                    yield batch
+                    batch = []
+                    if progress:
+                        progress(stage, count, min(1.0, raw.tell() / size))
+            if batch:
+                count += len(batch)
+                yield batch
+            if progress:
+                progress(stage, count, 1.0)
+
+
+def _required(row, key, path, line):
+    value = _text(row, key)
+    if value is None:
+        raise ValueError(f"{os.path.basename(path)} linje {line}: {key} mangler")
+    return value
+
+
+def _instrument_row(path):
+    def convert(row, line):
+        return (
+            line, _required(row, "name", path, line), _required(row, "type", path, line),
+            _text(row, "model"), _text(row, "manufacturer"), _text(row, "serial_number") or "",
+            _date(row, "purchase_date", path, line), _text(row, "notes"), _text(row, "status") or "Active",
+        )
+    return convert
+
+
+def _column_row(path):
+    def convert(row, line):
+        return (
+            line, _text(row, "instrument_name"), _text(row, "instrument_serial_number"),
+            _required(row, "name", path, line), _text(row, "column_type"),
+            _float(row, "length_cm", path, line), _float(row, "diameter_mm", path, line),
+            _text(row, "pore_size"), _date(row, "install_date", path, line), _text(row, "status") or "Active",
+            _text(row, "notes"),
+        )
+    return convert
+
+
+def _maintenance_row(path):
+    def convert(row, line):
+        return (
+            line, _text(row, "instrument_name"), _text(row, "instrument_serial_number"),
+            _date(row, "date", path, line) or _required(row, "date", path, line),
+            _required(row, "maintenance_type", path, line),
+            _text(row, "description"), _text(row, "performed_by"), _float(row, "cost", path, line),
+        )
+    return convert
+
+
+# Temp tables the CSV rows are streamed into before being applied as sets.
+# Each entry is (CREATE statement, columns filled from the CSV rows).
+STAGING_TABLES = {
+    "import_instruments": ("""
+        CREATE TEMP TABLE import_instruments (
+            line INTEGER PRIMARY KEY,
+            name TEXT, type TEXT, model TEXT, manufacturer TEXT, serial_number TEXT,
+            purchase_date TEXT, notes TEXT, status TEXT,
+            instrument_id INTEGER, is_new INTEGER NOT NULL DEFAULT 0
+        )
+    """, ["line"] + INSTRUMENT_FIELDS),
+    "import_columns": ("""
+        CREATE TEMP TABLE import_columns (
+            line INTEGER PRIMARY KEY,
+            instrument_name TEXT, instrument_serial_number TEXT,
+            name TEXT, column_type TEXT, length_cm REAL, diameter_mm REAL, pore_size TEXT,
+            install_date TEXT, status TEXT, notes TEXT,
+            instrument_id INTEGER
+        )
+    """, ["line", "instrument_name", "instrument_serial_number"] + COLUMN_FIELDS),
+    "import_maintenance": ("""
+        CREATE TEMP TABLE import_maintenance (
+            line INTEGER PRIMARY KEY,
+            instrument_name TEXT, instrument_serial_number TEXT,
+            date TEXT, maintenance_type TEXT, description TEXT, performed_by TEXT, cost REAL,
+            instrument_id INTEGER
+        )
+    """, ["line", "instrument_name", "instrument_serial_number"] + MAINTENANCE_FIELDS),
+}
+
+
+def _drop_staging(conn):
+    for table in STAGING_TABLES:
+        conn.execute(f"DROP TABLE IF EXISTS temp.{table}")
+
+
+def _stage(conn, table, path, convert, batch_size, progress):
+    fields = STAGING_TABLES[table][1]
+    sql = f"INSERT INTO temp.{table} ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))})"
+    stage = table[len("import_"):]
+    for batch in _read_batches(path, convert, batch_size, progress, stage):
+        conn.executemany(sql, batch)
+        # Staging lives in the temp database, so committing per batch only
+        # bounds the journal; the real tables are not touched yet.
+        conn.commit()
+
+
+def _apply_instruments(conn):
+    # Existing instruments are matched on serial number.
+    conn.execute("""
+        UPDATE import_instruments
+        SET instrument_id = (SELECT MIN(i.id) FROM main.instruments i WHERE i.serial_number = import_instruments.serial_number)
+        WHERE serial_number != ''
+    """)
+    # The remaining rows get fresh ids up front: one per unknown serial number
+    # and one per row without a serial number.
+    next_id = conn.execute("""
+        SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'instruments'), 0),
+                   COALESCE((SELECT MAX(id) FROM main.instruments), 0)) + 1
+    """).fetchone()[0]
+    conn.execute("""
+        WITH new_rows AS (
+            SELECT MIN(line) AS line FROM import_instruments
+            WHERE instrument_id IS NULL AND serial_number != '' GROUP BY serial_number
+            UNION ALL
+            SELECT line FROM import_instruments WHERE instrument_id IS NULL AND serial_number = ''
+        ),
+        numbered AS (
+            SELECT line, ? + ROW_NUMBER() OVER (ORDER BY line) - 1 AS new_id FROM new_rows
+        )
+        UPDATE import_instruments
+        SET instrument_id = numbered.new_id, is_new = 1
+        FROM numbered WHERE numbered.line = import_instruments.line
+    """, (next_id,))
+    conn.execute("""
+        UPDATE import_instruments
+        SET instrument_id = seen.instrument_id, is_new = 1
+        FROM (SELECT serial_number, instrument_id FROM import_instruments WHERE is_new AND serial_number != '') AS seen
+        WHERE import_instruments.instrument_id IS NULL AND import_instruments.serial_number = seen.serial_number
+    """)
+
+    # When a serial number repeats, the last row in the file wins.
+    final_rows = """
+        SELECT * FROM import_instruments
+        WHERE line IN (SELECT MAX(line) FROM import_instruments GROUP BY instrument_id)
+    """
+    inserted = conn.execute(f"""
+        INSERT INTO main.instruments (id, name, type, model, manufacturer, serial_number, purchase_date, notes, status)
+        SELECT instrument_id, name, type, model, manufacturer, NULLIF(serial_number, ''), purchase_date, notes, status
+        FROM ({final_rows}) WHERE is_new
+        ORDER BY instrument_id
+    """).rowcount
+    updated = conn.execute(f"""
+        UPDATE main.instruments
+        SET name = s.name, type = s.type, model = s.model, manufacturer = s.manufacturer,
+            purchase_date = s.purchase_date, notes = s.notes, status = s.status,
+            version = main.instruments.version + 1
+        FROM ({final_rows}) AS s
+        WHERE NOT s.is_new AND main.instruments.id = s.instrument_id
+    """).rowcount
+    return inserted + updated
+
+
+def _resolve_instruments(conn, table):
+    conn.execute("CREATE INDEX IF NOT EXISTS temp.import_instruments_name ON import_instruments(name, line)")
+    conn.execute(f"""
+        UPDATE {table}
+        SET instrument_id = (SELECT MIN(i.id) FROM main.instruments i
+                             WHERE i.serial_number = {table}.instrument_serial_number)
+        WHERE instrument_serial_number IS NOT NULL
+    """)
+    # Files without serial numbers refer to instruments by name: prefer the
+    # instrument imported in this run, then a unique name already in the
+    # database.
+    conn.execute(f"""
+        UPDATE {table}
+        SET instrument_id = (SELECT s.instrument_id FROM import_instruments s
+                             WHERE s.name = {table}.instrument_name ORDER BY s.line DESC LIMIT 1)
+        WHERE instrument_id IS NULL AND instrument_name IS NOT NULL
+    """)
+    conn.execute(f"""
+        UPDATE {table}
+        SET instrument_id = (SELECT MIN(i.id) FROM main.instruments i WHERE i.name = {table}.instrument_name
+                             HAVING COUNT(*) = 1)
+        WHERE instrument_id IS NULL AND instrument_name IS NOT NULL
+    """)
+    return conn.execute(f"SELECT COUNT(*) FROM {table} WHERE instrument_id IS NULL").fetchone()[0]
+
+
+def _apply_children(conn, table, target, fields):
+    skipped = _resolve_instruments(conn, table)
+    # Instruments present in the file get their rows replaced once, as a set.
+    conn.execute(f"""
+        DELETE FROM main.{target}
+        WHERE instrument_id IN (SELECT DISTINCT instrument_id FROM {table} WHERE instrument_id IS NOT NULL)
+    """)
+    columns = ", ".join(fields)
+    inserted = conn.execute(f"""
+        INSERT INTO main.{target} (instrument_id, {columns})
+        SELECT instrument_id, {columns} FROM {table}
+        WHERE instrument_id IS NOT NULL
+        ORDER BY line
+    """).rowcount
+    return inserted, skipped
+
+
+def _header(path):
+    opener = COMPRESSIONS[_compression_for(path)][1]
+    with open(path, "rb") as raw:
+        stream = opener(raw, "rb") if opener else raw
+        with io.TextIOWrapper(stream, encoding="utf-8", newline="") as f:
+            return next(csv.reader(f), [])
+
+
+def _is_delta(import_dir, paths):
+    # A delta export (export --since) is known by its manifest, deleted.csv
+    # or, for a lone table file, the id column it starts with.
+    manifest = os.path.join(import_dir, "manifest.json")
+    if os.path.exists(manifest):
+        with open(manifest, encoding="utf-8") as f:
+            if json.load(f).get("since") is not None:
+                return True
+    if find_table_file(import_dir, DELETED_TABLE):
+        return True
+    return any(_header(path)[:1] == ["id"] for path in paths)
+
+
+def import_all_from_csv(import_dir: str, batch_size: int = IMPORT_BATCH_SIZE, progress=None):
+    # progress, if given, is called as progress(stage, rows_read, fraction)
+    # after every batch, from the thread running the import.
+    instruments_file = find_table_file(import_dir, "instruments")
+    columns_file = find_table_file(import_dir, "columns")
+    maintenance_file = find_table_file(import_dir, "maintenance")
+    # An import matches instruments by serial number, gives rows new ids and
+    # replaces the columns and maintenance of every instrument it lists. A
+    # delta only holds the rows that changed, keyed by the ids of the
+    # database it came from, so importing it would delete the rest.
+    if _is_delta(import_dir, [path for path in (instruments_file, columns_file, maintenance_file) if path]):
+        raise ValueError("Delta-eksporter (export --since) kan ikke importeres; importer en full eksport")
+
+    summary = {"instruments": 0, "columns": 0, "maintenance": 0, "skipped": 0}
+
+    with get_connection() as conn:
+        conn.commit()
+        _drop_staging(conn)
+        try:
+            for create_sql, _ in STAGING_TABLES.values():
+                conn.execute(create_sql)
+
+            for table, path, convert in (
+                ("import_instruments", instruments_file, _instrument_row),
+                ("import_columns", columns_file, _column_row),
+                ("import_maintenance", maintenance_file, _maintenance_row),
+            ):
+                if path:
+                    _stage(conn, table, path, convert(path), batch_size, progress)
+
+            if progress:
+                progress("apply", 0, 0.0)
+            # All changes to the real tables happen in this one transaction.
+            conn.execute("BEGIN IMMEDIATE")
+            connection_manager.record_actor()
+            summary["instruments"] = _apply_instruments(conn)
+            for table, target, fields in (
+                ("import_columns", "columns", COLUMN_FIELDS),
+                ("import_maintenance", "maintenance", MAINTENANCE_FIELDS),
+            ):
+                inserted, skipped = _apply_children(conn, table, target, fields)
+                summary[target] = inserted
+                summary["skipped"] += skipped
+            sync_search_index(conn)
+            connection_manager.clear_actor()
+            conn.commit()
+            if progress:
+                progress("apply", sum(summary[key] for key in ("instruments", "columns", "maintenance")), 1.0)
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            _drop_staging(conn)
+            conn.commit()
+
+    return summary
+
+
+# header, select list, source, order and the alias whose id a delta export
+# matches against the change log.
+EXPORT_TABLES = {
+    "instruments": (
+        ["name", "type", "model", "manufacturer", "serial_number", "purchase_date", "notes", "status"],
+        "i.name, i.type, i.model, i.manufacturer, i.serial_number, i.purchase_date, i.notes, i.status",
+        "instruments i",
+        "i.name",
+    ),
+    "columns": (
+        ["instrument_name", "instrument_serial_number", "name", "column_type", "length_cm", "diameter_mm",
+         "pore_size", "install_date", "status", "notes"],
+        """
+            i.name, i.serial_number, c.name, c.column_type, c.length_cm, c.diameter_mm,
+            c.pore_size, c.install_date, c.status, c.notes
+        """,
+        "columns c JOIN instruments i ON c.instrument_id = i.id",
+        "i.name, c.name",
+    ),
+    "maintenance": (
+        ["instrument_name", "instrument_serial_number", "date", "maintenance_type", "description",
+         "performed_by", "cost"],
+        "i.name, i.serial_number, m.date, m.maintenance_type, m.description, m.performed_by, m.cost",
+        "maintenance m JOIN instruments i ON m.instrument_id = i.id",
+        "i.name, m.date",
+    ),
+}
+# A delta export also lists deleted rows in deleted.csv.
+DELETED_TABLE = "deleted"
+
+
+def _export_query(table: str, delta=None):
+    # delta is (since, upto): only rows logged as changed in that seq range
+    # are selected, with their id first so deletions can be matched.
+    # Columns and maintenance repeat their instrument's name and serial
+    # number, so those of a changed instrument are included too.
+    header, select, source, order = EXPORT_TABLES[table]
+    if delta is None:
+        return header, f"SELECT {select} FROM {source} ORDER BY {order}", ()
+    alias = source.split()[1]
+    changed = "SELECT row_id FROM changes WHERE table_name = ? AND seq > ? AND seq <= ? AND op != 'delete'"
+    if table == "instruments":
+        return ["id"] + header, f"""
+            SELECT {alias}.id, {select} FROM {source}
+            WHERE {alias}.id IN ({changed})
+            ORDER BY {order}
+        """, (table, *delta)
+    return ["id"] + header, f"""
+        SELECT {alias}.id, {select} FROM {source}
+        WHERE {alias}.id IN ({changed}) OR {alias}.instrument_id IN ({changed})
+        ORDER BY {order}
+    """, (table, *delta, "instruments", *delta)
+
+
+class _HashingWriter(io.RawIOBase):
+    # Binary sink that checksums and counts what reaches the underlying file.
+    def __init__(self, raw):
+        super().__init__()
+        self.raw = raw
+        self.sha256 = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.bytes += len(data)
+        return self.raw.write(data)
+
+    def writable(self):
+        return True
+
+    def flush(self):
+        self.raw.flush()
+
+
+def write_table_csv(conn, table: str, stream, chunk_size: int = EXPORT_CHUNK_SIZE, delta=None):
+    # Streams one export table as CSV into a text stream, fetchmany() chunks at
+    # a time; returns the number of data rows written.
+    header, sql, params = _export_query(table, delta)
+    writer = csv.writer(stream)
+    writer.writerow(header)
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute(sql, params)
+    rows = 0
+    while True:
+        chunk = cursor.fetchmany(chunk_size)
+        if not chunk:
+            break
+        writer.writerows(chunk)
+        rows += len(chunk)
+    return rows
+
+
+def write_deleted_csv(conn, stream, delta):
+    # Rows deleted in the delta's seq range that are still gone.
+    writer = csv.writer(stream)
+    writer.writerow(["table", "id", "seq"])
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    cursor.execute("""
+        SELECT table_name, row_id, MAX(seq) FROM changes c
+        WHERE seq > ? AND seq <= ? AND op = 'delete'
+          AND NOT EXISTS (SELECT 1 FROM instruments WHERE c.table_name = 'instruments' AND id = c.row_id)
+          AND NOT EXISTS (SELECT 1 FROM columns WHERE c.table_name = 'columns' AND id = c.row_id)
+          AND NOT EXISTS (SELECT 1 FROM maintenance WHERE c.table_name = 'maintenance' AND id = c.row_id)
+        GROUP BY table_name, row_id
+        ORDER BY 3
+    """, delta)
+    rows = cursor.fetchall()
+    writer.writerows(rows)
+    return len(rows)
+
+
+def _export_table(export_dir, table, compression, chunk_size, delta=None):
+    suffix, opener = COMPRESSIONS[compression]
+    filename = f"{table}.csv{suffix}"
+    with connection_manager.dedicated() as conn, open(os.path.join(export_dir, filename), "wb") as raw:
+        sink = _HashingWriter(raw)
+        stream = opener(sink, "wb") if opener else io.BufferedWriter(sink, 1 << 16)
+        text = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+        try:
+            if table == DELETED_TABLE:
+                rows = write_deleted_csv(conn, text, delta)
+            else:
+                rows = write_table_csv(conn, table, text, chunk_size, delta)
+        finally:
+            text.flush()
+            text.detach()
+            stream.close()
+    return {"file": filename, "rows": rows, "bytes": sink.bytes, "sha256": sink.sha256.hexdigest()}
+
+
+def export_all_to_csv(export_dir: str, compression: str = None, chunk_size: int = EXPORT_CHUNK_SIZE,
+                      parallel: bool = True, since: int = None):
+    # Writes instruments, columns and maintenance as (optionally gzip/xz
+    # compressed) CSV files plus manifest.json with row counts and SHA-256
+    # checksums. Each table is streamed on its own read connection, so memory
+    # use does not depend on the size of the database.
+    #
+    # The manifest's seq is the change log position the export covers. With
+    # since=<an earlier seq>, only rows changed after it are written (a
+    # delta), plus deleted.csv.
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Ukjent komprimering: {compression}")
+    # Read before any rows, so changes made during the export are repeated
+    # in the next delta rather than lost.
+    seq = ChangeRepository.latest_seq()
+    delta = None
+    tables = list(EXPORT_TABLES)
+    if since is not None:
+        if ChangeRepository.since(since, limit=1)["reset"]:
+            raise ValueError(f"Endringsloggen har ikke lenger alt etter {since}; ta en full eksport")
+        delta = (since, seq)
+        tables.append(DELETED_TABLE)
+    os.makedirs(export_dir, exist_ok=True)
+
+    if parallel:
+        with ThreadPoolExecutor(max_workers=len(tables), thread_name_prefix="export") as pool:
+            futures = {table: pool.submit(_export_table, export_dir, table, compression, chunk_size, delta)
+                       for table in tables}
+            files = {table: future.result() for table, future in futures.items()}
+    else:
+        files = {table: _export_table(export_dir, table, compression, chunk_size, delta) for table in tables}
+
+    manifest = {
+        "exported_at": datetime.now().isoformat(timespec="seconds"),
+        "schema_version": SCHEMA_VERSION,
+        "compression": compression,
+        "seq": seq,
+        "tables": files,
+    }
+    if delta:
+        manifest["since"] = since
+    with open(os.path.join(export_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def verify_export(export_dir: str):
+    # Returns the tables whose file is missing or does not match the manifest.
+    with open(os.path.join(export_dir, "manifest.json"), encoding="utf-8") as f:
+        manifest = json.load(f)
+    mismatched = []
+    for table, entry in manifest["tables"].items():
+        path = os.path.join(export_dir, entry["file"])
+        if not os.path.exists(path):
+            mismatched.append(table)
+            continue
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        if digest.hexdigest() != entry["sha256"]:
+            mismatched.append(table)
+    return mismatched
@@ -0,0 +1,889 @@
+from datetime import date, timedelta
+
+import customtkinter as ctk
+
+import instrumentation
+from analytics import AnalyticsRepository
+from database import (PAGE_SIZE, InstrumentRepository, ColumnRepository, MaintenanceRepository, SearchRepository,
+                      StatsRepository, ChangeRepository, DueRepository, explain_query, query_cache)
+from widgets import VirtualTable, TableColumn, RowAction, BarChart, SelectionBar
+
+SEARCH_KIND_LABELS = {"instrument": "Instrument", "column": "Kolonne", "maintenance": "Vedlikehold"}
+DIAGNOSTICS_TOP = 25
+# Past this many changes since the last load, a full reload is cheaper than
+# patching row by row.
+PATCH_LIMIT = 500
+ANALYSIS_RANGES = ["Siste 12 mnd", "I år", "Siste 5 år", "Alt"]
+ANALYSIS_PERIODS = {"Måned": "month", "Kvartal": "quarter", "År": "year"}
+# Forfall filter: due within this many days (-1 is overdue only).
+DUE_RANGES = {"Forfalt": -1, "30 dager": 30, "90 dager": 90, "Alle": None}
+INSTRUMENT_STATUSES = ["Active", "Service", "Out of order", "Retired"]
+COLUMN_STATUSES = ["Active", "Retired"]
+
+
+def timed(timing, callback):
+    return timing.wrap(callback) if timing else callback
+
+
+class RowFeed:
+    # How a PagedRows table is patched from the change log: changes to table
+    # are re-read by id with fetch(ids) and placed by the page sort keys;
+    # belongs(row, *args) says whether a row is part of the loaded args.
+    # Changes to any of the reload_on tables force a full reload instead.
+    def __init__(self, table: str, fetch, keys, descending: bool = False, belongs=None, reload_on=()):
+        self.table = table
+        self.fetch = fetch
+        self.keys = keys
+        self.descending = descending
+        self.belongs = belongs or (lambda row, *args: True)
+        self.reload_on = reload_on
+
+    def sort_key(self, row):
+        return tuple(row[key] for key in self.keys)
+
+
+def read_changes(feed, since, fetch, args, limit):
+    # Runs on a worker thread. Returns ("patch", seq, ids, rows) when the
+    # changes since `since` can be patched in, or ("full", seq, page) when
+    # they are too many, touch a reload_on table, or were compacted away.
+    log = ChangeRepository.since(since, limit=PATCH_LIMIT)
+    changes = log["changes"]
+    if log["reset"] or log["more"] or any(c["table_name"] in feed.reload_on for c in changes):
+        return "full", log["last_seq"], fetch(*args, limit=limit)
+    ids = tuple(sorted({c["row_id"] for c in changes if c["table_name"] == feed.table}))
+    return "patch", log["last_seq"], ids, feed.fetch(ids) if ids else []
+
+
+class PagedRows:
+    # Keeps a VirtualTable filled from a keyset-paged repository method
+    # (fetch(*args, after=..., limit=...) -> (rows, cursor)). Loading the same
+    # args again re-reads as many rows as are loaded and diffs them in; with
+    # a RowFeed only the rows named in the change log are re-read.
+    def __init__(self, worker, table, fetch, channel: str, feed: RowFeed = None):
+        self.worker = worker
+        self.table = table
+        self.fetch = fetch
+        self.channel = channel
+        self.feed = feed
+        self.args = None
+        self.cursor = None
+        self.seq = None
+        self.loading = False
+        self._token = 0
+        table.on_more = self.more
+
+    def load(self, *args, on_done=None, timing=None):
+        same = args == self.args
+        limit = max(PAGE_SIZE, len(self.table.rows)) if same else PAGE_SIZE
+        self.args = args
+        self.loading = True
+        self._token += 1
+        token = self._token
+        feed, since, fetch = self.feed, self.seq, self.fetch
+
+        def read():
+            if feed is None:
+                return "full", None, fetch(*args, limit=limit)
+            if same and since is not None:
+                return read_changes(feed, since, fetch, args, limit)
+            # The seq is read before the rows, so a change committed in
+            # between is patched in again next time rather than missed.
+            seq = ChangeRepository.latest_seq()
+            return "full", seq, fetch(*args, limit=limit)
+
+        def done(result):
+            if token != self._token:
+                return
+            kind, self.seq, *data = result
+            self.loading = False
+            if kind == "patch":
+                self.patch(*data)
+            elif same:
+                rows, self.cursor = data[0]
+                self.table.update_rows(rows)
+            else:
+                rows, self.cursor = data[0]
+                self.table.set_rows(rows)
+                self.table.scroll_to(0)
+            if on_done:
+                on_done(self.table.rows)
+
+        self.worker.read(read, channel=self.channel, on_done=timed(timing, done))
+
+    def patch(self, ids, rows):
+        if not ids:
+            return
+        feed = self.feed
+        changed = set(ids)
+        fresh = [row for row in rows if feed.belongs(row, *self.args)]
+        if self.cursor is not None:
+            # Rows that sort past the last loaded one arrive with the next
+            # page instead.
+            if feed.descending:
+                fresh = [row for row in fresh if feed.sort_key(row) >= self.cursor]
+            else:
+                fresh = [row for row in fresh if feed.sort_key(row) <= self.cursor]
+        kept = [row for row in self.table.rows if row[self.table.key] not in changed]
+        self.table.update_rows(sorted(kept + fresh, key=feed.sort_key, reverse=feed.descending))
+
+    def more(self):
+        if self.cursor is None or self.loading:
+            return
+        self.loading = True
+        token = self._token
+
+        def done(page):
+            if token != self._token:
+                return
+            rows, self.cursor = page
+            self.loading = False
+            self.table.append_rows(rows)
+
+        self.worker.read(self.fetch, *self.args, after=self.cursor, channel=self.channel, on_done=done)
+
+
+# Views are built once and kept while the app runs. Showing one again calls
+# refresh(), which re-reads its data and only patches what changed.
+class View(ctk.CTkFrame):
+    def __init__(self, app):
+        super().__init__(app, fg_color="transparent")
+        self.app = app
+        self.worker = app.worker
+        self.grid_columnconfigure(0, weight=1)
+
+    def add_title(self, text: str, row: int = 0, pady=(0, 10)):
+        label = ctk.CTkLabel(self, text=text, font=ctk.CTkFont(size=24, weight="bold"))
+        label.grid(row=row, column=0, pady=pady, sticky="w")
+        return label
+
+    def refresh(self, timing=None):
+        pass
+
+
+class DashboardView(View):
+    def __init__(self, app):
+        super().__init__(app)
+        self.seen = None
+        self.grid_rowconfigure(2, weight=1)
+        self.add_title("Dashboard", pady=(0, 20))
+
+        stats_frame = ctk.CTkFrame(self)
+        stats_frame.grid(row=1, column=0, pady=(0, 20), sticky="ew")
+        stats_frame.grid_columnconfigure((0, 1, 2, 3), weight=1)
+
+        self.type_labels = {}
+        for i, instrument_type in enumerate(("LC", "GC", "GPC")):
+            label = ctk.CTkLabel(stats_frame, text=f"{instrument_type}: -", font=ctk.CTkFont(size=16))
+            label.grid(row=0, column=i, padx=20, pady=(20, 5))
+            self.type_labels[instrument_type] = label
+        self.attention_label = ctk.CTkLabel(stats_frame, text="Trenger oppfølging: -", font=ctk.CTkFont(size=16))
+        self.attention_label.grid(row=0, column=3, padx=20, pady=(20, 5))
+        self.attention_label.bind("<Button-1>", lambda event: app.show_due())
+        self.attention_label.configure(cursor="hand2")
+        self.summary_label = ctk.CTkLabel(stats_frame, text="Laster...", text_color="gray60")
+        self.summary_label.grid(row=1, column=0, columnspan=4, padx=20, pady=(0, 15))
+
+        recent_frame = ctk.CTkFrame(self)
+        recent_frame.grid(row=2, column=0, sticky="nsew")
+        recent_frame.grid_rowconfigure(1, weight=1)
+        recent_frame.grid_columnconfigure(0, weight=1)
+
+        ctk.CTkLabel(recent_frame, text="Siste vedlikehold", font=ctk.CTkFont(size=18, weight="bold")).grid(
+            row=0, column=0, padx=20, pady=(10, 5), sticky="w"
+        )
+
+        self.recent_table = VirtualTable(
+            recent_frame,
+            columns=[
+                TableColumn("Dato", "date", width=90),
+                TableColumn("Type", "maintenance_type", width=90),
+                TableColumn("Instrument", "instrument_name", width=120),
+                TableColumn("Beskrivelse", lambda rec: (rec["description"] or "-")[:30], weight=1),
+            ],
+            row_height=30,
+            row_gap=2,
+            on_activate=lambda rec: app.show_instrument_detail(rec["instrument_id"]),
+            empty_text="Ingen vedlikehold registrert",
+            row_fg_color="transparent",
+            fg_color="transparent"
+        )
+        self.recent_table.grid(row=1, column=0, sticky="nsew", padx=10, pady=10)
+
+    def refresh(self, timing=None):
+        seen = self.seen
+
+        def load():
+            # Every figure here comes from the logged tables and the date,
+            # so with neither changed since the last render there is nothing
+            # to read.
+            latest = (ChangeRepository.latest_seq(), date.today())
+            if latest == seen:
+                return None
+            return latest, StatsRepository.get_dashboard(), MaintenanceRepository.get_recent(5), DueRepository.summary()
+
+        def done(data):
+            if data is not None:
+                self.seen, stats, recent, due = data
+                self.render(stats, recent, due)
+
+        self.worker.read(load, channel="dashboard", on_done=timed(timing, done))
+
+    def render(self, stats, recent, due):
+        types = stats["instrument_types"]
+        for instrument_type, label in self.type_labels.items():
+            label.configure(text=f"{instrument_type}: {types.get(instrument_type, 0)}")
+        self.attention_label.configure(
+            text=f"Trenger oppfølging: {due['needs_attention']}",
+            text_color="orange" if due["needs_attention"] else ctk.ThemeManager.theme["CTkLabel"]["text_color"]
+        )
+
+        months = stats["maintenance_months"]
+        active_columns = stats["column_statuses"].get("Active", 0)
+        self.summary_label.configure(
+            text=f"Aktive kolonner: {active_columns} | Vedlikehold siste 12 mnd: "
+                 f"{sum(m['count'] for m in months)} (kostnad {sum(m['total'] for m in months):.0f}) | "
+                 f"Forfalt: {due['overdue']} | Forfaller innen 30 dager: {due['due_soon']}"
+        )
+        self.recent_table.update_rows(recent)
+
+
+class InstrumentListView(View):
+    def __init__(self, app, instrument_type: str):
+        super().__init__(app)
+        self.instrument_type = instrument_type
+        self.grid_rowconfigure(2, weight=1)
+        self.add_title(f"{instrument_type} Instrumenter")
+
+        btn_frame = ctk.CTkFrame(self, fg_color="transparent")
+        btn_frame.grid(row=1, column=0, pady=(0, 10), sticky="w")
+
+        ctk.CTkButton(
+            btn_frame,
+            text="+ Legg til instrument",
+            command=lambda: app.show_add_instrument(instrument_type)
+        ).pack(side="left", padx=(0, 10))
+
+        self.table = VirtualTable(
+            self,
+            columns=[
+                TableColumn(
+                    "Navn", "name", bold=True, weight=1,
+                    subtitle=lambda inst: f"Model: {inst['model'] or '-'} | Serienr: {inst['serial_number'] or '-'} | Kjøpt: {inst['purchase_date'] or '-'}"
+                ),
+            ],
+            actions=[
+                RowAction("Detaljer", lambda inst: app.show_instrument_detail(inst["id"]), width=80),
+                RowAction("Slett", lambda inst: app.delete_instrument(inst["id"], inst["type"]), danger=True),
+            ],
+            row_height=70,
+            show_header=False,
+            on_activate=lambda inst: app.show_instrument_detail(inst["id"]),
+            empty_text="Laster...",
+            fg_color="transparent"
+        )
+        self.table.grid(row=2, column=0, sticky="nsew")
+        bar = SelectionBar(btn_frame, self.table)
+        bar.pack(side="left")
+        bar.add_menu("Sett status", INSTRUMENT_STATUSES, lambda rows, status: app.apply_to_selection(
+            InstrumentRepository.set_status_many, rows, status, on_done=lambda _: self.refresh()
+        ))
+        bar.add_button("Slett valgte", lambda rows: app.apply_to_selection(
+            InstrumentRepository.delete_many, rows, on_done=lambda _: self.refresh(),
+            confirm=f"Er du sikker på at du vil slette {len(rows)} instrumenter?\n"
+                    f"Dette vil også slette alle tilknyttede kolonner og vedlikehold."
+        ), danger=True)
+        self.rows = PagedRows(
+            self.worker, self.table, InstrumentRepository.get_page, f"list:{instrument_type}",
+            RowFeed("instruments", InstrumentRepository.get_by_ids, ("name", "id"),
+                    belongs=lambda inst, instrument_type: inst["type"] == instrument_type)
+        )
+
+    def refresh(self, timing=None):
+        self.rows.load(
+            self.instrument_type,
+            on_done=lambda _: self.table.set_empty_text(f"Ingen {self.instrument_type} instrumenter registrert"),
+            timing=timing
+        )
+
+
+class ColumnsView(View):
+    def __init__(self, app):
+        super().__init__(app)
+        self.grid_rowconfigure(2, weight=1)
+        self.add_title("Alle Kolonner")
+
+        self.table = VirtualTable(
+            self,
+            columns=[
+                TableColumn("Navn", "name", width=120),
+                TableColumn("Type", "column_type", width=80),
+                TableColumn("Instrument", "instrument_name", width=100),
+                TableColumn("Status", "status", width=80),
+                TableColumn("Installert", "install_date", width=80),
+            ],
+            row_height=32,
+            row_gap=2,
+            empty_text="Laster...",
+            row_fg_color="transparent"
+        )
+        self.table.grid(row=2, column=0, sticky="nsew")
+        bar = SelectionBar(self, self.table)
+        bar.grid(row=1, column=0, pady=(0, 10), sticky="w")
+        bar.add_menu("Sett status", COLUMN_STATUSES, lambda rows, status: app.apply_to_selection(
+            ColumnRepository.set_status_many, rows, status, on_done=lambda _: self.refresh()
+        ))
+        bar.add_button("Slett valgte", lambda rows: app.apply_to_selection(
+            ColumnRepository.delete_many, rows, on_done=lambda _: self.refresh(),
+            confirm=f"Er du sikker på at du vil slette {len(rows)} kolonner?"
+        ), danger=True)
+        # Rows show their instrument's name, so instrument changes reload.
+        self.rows = PagedRows(
+            self.worker, self.table, ColumnRepository.get_page, "columns",
+            RowFeed("columns", ColumnRepository.get_by_ids, ("name", "id"), reload_on=("instruments",))
+        )
+
+    def refresh(self, timing=None):
+        self.rows.load(on_done=lambda _: self.table.set_empty_text("Ingen kolonner registrert"), timing=timing)
+
+
+class InstrumentDetailView(View):
+    INFO_FIELDS = [
+        ("Model", "model"),
+        ("Produsent", "manufacturer"),
+        ("Serienummer", "serial_number"),
+        ("Kjøpsdato", "purchase_date"),
+        ("Status", "status"),
+    ]
+    TABS = [("columns", "Kolonner"), ("maintenance", "Vedlikehold")]
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.instrument_id = None
+        self.instrument = None
+        self.columns = []
+        self.grid_rowconfigure(2, weight=1)
+
+        header = ctk.CTkFrame(self, fg_color="transparent")
+        header.grid(row=0, column=0, sticky="ew", pady=(0, 10))
+
+        ctk.CTkButton(
+            header,
+            text="← Tilbake",
+            command=self.go_back,
+            fg_color="transparent"
+        ).pack(side="left")
+
+        self.title_label = ctk.CTkLabel(header, text="Laster...", font=ctk.CTkFont(size=24, weight="bold"))
+        self.title_label.pack(side="left", padx=10)
+
+        ctk.CTkButton(
+            header,
+            text="Historikk",
+            command=lambda: self.instrument and self.app.show_history(
+                "instruments", self.instrument_id, self.instrument["name"]
+            ),
+            fg_color="transparent",
+            border_width=1,
+            width=90
+        ).pack(side="right")
+
+        self.info_frame = ctk.CTkFrame(self)
+        self.info_frame.grid(row=1, column=0, sticky="ew", pady=(0, 10))
+
+        self.info_labels = {}
+        for i, (label, key) in enumerate(self.INFO_FIELDS):
+            ctk.CTkLabel(self.info_frame, text=f"{label}:", font=ctk.CTkFont(weight="bold")).grid(
+                row=i//2, column=(i%2)*2, sticky="w", padx=10, pady=5
+            )
+            value = ctk.CTkLabel(self.info_frame, text="-")
+            value.grid(row=i//2, column=(i%2)*2+1, sticky="w", padx=10, pady=5)
+            self.info_labels[key] = value
+
+        # Tab contents are built the first time a tab is shown; until then a
+        # tab is an empty frame with a row count in its title.
+        self.tabs = ctk.CTkTabview(self, command=self.on_tab_change)
+        self.tabs.grid(row=2, column=0, sticky="nsew")
+        self.tab_titles = {key: title for key, title in self.TABS}
+        self.tab_frames = {key: self.tabs.add(title) for key, title in self.TABS}
+
+        self.columns_table = None
+        self.maintenance_table = None
+        self.maintenance_rows = None
+
+        self.missing_label = ctk.CTkLabel(self, text="Instrumentet finnes ikke lenger")
+
+    def build_columns_tab(self, parent):
+        parent.grid_rowconfigure(1, weight=1)
+        parent.grid_columnconfigure(0, weight=1)
+
+        btn_frame = ctk.CTkFrame(parent, fg_color="transparent")
+        btn_frame.grid(row=0, column=0, sticky="w", pady=(0, 10))
+
+        ctk.CTkButton(
+            btn_frame,
+            text="+ Legg til kolonne",
+            command=lambda: self.app.show_add_column(self.instrument_id)
+        ).pack(side="left")
+
+        table = VirtualTable(
+            parent,
+            columns=[
+                TableColumn(
+                    "Navn", "name", bold=True, weight=1,
+                    subtitle=lambda col: f"Type: {col['column_type'] or '-'} | Dim: {col['length_cm'] or '-'}cm x {col['diameter_mm'] or '-'}mm | Status: {col['status']}"
+                ),
+            ],
+            actions=[
+                RowAction("Slett", lambda col: self.app.delete_column(col["id"], self.instrument_id), danger=True),
+            ],
+            row_height=64,
+            show_header=False,
+            empty_text="Ingen kolonner registrert",
+            fg_color="transparent"
+        )
+        table.grid(row=1, column=0, sticky="nsew")
+        bar = SelectionBar(btn_frame, table)
+        bar.pack(side="left", padx=(10, 0))
+        bar.add_button("Slett valgte", lambda rows: self.app.apply_to_selection(
+            ColumnRepository.delete_many, rows, on_done=lambda _: self.refresh(),
+            confirm=f"Er du sikker på at du vil slette {len(rows)} kolonner?"
+        ), danger=True)
+        return table
+
+    def build_maintenance_tab(self, parent):
+        parent.grid_rowconfigure(1, weight=1)
+        parent.grid_columnconfigure(0, weight=1)
+
+        btn_frame = ctk.CTkFrame(parent, fg_color="transparent")
+        btn_frame.grid(row=0, column=0, sticky="w", pady=(0, 10))
+
+        ctk.CTkButton(
+            btn_frame,
+            text="+ Legg til vedlikehold",
+            command=lambda: self.app.show_add_maintenance(self.instrument_id)
+        ).pack(side="left")
+
+        ctk.CTkButton(
+            btn_frame,
+            text="Planer",
+            command=lambda: self.app.show_plans(self.instrument_id),
+            fg_color="transparent",
+            border_width=1
+        ).pack(side="left", padx=(10, 0))
+
+        table = VirtualTable(
+            parent,
+            columns=[
+                TableColumn(
+                    "Vedlikehold", lambda rec: f"{rec['date']} - {rec['maintenance_type']}", bold=True, weight=1,
+                    subtitle=lambda rec: f"Beskrivelse: {rec['description'] or '-'}\nUtført av: {rec['performed_by'] or '-'} | Kostnad: {rec['cost'] or '-'}"
+                ),
+            ],
+            actions=[
+                RowAction("Slett", lambda rec: self.app.delete_maintenance(rec["id"], self.instrument_id), danger=True),
+            ],
+            row_height=84,
+            show_header=False,
+            empty_text="Ingen vedlikehold registrert",
+            fg_color="transparent"
+        )
+        table.grid(row=1, column=0, sticky="nsew")
+        bar = SelectionBar(btn_frame, table)
+        bar.pack(side="left", padx=(10, 0))
+        bar.add_button("Slett valgte", lambda rows: self.app.apply_to_selection(
+            MaintenanceRepository.delete_many, rows, on_done=lambda _: self.refresh(),
+            confirm=f"Er du sikker på at du vil slette {len(rows)} vedlikeholdsoppføringer?"
+        ), danger=True)
+        return table
+
+    def current_tab(self):
+        name = self.tabs.get()
+        return next(key for key, title in self.tab_titles.items() if title == name)
+
+    def set_tab_count(self, key: str, count: int):
+        title = f"{dict(self.TABS)[key]} ({count})"
+        old = self.tab_titles[key]
+        if title == old:
+            return
+        current = self.tabs.get() == old
+        self.tabs.rename(old, title)
+        self.tab_titles[key] = title
+        if current:
+            # CTkTabview.rename does not carry the selection over.
+            self.tabs._current_name = title
+            self.tabs._segmented_button.set(title)
+
+    def on_tab_change(self):
+        if self.instrument is not None:
+            self.show_tab(self.current_tab())
+
+    def show_tab(self, key: str):
+        if key == "columns":
+            if self.columns_table is None:
+                self.columns_table = self.build_columns_tab(self.tab_frames["columns"])
+            self.columns_table.update_rows(self.columns)
+        else:
+            if self.maintenance_table is None:
+                self.maintenance_table = self.build_maintenance_tab(self.tab_frames["maintenance"])
+                self.maintenance_rows = PagedRows(
+                    self.worker, self.maintenance_table, MaintenanceRepository.get_page_by_instrument,
+                    "detail:maintenance",
+                    RowFeed("maintenance", MaintenanceRepository.get_by_ids, ("date", "id"), descending=True,
+                            belongs=lambda record, instrument_id: record["instrument_id"] == instrument_id)
+                )
+            self.maintenance_rows.load(self.instrument_id)
+
+    def go_back(self):
+        self.app.show_instrument_list(self.instrument["type"] if self.instrument else "LC")
+
+    def show_instrument(self, instrument_id: int, timing=None):
+        if instrument_id != self.instrument_id:
+            self.instrument_id = instrument_id
+            self.instrument = None
+            self.title_label.configure(text="Laster...")
+            self.columns = []
+            if self.columns_table is not None:
+                self.columns_table.set_rows([])
+            if self.maintenance_table is not None:
+                self.maintenance_table.set_rows([])
+        self.refresh(timing)
+
+    def refresh(self, timing=None):
+        instrument_id = self.instrument_id
+
+        def render(detail):
+            if instrument_id == self.instrument_id:
+                self.render(detail)
+
+        self.worker.read(InstrumentRepository.get_detail, instrument_id, channel="detail", on_done=timed(timing, render))
+
+    def render(self, detail):
+        self.instrument = detail
+        if not detail:
+            self.info_frame.grid_remove()
+            self.tabs.grid_remove()
+            self.title_label.configure(text="")
+            self.missing_label.grid(row=1, column=0, pady=20)
+            return
+        self.missing_label.grid_remove()
+        self.info_frame.grid()
+        self.tabs.grid()
+
+        self.title_label.configure(text=f"{detail['name']} ({detail['type']})")
+        for key, label in self.info_labels.items():
+            label.configure(text=detail[key] or "-")
+        self.columns = detail["columns"]
+        self.set_tab_count("columns", detail["column_count"])
+        self.set_tab_count("maintenance", detail["maintenance_count"])
+        self.show_tab(self.current_tab())
+
+
+class SearchView(View):
+    def __init__(self, app):
+        super().__init__(app)
+        self.text = ""
+        self.grid_rowconfigure(1, weight=1)
+        self.add_title("Søk")
+
+        self.table = VirtualTable(
+            self,
+            columns=[
+                TableColumn("Type", lambda hit: SEARCH_KIND_LABELS.get(hit["kind"], hit["kind"]), width=90),
+                TableColumn("Treff", "title", bold=True, weight=1, subtitle="snippet"),
+            ],
+            actions=[
+                RowAction("Åpne", self.open_hit),
+            ],
+            row_height=60,
+            key="rowid",
+            on_activate=self.open_hit,
+            empty_text="Ingen treff",
+            fg_color="transparent"
+        )
+        self.table.grid(row=1, column=0, sticky="nsew")
+
+    def search(self, text: str, timing=None):
+        self.text = text
+        self.refresh(timing)
+
+    def refresh(self, timing=None):
+        if not self.text.strip():
+            return
+        # One channel for all searches, so a newer keystroke supersedes the last.
+        self.worker.read(
+            SearchRepository.search, self.text,
+            channel="search",
+            on_done=timed(timing, self.table.update_rows),
+            on_error=lambda e: self.app.show_error("Søk feilet!", str(e))
+        )
+
+    def open_hit(self, hit):
+        if hit["instrument_id"] is not None:
+            self.app.show_instrument_detail(hit["instrument_id"])
+
+
+def _due_page(within_days, after=None, limit=PAGE_SIZE):
+    # The table needs one key per row; a due row is an instrument and plan.
+    rows, cursor = DueRepository.get_page(within_days, after=after, limit=limit)
+    for row in rows:
+        row["key"] = f"{row['instrument_id']}:{row['plan_id']}"
+    return rows, cursor
+
+
+def _due_status(row):
+    days = row["days_left"]
+    if days < 0:
+        return f"{-days} dager over"
+    return "i dag" if days == 0 else f"om {days} dager"
+
+
+def _plan_source(row):
+    scope = f"{row['plan_type']}-plan" if row["plan_type"] else "Egen plan"
+    return f"{scope}: {row['description']}" if row["description"] else scope
+
+
+class DueView(View):
+    def __init__(self, app):
+        super().__init__(app)
+        self.grid_rowconfigure(3, weight=1)
+        self.add_title("Forfall")
+
+        bar = ctk.CTkFrame(self, fg_color="transparent")
+        bar.grid(row=1, column=0, sticky="ew", pady=(0, 10))
+        self.range_button = ctk.CTkSegmentedButton(bar, values=list(DUE_RANGES), command=lambda _: self.refresh())
+        self.range_button.set("30 dager")
+        self.range_button.pack(side="left", padx=(0, 20))
+        ctk.CTkButton(bar, text="Planer", command=lambda: app.show_plans()).pack(side="left")
+
+        self.summary_label = ctk.CTkLabel(self, text="Laster...", text_color="gray60", anchor="w")
+        self.summary_label.grid(row=2, column=0, sticky="ew", pady=(0, 10))
+
+        self.table = VirtualTable(
+            self,
+            columns=[
+                TableColumn("Forfall", "due_date", width=90),
+                TableColumn("Status", _due_status, width=100),
+                TableColumn("Instrument", "instrument_name", width=110),
+                TableColumn("Type", "maintenance_type", width=90),
+                TableColumn("Intervall", lambda row: f"{row['interval_months']} mnd", width=70),
+                TableColumn("Sist utført", lambda row: row["last_date"] or "-", width=90),
+                TableColumn("Plan", _plan_source, weight=1),
+            ],
+            actions=[
+                RowAction("Registrer", self.register, width=80),
+            ],
+            row_height=32,
+            row_gap=2,
+            key="key",
+            on_activate=lambda row: app.show_instrument_detail(row["instrument_id"]),
+            empty_text="Laster...",
+            row_fg_color="transparent"
+        )
+        self.table.grid(row=3, column=0, sticky="nsew")
+        self.rows = PagedRows(self.worker, self.table, _due_page, "due")
+
+    def refresh(self, timing=None):
+        self.rows.load(
+            DUE_RANGES[self.range_button.get()],
+            on_done=lambda _: self.table.set_empty_text("Ingenting forfaller i perioden"),
+            timing=timing
+        )
+        self.worker.read(DueRepository.summary, channel="due:summary", on_done=self.render_summary)
+
+    def register(self, row):
+        self.app.show_add_maintenance(row["instrument_id"], row["maintenance_type"], on_saved=self.refresh)
+
+    def render_summary(self, due):
+        self.summary_label.configure(
+            text=f"Forfalt: {due['overdue']} ({due['instruments_overdue']} instrumenter) | "
+                 f"Forfaller innen 30 dager: {due['due_soon']}"
+        )
+
+
+def analysis_range(name: str, today: date = None):
+    # (start, end) ISO dates for one of ANALYSIS_RANGES; None is open.
+    today = today or date.today()
+    if name == "Siste 12 mnd":
+        return (today - timedelta(days=364)).isoformat(), today.isoformat()
+    if name == "I år":
+        return today.replace(month=1, day=1).isoformat(), today.isoformat()
+    if name == "Siste 5 år":
+        return today.replace(year=today.year - 5, month=1, day=1).isoformat(), today.isoformat()
+    return None, None
+
+
+def _mtbr(row):
+    return "-" if row["mtbr_days"] is None else f"{row['mtbr_days']:.0f}"
+
+
+class AnalysisView(View):
+    def __init__(self, app):
+        super().__init__(app)
+        self.grid_rowconfigure(5, weight=1)
+        self.add_title("Analyse")
+
+        bar = ctk.CTkFrame(self, fg_color="transparent")
+        bar.grid(row=1, column=0, sticky="ew", pady=(0, 10))
+        self.range_button = ctk.CTkSegmentedButton(bar, values=ANALYSIS_RANGES, command=lambda _: self.refresh())
+        self.range_button.set(ANALYSIS_RANGES[0])
+        self.range_button.pack(side="left", padx=(0, 20))
+        self.period_button = ctk.CTkSegmentedButton(bar, values=list(ANALYSIS_PERIODS), command=lambda _: self.refresh())
+        self.period_button.set("Måned")
+        self.period_button.pack(side="left")
+
+        self.summary_label = ctk.CTkLabel(self, text="Laster...", text_color="gray60", anchor="w")
+        self.summary_label.grid(row=2, column=0, sticky="ew", pady=(0, 10))
+
+        self.series_chart = BarChart(self, "Kostnad per periode", horizontal=False, height=160)
+        self.series_chart.grid(row=3, column=0, sticky="ew", pady=(0, 10))
+
+        charts = ctk.CTkFrame(self, fg_color="transparent")
+        charts.grid(row=4, column=0, sticky="ew", pady=(0, 10))
+        charts.grid_columnconfigure((0, 1), weight=1, uniform="charts")
+        self.type_chart = BarChart(charts, "Kostnad per vedlikeholdstype", height=120)
+        self.type_chart.grid(row=0, column=0, sticky="ew", padx=(0, 5))
+        self.manufacturer_chart = BarChart(charts, "Kostnad per produsent", height=120)
+        self.manufacturer_chart.grid(row=0, column=1, sticky="ew", padx=(5, 0))
+
+        self.instrument_table = VirtualTable(
+            self,
+            columns=[
+                TableColumn("Instrument", "name", weight=1),
+                TableColumn("Produsent", "manufacturer", width=100),
+                TableColumn("Antall", "count", width=60),
+                TableColumn("Kostnad", lambda row: f"{row['total']:,.0f}", width=90),
+                TableColumn("Reparasjoner", "repairs", width=90),
+                TableColumn("MTBR (dager)", _mtbr, width=90),
+            ],
+            row_height=28,
+            row_gap=2,
+            key="key",
+            on_activate=lambda row: app.show_instrument_detail(row["key"]),
+            empty_text="Ingen vedlikehold i perioden",
+            row_fg_color="transparent"
+        )
+        self.instrument_table.grid(row=5, column=0, sticky="nsew")
+
+    def refresh(self, timing=None):
+        start, end = analysis_range(self.range_button.get())
+        period = self.period_button.get()
+
+        def render(overview):
+            if (start, end) != analysis_range(self.range_button.get()) or period != self.period_button.get():
+                return
+            self.render(overview, period)
+
+        self.worker.read(
+            AnalyticsRepository.overview, start, end, ANALYSIS_PERIODS[period],
+            channel="analysis",
+            on_done=timed(timing, render),
+            on_error=lambda e: self.app.show_error("Kunne ikke lage analysen", str(e))
+        )
+
+    def render(self, overview, period: str):
+        fleet = overview["fleet"]
+        mtbr = "-" if fleet["mtbr_days"] is None else f"{fleet['mtbr_days']:.0f} dager"
+        self.summary_label.configure(
+            text=f"Vedlikehold: {fleet['count']} | Kostnad: {fleet['total']:,.0f} | "
+                 f"Reparasjoner: {fleet['repairs']} | MTBR: {mtbr} | "
+                 f"Trend: {overview['trend']:+,.0f} per {period.lower()}"
+        )
+        self.series_chart.set_data((row["period"], row["total"]) for row in overview["series"])
+        self.type_chart.set_data((row["key"], row["total"]) for row in overview["by_type"])
+        self.manufacturer_chart.set_data((row["key"] or "-", row["total"]) for row in overview["by_manufacturer"][:8])
+        self.instrument_table.update_rows(overview["top_instruments"])
+
+
+# Hidden view (Ctrl+Shift+D) listing the slowest statements and views seen
+# since start, with the query plan of the selected statement.
+class DiagnosticsView(View):
+    def __init__(self, app):
+        super().__init__(app)
+        self.grid_rowconfigure((2, 4), weight=1)
+        self.add_title("Diagnostikk")
+
+        bar = ctk.CTkFrame(self, fg_color="transparent")
+        bar.grid(row=1, column=0, sticky="ew", pady=(0, 10))
+        ctk.CTkButton(bar, text="Oppdater", command=self.refresh, width=90).pack(side="left", padx=(0, 10))
+        ctk.CTkButton(bar, text="Nullstill", command=self.reset, width=90).pack(side="left", padx=(0, 10))
+        self.summary_label = ctk.CTkLabel(bar, text="", text_color="gray60")
+        self.summary_label.pack(side="left")
+
+        self.query_table = VirtualTable(
+            self,
+            columns=[
+                TableColumn("Maks ms", lambda q: f"{q['max_ms']:.1f}", width=70),
+                TableColumn("Snitt ms", lambda q: f"{q['total_ms'] / q['count']:.2f}", width=70),
+                TableColumn("Antall", "count", width=60),
+                TableColumn("Rader", "rows", width=60),
+                TableColumn("SQL", lambda q: q["sql"][:160], weight=1),
+            ],
+            row_height=28,
+            row_gap=2,
+            key="sql",
+            on_select=lambda rows: rows and self.show_plan(rows[-1]),
+            empty_text="Ingen spørringer registrert",
+            row_fg_color="transparent"
+        )
+        self.query_table.grid(row=2, column=0, sticky="nsew")
+
+        self.plan_box = ctk.CTkTextbox(self, height=110, font=ctk.CTkFont(family="Courier", size=12))
+        self.plan_box.grid(row=3, column=0, sticky="ew", pady=10)
+
+        self.view_table = VirtualTable(
+            self,
+            columns=[
+                TableColumn("Visning", "name", weight=1),
+                TableColumn("Maks ms", lambda v: f"{v['max_ms']:.1f}", width=70),
+                TableColumn("Bygging", lambda v: f"{v['build_ms']:.1f}", width=70),
+                TableColumn("Venting", lambda v: f"{v['wait_ms']:.1f}", width=70),
+                TableColumn("Tegning", lambda v: f"{v['render_ms']:.1f}", width=70),
+                TableColumn("Antall", "count", width=60),
+            ],
+            row_height=28,
+            row_gap=2,
+            key="name",
+            empty_text="Ingen visninger registrert",
+            row_fg_color="transparent"
+        )
+        self.view_table.grid(row=4, column=0, sticky="nsew")
+
+    def refresh(self, timing=None):
+        cache = query_cache.stats()
+        self.summary_label.configure(
+            text=f"Treg spørring ≥ {instrumentation.SLOW_QUERY_MS:g} ms, treg visning ≥ "
+                 f"{instrumentation.SLOW_VIEW_MS:g} ms → {instrumentation.LOG_PATH} | "
+                 f"Mellomlager: {cache['hit_rate']:.0%} treff, {cache['entries']}/{cache['maxsize']}"
+        )
+        self.query_table.update_rows(instrumentation.slowest_queries(DIAGNOSTICS_TOP))
+        self.view_table.update_rows(instrumentation.slowest_views(DIAGNOSTICS_TOP))
+
+    def reset(self):
+        instrumentation.reset()
+        self.plan_box.delete("1.0", "end")
+        self.refresh()
+
+    def show_plan(self, query):
+        if self.app.client:
+            self.plan_box.delete("1.0", "end")
+            self.plan_box.insert("1.0", "Spørreplaner finnes bare på serveren")
+            return
+
+        def render(plan):
+            self.plan_box.delete("1.0", "end")
+            if not plan:
+                self.plan_box.insert("1.0", "Ingen plan (bare SELECT-spørringer forklares)")
+                return
+            depth = {0: 0}
+            lines = []
+            for node, parent, detail in plan:
+                depth[node] = depth.get(parent, 0) + 1
+                lines.append("  " * (depth[node] - 1) + detail)
+            self.plan_box.insert("1.0", "\n".join(lines))
+
+        self.worker.read(
+            explain_query, query["sql"], query.get("shape"),
+            channel="diagnostics",
+            on_done=render,
+            on_error=lambda e: self.app.show_error("Kunne ikke forklare spørringen", str(e))
+        )
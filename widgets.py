@@ -0,0 +1,477 @@
+import sys
+import tkinter
+
+import customtkinter as ctk
+
+DANGER_COLOR = "#c42b1c"
+DANGER_HOVER_COLOR = "#9f2318"
+SELECTED_COLOR = ("gray75", "gray28")
+
+
+class TableColumn:
+    def __init__(self, title: str, value, width: int = None, bold: bool = False,
+                 subtitle=None, weight: int = 0):
+        # value/subtitle are a row key or a callable taking the row dict.
+        self.title = title
+        self.value = self._accessor(value)
+        self.subtitle = self._accessor(subtitle) if subtitle is not None else None
+        self.width = width
+        self.bold = bold
+        self.weight = weight
+
+    @staticmethod
+    def _accessor(value):
+        if callable(value):
+            return value
+        return lambda row: row.get(value)
+
+
+class RowAction:
+    def __init__(self, text: str, command, width: int = 60, danger: bool = False):
+        # command is called with the row dict the button currently shows.
+        self.text = text
+        self.command = command
+        self.width = width
+        self.danger = danger
+
+
+def _display(value):
+    if value is None or value == "":
+        return "-"
+    return str(value)
+
+
+class _RowSlot:
+    def __init__(self, frame, cells, buttons):
+        self.frame = frame
+        self.cells = cells
+        self.buttons = buttons
+        self.index = None
+        self.row = None
+        self.selected = False
+        self.default_color = frame.cget("fg_color")
+
+
+# Scrollable table that only keeps widgets for the rows on screen: a fixed
+# pool of row widgets is placed over the visible window and re-bound to new
+# data while scrolling, so the widget count follows the table height rather
+# than the number of rows.
+class VirtualTable(ctk.CTkFrame):
+    def __init__(self, master, columns, actions=(), row_height: int = 36, row_gap: int = 4,
+                 show_header: bool = True, key: str = "id", on_select=None, on_activate=None,
+                 empty_text: str = "Ingen rader", row_fg_color=None, on_more=None,
+                 more_threshold: int = 20, **kwargs):
+        super().__init__(master, **kwargs)
+        self.columns = list(columns)
+        self.actions = list(actions)
+        self.row_height = row_height
+        self.row_gap = row_gap
+        self.key = key
+        self.on_select = on_select
+        self.on_activate = on_activate
+        self.row_fg_color = row_fg_color
+        # Called whenever the view comes within more_threshold rows of the
+        # end, so the owner can append the next page. It may be called again
+        # before that page arrives.
+        self.on_more = on_more
+        self.more_threshold = more_threshold
+
+        self.rows = []
+        self.selection = set()
+        # The row a Shift-click selects from: the last one clicked without Shift.
+        self._anchor = None
+        self._slots = []
+        self._offset = 0
+
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+
+        if show_header:
+            header = ctk.CTkFrame(self, fg_color="transparent", height=self.row_height)
+            header.grid(row=0, column=0, columnspan=2, sticky="ew", padx=(0, 16))
+            self._configure_grid(header)
+            for i, column in enumerate(self.columns):
+                ctk.CTkLabel(
+                    header, text=column.title, font=ctk.CTkFont(weight="bold"),
+                    width=column.width or 0, anchor="w"
+                ).grid(row=0, column=i, padx=5, pady=2, sticky="w")
+
+        self._body = ctk.CTkFrame(self, fg_color="transparent")
+        self._body.grid(row=1, column=0, sticky="nsew")
+        self._body.bind("<Configure>", self._on_body_configure)
+
+        self._scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self._scrollbar.grid(row=1, column=1, sticky="ns")
+
+        self._empty_label = ctk.CTkLabel(self._body, text=empty_text)
+        self._bind_scrolling(self._body)
+
+    @property
+    def _row_pixels(self):
+        return max(1, round(self._apply_widget_scaling(self.row_height)))
+
+    def _configure_grid(self, frame):
+        for i, column in enumerate(self.columns):
+            frame.grid_columnconfigure(i, weight=column.weight, minsize=column.width or 0)
+        frame.grid_columnconfigure(len(self.columns), weight=1)
+
+    def set_rows(self, rows):
+        self.rows = list(rows)
+        self._prune({row[self.key] for row in self.rows})
+        self._invalidate()
+        self._render()
+
+    def update_rows(self, rows):
+        # Like set_rows, but rows equal to one already shown keep the old
+        # object, so only new or changed rows cause any widget work.
+        shown = {row[self.key]: row for row in self.rows}
+        merged = []
+        for row in rows:
+            previous = shown.get(row[self.key])
+            merged.append(previous if previous == row else row)
+        self.rows = merged
+        self._prune({row[self.key] for row in merged})
+        self._render()
+
+    def _prune(self, keys):
+        # Rows that are gone leave the selection, and the owner is told.
+        if self.selection - keys:
+            self.selection &= keys
+            self._selection_changed()
+
+    def set_empty_text(self, text: str):
+        self._empty_label.configure(text=text)
+
+    def append_rows(self, rows):
+        self.rows.extend(rows)
+        self._render()
+
+    def selected_rows(self):
+        return [row for row in self.rows if row[self.key] in self.selection]
+
+    def select(self, key, add: bool = False):
+        if not add:
+            self.selection.clear()
+        self.selection.add(key)
+        self._anchor = key
+        self._render()
+        self._selection_changed()
+
+    def select_range(self, key, add: bool = False):
+        # Every row from the anchor to key, inclusive, in display order.
+        keys = [row[self.key] for row in self.rows]
+        if self._anchor not in keys:
+            self.select(key, add)
+            return
+        first, last = sorted((keys.index(self._anchor), keys.index(key)))
+        if not add:
+            self.selection.clear()
+        self.selection.update(keys[first:last + 1])
+        self._render()
+        self._selection_changed()
+
+    def clear_selection(self):
+        if self.selection:
+            self.selection.clear()
+            self._render()
+            self._selection_changed()
+
+    def _selection_changed(self):
+        if self.on_select:
+            self.on_select(self.selected_rows())
+
+    def scroll_to(self, offset: float):
+        self._offset = offset
+        self._render()
+
+    def scroll_to_index(self, index: int):
+        self.scroll_to(index * self._row_pixels)
+
+    def _invalidate(self):
+        for slot in self._slots:
+            slot.row = None
+
+    def _create_slot(self):
+        frame_kwargs = {"height": self.row_height - self.row_gap}
+        if self.row_fg_color is not None:
+            frame_kwargs["fg_color"] = self.row_fg_color
+        frame = ctk.CTkFrame(self._body, **frame_kwargs)
+        frame.grid_propagate(False)
+        frame.grid_rowconfigure(0, weight=1)
+        self._configure_grid(frame)
+
+        cells = []
+        for i, column in enumerate(self.columns):
+            cell = ctk.CTkFrame(frame, fg_color="transparent")
+            cell.grid(row=0, column=i, padx=5, sticky="w")
+            title = ctk.CTkLabel(
+                cell, text="", width=column.width or 0, anchor="w", justify="left",
+                font=ctk.CTkFont(weight="bold") if column.bold else None
+            )
+            title.pack(anchor="w")
+            subtitle = None
+            if column.subtitle is not None:
+                subtitle = ctk.CTkLabel(cell, text="", anchor="w", justify="left")
+                subtitle.pack(anchor="w")
+            cells.append((title, subtitle))
+
+        buttons = []
+        if self.actions:
+            button_frame = ctk.CTkFrame(frame, fg_color="transparent")
+            button_frame.grid(row=0, column=len(self.columns), padx=10, sticky="e")
+            for action in self.actions:
+                style = {"fg_color": DANGER_COLOR, "hover_color": DANGER_HOVER_COLOR} if action.danger else {}
+                button = ctk.CTkButton(button_frame, text=action.text, width=action.width, **style)
+                button.pack(side="left", padx=2)
+                buttons.append(button)
+
+        slot = _RowSlot(frame, cells, buttons)
+        for button, action in zip(buttons, self.actions):
+            button.configure(command=lambda slot=slot, action=action: self._invoke(slot, action))
+        self._bind_scrolling(frame)
+        self._bind_clicks(frame, slot, skip=set(buttons))
+        return slot
+
+    def _invoke(self, slot, action):
+        if slot.index is not None and slot.index < len(self.rows):
+            action.command(self.rows[slot.index])
+
+    def _bind_scrolling(self, widget):
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            tkinter.Misc.bind(widget, sequence, self._on_mousewheel, "+")
+        for child in widget.winfo_children():
+            self._bind_scrolling(child)
+
+    def _bind_clicks(self, widget, slot, skip):
+        if widget in skip:
+            return
+        tkinter.Misc.bind(widget, "<Button-1>", lambda event, slot=slot: self._on_click(event, slot), "+")
+        tkinter.Misc.bind(widget, "<Double-Button-1>", lambda event, slot=slot: self._on_double_click(slot), "+")
+        for child in widget.winfo_children():
+            self._bind_clicks(child, slot, skip)
+
+    def _on_click(self, event, slot):
+        if slot.index is None:
+            return
+        additive = bool(event.state & 0x0004)  # Control held
+        key = self.rows[slot.index][self.key]
+        if event.state & 0x0001:  # Shift held
+            self.select_range(key, add=additive)
+        elif additive and key in self.selection:
+            self.selection.discard(key)
+            self._anchor = key
+            self._render()
+            self._selection_changed()
+        else:
+            self.select(key, add=additive)
+
+    def _on_double_click(self, slot):
+        if slot.index is not None and self.on_activate:
+            self.on_activate(self.rows[slot.index])
+
+    def _on_mousewheel(self, event):
+        if event.num == 4:
+            units = -1
+        elif event.num == 5:
+            units = 1
+        elif sys.platform.startswith("win"):
+            units = -event.delta / 120
+        else:
+            units = -event.delta
+        self.scroll_to(self._offset + units * self._row_pixels)
+        return "break"
+
+    def _on_scrollbar(self, command, value, unit=None):
+        total = len(self.rows) * self._row_pixels
+        if command == "moveto":
+            self.scroll_to(float(value) * total)
+        elif unit == "pages":
+            self.scroll_to(self._offset + int(value) * self._body.winfo_height())
+        else:
+            self.scroll_to(self._offset + int(value) * self._row_pixels)
+
+    def _on_body_configure(self, event):
+        needed = event.height // self._row_pixels + 2
+        while len(self._slots) < needed:
+            self._slots.append(self._create_slot())
+        self._render()
+
+    def _bind_slot(self, slot, index):
+        row = self.rows[index]
+        selected = row[self.key] in self.selection
+        if slot.row is not row:
+            for column, (title, subtitle) in zip(self.columns, slot.cells):
+                title.configure(text=_display(column.value(row)))
+                if subtitle is not None:
+                    subtitle.configure(text=_display(column.subtitle(row)))
+            slot.row = row
+        if slot.selected != selected:
+            slot.frame.configure(fg_color=SELECTED_COLOR if selected else slot.default_color)
+            slot.selected = selected
+        slot.index = index
+
+    def _render(self):
+        row_pixels = self._row_pixels
+        height = self._body.winfo_height()
+        total = len(self.rows) * row_pixels
+        self._offset = min(max(0, self._offset), max(0, total - height))
+        first = int(self._offset // row_pixels)
+        shift = self._offset - first * row_pixels
+        gap = round(self._apply_widget_scaling(self.row_gap))
+
+        visible = []
+        for n in range(len(self._slots)):
+            index = first + n
+            y = n * row_pixels - shift
+            if index >= len(self.rows) or y >= height:
+                break
+            visible.append((index, y))
+
+        # A row that is still on screen keeps the slot already showing it, so
+        # scrolling, inserts and removals only rebind slots for rows that
+        # were not visible before.
+        showing = {id(slot.row): slot for slot in self._slots if slot.row is not None}
+        placed = {}
+        for index, _ in visible:
+            slot = showing.pop(id(self.rows[index]), None)
+            if slot is not None:
+                placed[index] = slot
+        kept = {id(slot) for slot in placed.values()}
+        spare = [slot for slot in self._slots if id(slot) not in kept]
+        spare.sort(key=lambda slot: slot.row is not None)
+
+        for index, y in visible:
+            slot = placed.get(index) or spare.pop()
+            self._bind_slot(slot, index)
+            slot.frame.place(x=0, y=y, relwidth=1, height=row_pixels - gap)
+        for slot in spare:
+            if slot.index is not None:
+                slot.frame.place_forget()
+                slot.index = None
+                slot.row = None
+
+        if self.rows:
+            self._empty_label.place_forget()
+        else:
+            self._empty_label.place(relx=0.5, y=20, anchor="n")
+
+        if self.on_more and first + len(self._slots) >= len(self.rows) - self.more_threshold:
+            self.on_more()
+
+        if total > 0:
+            self._scrollbar.set(self._offset / total, min(1.0, (self._offset + height) / total))
+        else:
+            self._scrollbar.set(0.0, 1.0)
+
+
+# Actions on the selected rows of a VirtualTable: a count, and buttons and
+# menus that are disabled while nothing is selected. Commands are called with
+# the selected rows (and a menu's chosen value).
+class SelectionBar(ctk.CTkFrame):
+    def __init__(self, master, table, **kwargs):
+        kwargs.setdefault("fg_color", "transparent")
+        super().__init__(master, **kwargs)
+        self.table = table
+        self._controls = []
+        self._forward = table.on_select
+        table.on_select = self._on_select
+
+        self.count_label = ctk.CTkLabel(self, text="", text_color="gray")
+        self.count_label.pack(side="left", padx=(0, 10))
+        self.add_button("Fjern valg", lambda rows: table.clear_selection(), width=90)
+        self._on_select(table.selected_rows())
+
+    def add_button(self, text: str, command, width: int = 110, danger: bool = False):
+        colors = {"fg_color": DANGER_COLOR, "hover_color": DANGER_HOVER_COLOR} if danger else {}
+        button = ctk.CTkButton(self, text=text, width=width,
+                               command=lambda: command(self.table.selected_rows()), **colors)
+        button.pack(side="left", padx=(0, 10))
+        self._add(button)
+        return button
+
+    def add_menu(self, text: str, values, command, width: int = 130):
+        # text stays shown; picking a value runs the command with it.
+        def picked(value):
+            menu.set(text)
+            command(self.table.selected_rows(), value)
+
+        menu = ctk.CTkOptionMenu(self, values=list(values), width=width, command=picked)
+        menu.set(text)
+        menu.pack(side="left", padx=(0, 10))
+        self._add(menu)
+        return menu
+
+    def _add(self, control):
+        self._controls.append(control)
+        control.configure(state="normal" if self.table.selection else "disabled")
+
+    def _on_select(self, rows):
+        self.count_label.configure(text=f"{len(rows)} valgt" if rows else "Ctrl/Shift-klikk for å velge flere")
+        for control in self._controls:
+            control.configure(state="normal" if rows else "disabled")
+        if self._forward:
+            self._forward(rows)
+
+
+CHART_COLOR = "#1f6aa5"
+
+
+# Bar chart drawn on a plain Tk canvas: horizontal bars with labels for
+# categories, or vertical columns for a time series. Redraws on resize.
+class BarChart(ctk.CTkFrame):
+    def __init__(self, master, title: str, horizontal: bool = True, value_format="{:,.0f}", height: int = 200,
+                 empty_text: str = "Ingen data", **kwargs):
+        super().__init__(master, **kwargs)
+        self.horizontal = horizontal
+        self.value_format = value_format
+        self.empty_text = empty_text
+        self.items = []
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+        ctk.CTkLabel(self, text=title, font=ctk.CTkFont(size=16, weight="bold")).grid(
+            row=0, column=0, padx=10, pady=(8, 0), sticky="w"
+        )
+        self._canvas = tkinter.Canvas(self, height=height, highlightthickness=0,
+                                      bg=self._apply_appearance_mode(self._fg_color))
+        self._canvas.grid(row=1, column=0, sticky="nsew", padx=10, pady=(4, 10))
+        self._canvas.bind("<Configure>", lambda event: self._draw())
+
+    def set_data(self, items):
+        # items: (label, value) pairs, drawn in the given order.
+        items = list(items)
+        if items != self.items:
+            self.items = items
+            self._draw()
+
+    def _draw(self):
+        canvas = self._canvas
+        canvas.delete("all")
+        width, height = canvas.winfo_width(), canvas.winfo_height()
+        text_color = self._apply_appearance_mode(ctk.ThemeManager.theme["CTkLabel"]["text_color"])
+        if not self.items:
+            canvas.create_text(width / 2, height / 2, text=self.empty_text, fill=text_color)
+            return
+        peak = max(value for _, value in self.items) or 1
+        if self.horizontal:
+            label_width, value_width = min(160, width // 3), 80
+            step = height / len(self.items)
+            for i, (label, value) in enumerate(self.items):
+                y = i * step
+                length = (width - label_width - value_width) * max(0, value) / peak
+                canvas.create_text(0, y + step / 2, text=str(label)[:24], anchor="w", fill=text_color)
+                canvas.create_rectangle(label_width, y + step * 0.15, label_width + length, y + step * 0.85,
+                                        fill=CHART_COLOR, width=0)
+                canvas.create_text(label_width + length + 4, y + step / 2, text=self.value_format.format(value),
+                                   anchor="w", fill=text_color)
+            return
+        axis = 18
+        step = width / len(self.items)
+        # Label every nth column so the labels do not overlap.
+        every = max(1, int(70 // step) + 1)
+        for i, (label, value) in enumerate(self.items):
+            x = i * step
+            top = (height - axis) * (1 - max(0, value) / peak)
+            canvas.create_rectangle(x + step * 0.1, top, x + step * 0.9, height - axis, fill=CHART_COLOR, width=0)
+            if i % every == 0:
+                canvas.create_text(x + step / 2, height - axis / 2, text=str(label), fill=text_color)
+        canvas.create_text(2, 2, text=self.value_format.format(peak), anchor="nw", fill=text_color)
@@ -0,0 +1,132 @@
+import queue
+import threading
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import database
+
+
+class Task:
+    def __init__(self, channel=None):
+        self.channel = channel
+        self.future = None
+        self.cancelled = False
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            if self.future is not None and not self.future.cancel() and self._conn is not None:
+                # Already running: abort the statement in flight. The result
+                # is discarded either way.
+                self._conn.interrupt()
+
+    def _run(self, func, args, kwargs, interruptible):
+        with self._lock:
+            if self.cancelled:
+                raise CancelledError()
+            if interruptible:
+                self._conn = database.connection_manager.connection()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._conn = None
+
+
+# Runs repository calls off the Tk thread. Reads go to a small thread pool,
+# writes to a single writer thread so they are applied in submission order.
+# Callbacks are delivered on the Tk thread by polling a result queue with
+# after(), since Tk must not be touched from the worker threads.
+class DatabaseWorker:
+    def __init__(self, root, readers: int = 3, poll_interval_ms: int = 15, interruptible: bool = True):
+        # interruptible=False skips opening a local connection per read, for
+        # client mode where reads go to a server.
+        self.root = root
+        self.interruptible = interruptible
+        self.poll_interval_ms = poll_interval_ms
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="db-read")
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+        self._results = queue.Queue()
+        self._messages = queue.Queue()
+        self._channels = {}
+        self._pending = 0
+        self._polling = False
+        self._closed = False
+
+    @property
+    def busy(self):
+        return self._pending > 0
+
+    def read(self, func, *args, on_done=None, on_error=None, channel=None, **kwargs):
+        return self._submit(self._readers, self.interruptible, func, args, kwargs, on_done, on_error, channel)
+
+    def write(self, func, *args, on_done=None, on_error=None, channel=None, **kwargs):
+        return self._submit(self._writer, False, func, args, kwargs, on_done, on_error, channel)
+
+    def post(self, callback, *args):
+        # Thread-safe: runs callback(*args) on the Tk thread, e.g. for progress
+        # reports from inside a running task.
+        self._messages.put((callback, args))
+
+    def cancel(self, channel):
+        task = self._channels.pop(channel, None)
+        if task is not None:
+            task.cancel()
+
+    def _submit(self, executor, interruptible, func, args, kwargs, on_done, on_error, channel):
+        if channel is not None:
+            # A newer request on the same channel supersedes the old one.
+            self.cancel(channel)
+        task = Task(channel)
+        if channel is not None:
+            self._channels[channel] = task
+        task.future = executor.submit(task._run, func, args, kwargs, interruptible)
+        task.future.add_done_callback(
+            lambda future: self._results.put((task, future, on_done, on_error))
+        )
+        self._pending += 1
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_interval_ms, self._poll)
+        return task
+
+    def _poll(self):
+        while True:
+            try:
+                callback, args = self._messages.get_nowait()
+            except queue.Empty:
+                break
+            if not self._closed:
+                callback(*args)
+        while True:
+            try:
+                task, future, on_done, on_error = self._results.get_nowait()
+            except queue.Empty:
+                break
+            self._pending -= 1
+            if task.channel is not None and self._channels.get(task.channel) is task:
+                del self._channels[task.channel]
+            if task.cancelled or future.cancelled() or self._closed:
+                continue
+            error = future.exception()
+            if error is not None:
+                if on_error is not None:
+                    on_error(error)
+                else:
+                    self.root.report_callback_exception(type(error), error, error.__traceback__)
+            elif on_done is not None:
+                on_done(future.result())
+
+        if self._pending > 0 and not self._closed:
+            self.root.after(self.poll_interval_ms, self._poll)
+        else:
+            self._polling = False
+
+    def shutdown(self):
+        self._closed = True
+        for channel in list(self._channels):
+            self.cancel(channel)
+        self._readers.shutdown(wait=False, cancel_futures=True)
+        # Let queued writes reach the database before the process exits.
+        self._writer.shutdown(wait=True)